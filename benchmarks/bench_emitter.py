@@ -0,0 +1,46 @@
+"""Compare the pure-Python, libyaml and fast_yaml emitters on the full template.
+
+Usage: python benchmarks/bench_emitter.py [--rounds 20]
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate_dns_configs as gdc
+
+
+def best_of(fn, data, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    tpl = gdc.load_template()
+    reference = gdc.dump_yaml(tpl, "pyyaml")
+    print(f"template: {len(reference)} bytes, best of {args.rounds}")
+
+    baseline = None
+    for emitter in ("pyyaml", "libyaml", "fast"):
+        if gdc.resolve_emitter(emitter) != emitter:
+            continue
+        assert gdc.dump_yaml(tpl, emitter) == reference, f"{emitter} output differs from yaml.dump"
+        elapsed = best_of(lambda d: gdc.dump_yaml(d, emitter), tpl, args.rounds)
+        baseline = baseline or elapsed
+        print(f"{emitter:<8} {elapsed * 1000:8.2f} ms  ({baseline / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Time generate_dns_configs.py with --jobs 1..N on a synthetic provider list.
+
+Usage: python benchmarks/bench_jobs.py [--providers 5000] [--max-jobs N]
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate_dns_configs as gdc
+
+
+def write_synthetic_list(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            name = f"Provider{i:05d}"
+            a, b = divmod(i, 250)
+            f.write(f"{name} | ipv4 | 10.{a % 250}.{b}.1\n")
+            f.write(f"{name} | ipv4 | 10.{a % 250}.{b}.2\n")
+            f.write(f"{name} | ipv6 | fd00::{i:x}:1\n")
+            f.write(f"{name} | doh | https://dns{i}.example.net/dns-query\n")
+            f.write(f"{name} | dot | tls://dns{i}.example.net\n")
+            f.write(f"{name} | country | Country{i % 40}\n")
+
+
+def run(jobs):
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        gdc.main(["--force", "--no-rule-check", "--no-compress", "--jobs", str(jobs)])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--providers", type=int, default=5000)
+    parser.add_argument("--max-jobs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="dns-bench-")
+    cwd = os.getcwd()
+    try:
+        shutil.copy(os.path.join(ROOT, gdc.TEMPLATE_FILE), workdir)
+        write_synthetic_list(os.path.join(workdir, gdc.INPUT_FILE), args.providers)
+        os.chdir(workdir)
+
+        print(f"{args.providers} providers, {os.cpu_count()} CPUs")
+        print(f"{'jobs':>4}  {'seconds':>8}  {'speedup':>7}")
+        baseline = None
+        for jobs in range(1, args.max_jobs + 1):
+            elapsed = run(jobs)
+            baseline = baseline or elapsed
+            print(f"{jobs:>4}  {elapsed:>8.2f}  {baseline / elapsed:>6.2f}x")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
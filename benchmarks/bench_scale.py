@@ -0,0 +1,101 @@
+"""Profile full generator runs on synthetic dns_list.txt inputs of growing size.
+
+Each size is a line count. Providers get --lines-per-provider entries each
+(a mix of ipv4, ipv6, doh and dot), so 100k lines stays at a few thousand
+output files. Every run uses `--force --profile`, and the per-stage totals
+are printed side by side. --save keeps the raw reports so two revisions can
+be compared.
+
+Usage: python benchmarks/bench_scale.py [--sizes 1000 10000 100000] [--jobs 1] [--save DIR]
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate_dns_configs as gdc
+
+STAGES = ("parse", "template", "overlays", "plan", "prerender", "nameservers", "build", "deepcopy", "render", "write",
+          "publish", "readme")
+
+
+def write_synthetic_list(path, lines, per_provider):
+    kinds = ("ipv4", "ipv6", "doh", "dot")
+    with open(path, "w", encoding="utf-8") as f:
+        for n in range(lines):
+            i, j = divmod(n, per_provider)
+            name = f"Provider{i:05d}"
+            if j == 0:
+                f.write(f"{name} | country | Country{i % 40}\n")
+                continue
+            kind = kinds[j % len(kinds)]
+            if kind == "ipv4":
+                f.write(f"{name} | ipv4 | 10.{i // 250 % 250}.{i % 250}.{j % 250}\n")
+            elif kind == "ipv6":
+                f.write(f"{name} | ipv6 | fd00::{i:x}:{j:x}\n")
+            elif kind == "doh":
+                f.write(f"{name} | doh | https://dns{i}.example.net/q{j}\n")
+            else:
+                f.write(f"{name} | dot | tls://dot{j}.dns{i}.example.net\n")
+
+
+def run(workdir, lines, args):
+    write_synthetic_list(os.path.join(workdir, gdc.INPUT_FILE), lines, args.lines_per_provider)
+    report = os.path.join(workdir, "profile.json")
+    argv = ["--force", "--no-rule-check", "--no-split", "--no-compress", "--no-fragments", "--jobs", str(args.jobs),
+            "--profile", report, "--mix-profiles", "none", "--emitter", args.emitter]
+    gdc.main(argv)
+    with open(report, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    shutil.rmtree(os.path.join(workdir, gdc.README_DIR), ignore_errors=True)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--lines-per-provider", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--emitter", default="auto", choices=gdc.EMITTERS)
+    parser.add_argument("--save", metavar="DIR", help="also write each profile report to DIR/profile-<lines>.json")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="dns-scale-")
+    cwd = os.getcwd()
+    reports = {}
+    try:
+        shutil.copy(os.path.join(ROOT, gdc.TEMPLATE_FILE), workdir)
+        os.chdir(workdir)
+        for lines in args.sizes:
+            reports[lines] = run(workdir, lines, args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for lines, data in reports.items():
+            with open(os.path.join(args.save, f"profile-{lines}.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+
+    print(f"{args.lines_per_provider} lines per provider, jobs={args.jobs}, times in ms")
+    print(f"{'stage':<12}" + "".join(f"{lines:>12}" for lines in args.sizes))
+    for stage in STAGES + ("wall",):
+        cells = []
+        for lines in args.sizes:
+            data = reports[lines]
+            seconds = data["wall_seconds"] if stage == "wall" else data["stages"].get(stage, {}).get("seconds")
+            cells.append(f"{seconds * 1000:>12.1f}" if seconds is not None else f"{'-':>12}")
+        print(f"{stage:<12}" + "".join(cells))
+    print(f"{'providers':<12}" + "".join(f"{len(reports[lines]['providers']):>12}" for lines in args.sizes))
+
+
+if __name__ == "__main__":
+    main()
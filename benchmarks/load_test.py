@@ -0,0 +1,128 @@
+"""Load-test config_server.py over keep-alive connections on localhost.
+
+Starts the server in-process on a free port (or targets --url), then has
+--connections clients request random `/{provider}/{mode}` paths for
+--duration seconds and reports requests/s and latency percentiles.
+
+Usage: python benchmarks/load_test.py [--connections 32] [--duration 10] [--gzip] [--etag]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config_server
+
+
+async def request(reader, writer, host, path, headers):
+    lines = [f"GET {path} HTTP/1.1", f"Host: {host}"] + [f"{k}: {v}" for k, v in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    etag = None
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        key = key.strip().lower()
+        if key == "content-length":
+            length = int(value)
+        elif key == "etag":
+            etag = value.strip()
+    if length:
+        await reader.readexactly(length)
+    return status, etag
+
+
+async def client(host, port, paths, deadline, args, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    etags = {}
+    try:
+        while time.perf_counter() < deadline:
+            path = random.choice(paths)
+            headers = {}
+            if args.gzip:
+                headers["Accept-Encoding"] = "gzip"
+            if args.etag and path in etags:
+                headers["If-None-Match"] = etags[path]
+            start = time.perf_counter()
+            status, etag = await request(reader, writer, host, path, headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if etag:
+                etags[path] = etag
+    finally:
+        writer.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    server = listener = None
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        server = config_server.ConfigServer(config_server.parse_args(["--emitter", args.emitter]))
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        host, port = listener.sockets[0].getsockname()[:2]
+
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET / HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+    index = (await reader.read()).split(b"\r\n\r\n", 1)[1]
+    writer.close()
+    paths = index.decode("utf-8").split()
+    if args.paths:
+        paths = paths[:args.paths]
+
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(client(host, port, paths, deadline, args, latencies, statuses)
+                           for _ in range(args.connections)))
+    elapsed = time.perf_counter() - start
+    if listener is not None:
+        listener.close()
+        await listener.wait_closed()
+
+    print(f"{len(paths)} paths, {args.connections} connections, {elapsed:.1f}s"
+          f"{', gzip' if args.gzip else ''}{', If-None-Match' if args.etag else ''}")
+    print(f"requests:   {len(latencies)} ({', '.join(f'{k}: {v}' for k, v in sorted(statuses.items()))})")
+    print(f"throughput: {len(latencies) / elapsed:.0f} req/s")
+    print(f"latency:    p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+    if server is not None:
+        print(f"cache:      {server.cache.hits} hits, {server.cache.misses} misses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="load-test an already running server instead of starting one")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--paths", type=int, help="only request the first N paths from the index")
+    parser.add_argument("--gzip", action="store_true", help="send Accept-Encoding: gzip")
+    parser.add_argument("--etag", action="store_true", help="revalidate with If-None-Match after the first fetch")
+    parser.add_argument("--emitter", default="auto", help="emitter for the in-process server")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.chdir(ROOT)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""On-demand HTTP server for generated configs.
+
+Serves `/{provider}/{mode}`, where mode is any of the generator's VARIANTS,
+straight from dns_list.txt and the template using the generator's own parse
+and render functions, so new providers are available without a commit:
+
+    python config_server.py --port 8080
+    curl -H 'Accept-Encoding: gzip' http://127.0.0.1:8080/Cloudflare/Strict
+
+`GET /` lists every available path. Rendered configs are kept in a bounded
+LRU keyed by (provider entry hash, template hash, mode); responses carry an
+ETag and honour If-None-Match, and are gzipped for clients that accept it.
+dns_list.txt, the template and the other inputs are polled for changes and
+reloaded in the background; a reload that fails keeps serving the previous
+state.
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+import urllib.parse
+from collections import OrderedDict
+
+import yaml
+
+import generate_dns_configs as gdc
+
+DEFAULT_CACHE_SIZE = 512
+RELOAD_INTERVAL = 2.0
+MAX_HEADER_LINES = 100
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+class Snapshot:
+    """Everything a request needs, loaded from disk in one go and swapped atomically."""
+
+    __slots__ = ("targets", "hashes", "renderer", "tpl_dns", "template_hash", "domestic", "latency", "fanout", "stamps")
+
+    def __init__(self, targets, renderer, tpl_dns, template_hash, domestic, latency, fanout, stamps):
+        self.targets = targets
+        # Entry hashes double as cache keys, so a reload keeps unchanged providers cached
+        self.hashes = {name: gdc.hash_entries(entries, gdc.fanout_options(fanout, name))
+                       for name, entries in targets.items()}
+        self.renderer = renderer
+        self.tpl_dns = tpl_dns
+        self.template_hash = template_hash
+        self.domestic = domestic
+        self.latency = latency
+        self.fanout = fanout
+        self.stamps = stamps
+
+class RenderCache:
+    """Least-recently-used map of rendered responses."""
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items.move_to_end(key)
+        return item
+
+    def put(self, key, item):
+        self.items[key] = item
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+class Rendered:
+    __slots__ = ("body", "etag", "_gzipped")
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self._gzipped = None
+
+    @property
+    def gzip_etag(self):
+        # A strong validator names exact bytes, so the gzipped body needs its own
+        return self.etag[:-1] + '-gz"'
+
+    @property
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped
+
+# --- loading ---------------------------------------------------------------
+
+def watched_files(args):
+    paths = [args.input, gdc.TEMPLATE_FILE, args.mix_profiles, args.fanout, args.geoip]
+    return [p for p in paths + [args.latency, args.rules] if p]
+
+def file_stamps(paths):
+    stamps = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamps[path] = None
+    return stamps
+
+def load_snapshot(args):
+    """Parse every input the way generate_dns_configs.py does."""
+    stamps = file_stamps(watched_files(args))
+    providers = gdc.parse_dns_list(args.input)
+    gdc.apply_geoip(providers, gdc.load_geoip(args.geoip))
+    tpl = gdc.load_template()
+    if not tpl:
+        raise ValueError(f"{gdc.TEMPLATE_FILE} is empty or invalid YAML")
+    if args.rules:
+        tpl = gdc.apply_rules_fragment(tpl, args.rules)
+
+    latency = gdc.load_latency_table(args.latency) if args.latency else None
+    targets = dict(providers)
+    for profile in gdc.load_mix_profiles(args.mix_profiles):
+        mix = gdc.build_mix(profile, providers, latency)
+        targets[mix.name] = mix
+    targets = {name: entries for name, entries in targets.items() if gdc.provider_entries(entries)}
+
+    domestic = gdc.build_domestic(providers, latency)
+    # Latency and the domestic resolvers change every config, just like the template
+    template_hash = gdc.hash_bytes((gdc.hash_template(*([args.rules] if args.rules else []))
+                                    + json.dumps([domestic, latency], sort_keys=True)).encode("utf-8"))
+    return Snapshot(targets, gdc.TemplateRenderer(tpl, args.emitter), tpl["dns"], template_hash,
+                    domestic, latency, gdc.load_fanout(args.fanout), stamps)
+
+def render_config(snapshot, provider, mode):
+    entries = snapshot.targets[provider]
+    all_entries, _ = gdc.nameserver_list(provider, entries, snapshot.latency, snapshot.fanout)
+    variant = gdc.VARIANTS[mode]
+    dns = variant.dns(snapshot.tpl_dns, entries, all_entries, snapshot.domestic)
+    return snapshot.renderer.render(dns, variant).encode("utf-8")
+
+def build_rendered(snapshot, provider, mode):
+    """Render and gzip one config; runs in a worker thread, off the event loop."""
+    rendered = Rendered(render_config(snapshot, provider, mode))
+    rendered.gzipped   # compress now rather than on the loop at first request
+    return rendered
+
+# --- HTTP ------------------------------------------------------------------
+
+def accepts_gzip(header):
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in header.split(",")]
+
+def response(status, body=b"", headers=None, head_only=False):
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+    headers = dict(headers or {})
+    headers.setdefault("Content-Type", "text/plain; charset=utf-8")
+    if status != 304:
+        headers["Content-Length"] = str(len(body))
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    data = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return data if head_only or status == 304 else data + body
+
+class ConfigServer:
+    def __init__(self, args):
+        self.args = args
+        args.emitter = gdc.resolve_emitter(args.emitter)
+        self.snapshot = load_snapshot(args)
+        self.cache = RenderCache(args.cache_size)
+        self.pending = {}
+        self.reloads = 0
+
+    def index(self):
+        modes = gdc.active_variants(gdc.VARIANTS, self.snapshot.domestic)
+        lines = [f"/{urllib.parse.quote(name)}/{mode}" for name in self.snapshot.targets for mode in modes]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    async def lookup(self, path):
+        """Return the Rendered config for `path`, or None if there is no such config."""
+        parts = [urllib.parse.unquote(p) for p in path.strip("/").split("/")]
+        if len(parts) != 2:
+            return None
+        provider, mode = parts
+        snapshot = self.snapshot
+        modes = gdc.active_variants(gdc.VARIANTS, snapshot.domestic)
+        mode = {m.lower(): m for m in modes}.get(mode.lower().removesuffix(".yml"))
+        if provider not in snapshot.targets or mode is None:
+            return None
+        key = (snapshot.hashes[provider], snapshot.template_hash, mode)
+        rendered = self.cache.get(key)
+        if rendered is not None:
+            return rendered
+        # Concurrent misses for one config share a single render
+        future = self.pending.get(key)
+        if future is not None:
+            return await future
+        future = self.pending[key] = asyncio.get_running_loop().run_in_executor(
+            None, build_rendered, snapshot, provider, mode)
+        try:
+            rendered = await future
+        finally:
+            del self.pending[key]
+        self.cache.put(key, rendered)
+        return rendered
+
+    async def respond(self, method, target, headers):
+        if method not in ("GET", "HEAD"):
+            return response(405, b"GET or HEAD only\n", {"Allow": "GET, HEAD"})
+        head_only = method == "HEAD"
+        path = urllib.parse.urlsplit(target).path
+        if path == "/":
+            return response(200, self.index(), head_only=head_only)
+
+        rendered = await self.lookup(path)
+        if rendered is None:
+            return response(404, b"No such config; GET / lists them\n", head_only=head_only)
+        gzipped = accepts_gzip(headers.get("accept-encoding"))
+        etag = rendered.gzip_etag if gzipped else rendered.etag
+        out = {"Content-Type": "text/yaml; charset=utf-8", "ETag": etag,
+               "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if etag_matches(headers.get("if-none-match"), etag):
+            return response(304, headers=out)
+        if gzipped:
+            out["Content-Encoding"] = "gzip"
+        return response(200, rendered.gzipped if gzipped else rendered.body, out, head_only)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    writer.write(response(400, b"Malformed request line\n", {"Connection": "close"}))
+                    break
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = header.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length:
+                    await reader.readexactly(length)   # bodies are not used, but must be consumed
+
+                writer.write(await self.respond(method, target, headers))
+                await writer.drain()
+                if version != "HTTP/1.1" or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def watch(self):
+        """Reload the inputs whenever one of them changes on disk."""
+        loop = asyncio.get_running_loop()
+        paths = watched_files(self.args)
+        while True:
+            await asyncio.sleep(self.args.reload_interval)
+            if file_stamps(paths) == self.snapshot.stamps:
+                continue
+            start = time.perf_counter()
+            try:
+                snapshot = await loop.run_in_executor(None, load_snapshot, self.args)
+            except (OSError, ValueError, KeyError, yaml.YAMLError) as e:
+                logging.warning(f"⚠️ Reload failed ({e}), still serving the previous configs")
+                # Remember the broken stamps so the same failure is not retried every tick
+                self.snapshot.stamps = file_stamps(paths)
+                continue
+            self.snapshot = snapshot
+            self.reloads += 1
+            logging.info(f"🔄 Reloaded {len(snapshot.targets)} providers in {time.perf_counter() - start:.2f}s "
+                         f"(cache {self.cache.hits} hits / {self.cache.misses} misses so far)")
+
+async def serve(args):
+    server = ConfigServer(args)
+    listener = await asyncio.start_server(server.handle, args.host, args.port)
+    host, port = listener.sockets[0].getsockname()[:2]
+    logging.info(f"🌍 Serving {len(server.snapshot.targets)} providers on http://{host}:{port}/")
+    watcher = asyncio.create_task(server.watch())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        watcher.cancel()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve generated DNS configs on demand over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--input", default=gdc.INPUT_FILE, help="provider list to serve")
+    parser.add_argument("--emitter", choices=gdc.EMITTERS, default="auto", help="YAML serializer (see generate_dns_configs.py)")
+    parser.add_argument("--latency", metavar="FILE", help="order nameservers by a latency table from dns_probe.py")
+    parser.add_argument("--mix-profiles", default=gdc.MIX_PROFILES_FILE, metavar="FILE",
+                        help="fastest-mix profiles to serve as well (default: %(default)s)")
+    parser.add_argument("--fanout", default=gdc.FANOUT_FILE, metavar="FILE",
+                        help="per-provider nameserver caps (default: %(default)s)")
+    parser.add_argument("--geoip", default=gdc.GEOIP_FILE, metavar="FILE",
+                        help="countries for providers without a `country` line (default: %(default)s)")
+    parser.add_argument("--rules", metavar="FILE", help="rule-providers/rules fragment from rule_providers.py")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, metavar="N",
+                        help="rendered configs to keep in memory (default: %(default)s)")
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL, metavar="SECONDS",
+                        help="how often to check the inputs for changes (default: %(default)s)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Compiled SQLite index of dns_list.txt.
+
+The text list is parsed once into a small SQLite database keyed by provider,
+country and transport. The index records the source's size, mtime and hash
+and is rebuilt only when the text changes, so the generator and ad-hoc
+lookups skip re-scanning the list:
+
+    python dns_index.py build
+    python dns_index.py query --country Switzerland --transport dot
+"""
+import os
+import sqlite3
+import hashlib
+import logging
+import argparse
+
+import nameservers
+import generate_dns_configs as gdc
+
+SCHEMA_VERSION = "2"
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE providers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    country TEXT,
+    line INTEGER
+);
+CREATE TABLE entries (
+    provider_id INTEGER NOT NULL REFERENCES providers(id),
+    seq INTEGER NOT NULL,
+    dtype TEXT NOT NULL,
+    transport TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE TABLE diagnostics (line INTEGER, text TEXT, reason TEXT);
+CREATE INDEX providers_country ON providers(country COLLATE NOCASE);
+CREATE INDEX entries_provider ON entries(provider_id, seq);
+CREATE INDEX entries_transport ON entries(transport);
+"""
+
+def index_path_for(source):
+    head, tail = os.path.split(source)
+    return os.path.join(head, f".{tail}.sqlite")
+
+def classify_transport(value, dtype):
+    """Transport an entry is queried over (see nameservers.parse_endpoint), or its unknown scheme."""
+    ep = nameservers.parse_endpoint(value, dtype)
+    return ep.transport if ep is not None else value.split("://", 1)[0].lower()
+
+def source_stamp(source):
+    st = os.stat(source)
+    return {"source_size": str(st.st_size), "source_mtime_ns": str(st.st_mtime_ns)}
+
+def source_hash(source):
+    with open(source, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def read_meta(conn):
+    return dict(conn.execute("SELECT key, value FROM meta"))
+
+def compile_index(source, index_path=None):
+    """Parse `source` and write a fresh index next to it; returns the index path."""
+    index_path = index_path or index_path_for(source)
+    diagnostics = []
+    providers = gdc.parse_dns_text(source, diagnostics)
+
+    tmp = index_path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        meta = {"schema": SCHEMA_VERSION, "source_hash": source_hash(source), **source_stamp(source)}
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+        for pid, entries in enumerate(providers.values(), 1):
+            conn.execute("INSERT INTO providers VALUES (?, ?, ?, ?)",
+                         (pid, entries.name, entries.country, entries.line))
+            rows = []
+            for dtype in gdc.DTYPES:
+                for value in getattr(entries, dtype):
+                    rows.append((pid, len(rows), dtype, classify_transport(value, dtype), value))
+            conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO diagnostics VALUES (?, ?, ?)",
+                         [(d.line, d.text, d.reason) for d in diagnostics])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, index_path)
+    logging.info(f"🗃️ Compiled {len(providers)} providers from {source} into {index_path}")
+    return index_path
+
+def open_index(source, index_path=None):
+    """Return a connection to an up-to-date index of `source`, rebuilding if stale."""
+    index_path = index_path or index_path_for(source)
+    if os.path.exists(index_path):
+        conn = sqlite3.connect(index_path)
+        try:
+            meta = read_meta(conn)
+        except sqlite3.DatabaseError:
+            meta = {}
+        stamp = source_stamp(source)
+        if meta.get("schema") == SCHEMA_VERSION:
+            if all(meta.get(k) == v for k, v in stamp.items()):
+                return conn
+            # Touched but possibly unchanged (e.g. fresh checkout): compare content
+            if meta.get("source_hash") == source_hash(source):
+                conn.executemany("UPDATE meta SET value = ? WHERE key = ?",
+                                 [(v, k) for k, v in stamp.items()])
+                conn.commit()
+                return conn
+        conn.close()
+    compile_index(source, index_path)
+    return sqlite3.connect(index_path)
+
+def load_providers(conn, diagnostics=None):
+    """Rebuild {name: ProviderEntries} in dns_list.txt order from an index."""
+    providers = {}
+    by_id = {}
+    for pid, name, country, line in conn.execute("SELECT id, name, country, line FROM providers ORDER BY id"):
+        entries = providers[name] = by_id[pid] = gdc.ProviderEntries(name, line)
+        entries.country = country
+    for pid, dtype, value in conn.execute("SELECT provider_id, dtype, value FROM entries ORDER BY provider_id, seq"):
+        getattr(by_id[pid], dtype).append(value)
+    if diagnostics is not None:
+        for line, text, reason in conn.execute("SELECT line, text, reason FROM diagnostics ORDER BY line"):
+            diagnostics.append(gdc.Diagnostic(line, text, reason))
+    return providers
+
+def load(source, diagnostics=None):
+    conn = open_index(source)
+    try:
+        return load_providers(conn, diagnostics)
+    finally:
+        conn.close()
+
+def query(conn, provider=None, country=None, transport=None, dtype=None):
+    """Yield (provider, country, dtype, transport, value) rows matching every given filter."""
+    sql = ("SELECT p.name, p.country, e.dtype, e.transport, e.value "
+           "FROM entries e JOIN providers p ON p.id = e.provider_id WHERE 1")
+    params = []
+    if provider:
+        sql += " AND p.name = ?"
+        params.append(provider)
+    if country:
+        sql += " AND p.country = ? COLLATE NOCASE"
+        params.append(country)
+    if transport:
+        sql += " AND e.transport = ?"
+        params.append(transport)
+    if dtype:
+        sql += " AND e.dtype = ?"
+        params.append(dtype)
+    return conn.execute(sql + " ORDER BY p.id, e.seq", params)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the compiled dns_list.txt index")
+    parser.add_argument("--input", default=gdc.INPUT_FILE, help="provider list to index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="(re)compile the index unconditionally")
+    q = sub.add_parser("query", help="list entries matching the filters")
+    q.add_argument("--provider")
+    q.add_argument("--country")
+    q.add_argument("--transport", choices=("udp", "tcp", "dot", "doh"))
+    q.add_argument("--dtype", choices=gdc.DTYPES)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "build":
+        compile_index(args.input)
+        return
+    conn = open_index(args.input)
+    try:
+        for name, country, dtype, transport, value in query(conn, args.provider, args.country, args.transport, args.dtype):
+            print(f"{name} | {country or 'N/A'} | {dtype} | {transport} | {value}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
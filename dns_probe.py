@@ -0,0 +1,364 @@
+"""Offline-friendly latency probe for the resolvers listed in dns_list.txt.
+
+Sends concurrent DNS queries over UDP, TCP, DoT and DoH to every entry and
+writes a latency table (p50/p95 and failure rate per entry) that
+generate_dns_configs.py can use to rank each provider's nameservers:
+
+    python dns_probe.py --rounds 5 --output latency.json
+    python generate_dns_configs.py --latency latency.json
+    python dns_probe.py --self-test   # probe the in-process stub resolver, up and down
+"""
+import os
+import ssl
+import math
+import json
+import time
+import struct
+import random
+import asyncio
+import logging
+import argparse
+
+import generate_dns_configs as gdc
+from nameservers import is_ip, parse_endpoint
+
+QUERY_NAME = "example.com"
+
+# --- wire format -----------------------------------------------------------
+
+def build_query(name=QUERY_NAME, qtype=1):
+    qid = random.getrandbits(16)
+    header = struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(p)]) + p.encode("idna") for p in name.rstrip(".").split(".")) + b"\0"
+    return qid, header + qname + struct.pack("!HH", qtype, 1)
+
+def check_response(qid, data):
+    """Return the RCODE of a reply to `qid`; raise ValueError if it is not one."""
+    if len(data) < 12:
+        raise ValueError("short DNS response")
+    rid, flags = struct.unpack("!HH", data[:4])
+    if rid != qid or not flags & 0x8000:
+        raise ValueError("response does not match query")
+    return flags & 0x000F
+
+class _UDPQuery(asyncio.DatagramProtocol):
+    def __init__(self, payload, future):
+        self.payload = payload
+        self.future = future
+
+    def connection_made(self, transport):
+        transport.sendto(self.payload)
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+async def query_udp(ep, payload):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _UDPQuery(payload, future), remote_addr=(ep.host, ep.port))
+    try:
+        return await future
+    finally:
+        transport.close()
+
+async def _open(ep, tls):
+    ctx = ssl.create_default_context() if tls else None
+    server_hostname = ep.host if tls and not is_ip(ep.host) else None
+    if tls and server_hostname is None:
+        # Certificates for IP-literal DoT/DoH servers rarely carry IP SANs
+        ctx.check_hostname = False
+    return await asyncio.open_connection(ep.host, ep.port, ssl=ctx, server_hostname=server_hostname)
+
+async def query_stream(ep, payload, tls):
+    reader, writer = await _open(ep, tls)
+    try:
+        writer.write(struct.pack("!H", len(payload)) + payload)
+        await writer.drain()
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+        return await reader.readexactly(length)
+    finally:
+        writer.close()
+
+async def query_doh(ep, payload):
+    reader, writer = await _open(ep, ep.tls)
+    try:
+        request = (
+            f"POST {ep.path} HTTP/1.1\r\n"
+            f"Host: {ep.host}\r\n"
+            "Content-Type: application/dns-message\r\n"
+            "Accept: application/dns-message\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("ascii")
+        writer.write(request + payload)
+        await writer.drain()
+        return await read_http_body(reader)
+    finally:
+        writer.close()
+
+async def read_http_body(reader):
+    status = await reader.readline()
+    parts = status.split()
+    if len(parts) < 2 or parts[1] != b"200":
+        raise ValueError(f"DoH status {status.strip().decode('latin-1')!r}")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                return body
+            body += await reader.readexactly(size)
+            await reader.readline()
+    return await reader.read()
+
+async def query_endpoint(ep, name=QUERY_NAME):
+    qid, payload = build_query(name)
+    if ep.transport == "udp":
+        data = await query_udp(ep, payload)
+    elif ep.transport == "tcp":
+        data = await query_stream(ep, payload, tls=False)
+    elif ep.transport == "dot":
+        data = await query_stream(ep, payload, tls=True)
+    else:
+        data = await query_doh(ep, payload)
+    return check_response(qid, data)
+
+# --- probing ---------------------------------------------------------------
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))   # nearest-rank
+    return ordered[rank - 1]
+
+def summarize(ep, samples, failures):
+    attempts = len(samples) + failures
+    p50 = percentile(samples, 50)
+    p95 = percentile(samples, 95)
+    return {
+        "transport": ep.transport,
+        "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+        "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+        "failure_rate": round(failures / attempts, 3) if attempts else 1.0,
+        "samples": attempts,
+    }
+
+async def probe_endpoints(endpoints, rounds=3, timeout=2.0, concurrency=64, name=QUERY_NAME):
+    """Query every endpoint `rounds` times with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = {ep.value: [] for ep in endpoints}
+    failures = dict.fromkeys(samples, 0)
+
+    async def one(ep):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                rcode = await asyncio.wait_for(query_endpoint(ep, name), timeout)
+            except (OSError, ValueError, EOFError, asyncio.TimeoutError, asyncio.IncompleteReadError, ssl.SSLError):
+                failures[ep.value] += 1
+                return
+            if rcode in (0, 3):   # NOERROR / NXDOMAIN both prove the resolver answered
+                samples[ep.value].append(time.perf_counter() - start)
+            else:
+                failures[ep.value] += 1
+
+    for _ in range(rounds):
+        await asyncio.gather(*(one(ep) for ep in endpoints))
+    return {ep.value: summarize(ep, samples[ep.value], failures[ep.value]) for ep in endpoints}
+
+def collect_endpoints(providers):
+    """Unique Endpoints for every server entry, in dns_list.txt order."""
+    endpoints = {}
+    for entries in providers.values():
+        for dtype in ("ipv4", "ipv6", "doh", "dot", "hostname", "fallback"):
+            for value in getattr(entries, dtype):
+                if value in endpoints:
+                    continue
+                ep = parse_endpoint(value, dtype)
+                if ep is None:
+                    logging.warning(f"⚠️ Cannot probe unsupported entry: {value}")
+                    continue
+                endpoints[value] = ep
+    return list(endpoints.values())
+
+# --- latency table ---------------------------------------------------------
+
+def save_latency_table(path, results, name=QUERY_NAME):
+    table = {"generated": int(time.time()), "query": name, "endpoints": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+# --- stub resolver ---------------------------------------------------------
+
+def stub_answer(query, rcode=0):
+    """Echo `query` back as a reply with `rcode` and no answers."""
+    qid, flags = struct.unpack("!HH", query[:4])
+    return struct.pack("!HHHHHH", qid, 0x8180 | (flags & 0x0100) | rcode, 1, 0, 0, 0) + query[12:]
+
+class _StubUDP(asyncio.DatagramProtocol):
+    def __init__(self, stub):
+        self.stub = stub
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.stub.up:
+            self.transport.sendto(stub_answer(data), addr)
+
+class StubResolver:
+    """In-process UDP, TCP and plain-HTTP DoH resolver on 127.0.0.1.
+
+    Answers every query immediately; set `up = False` to simulate an outage
+    (queries then time out). `endpoints()` returns URLs for dns_list.txt.
+    """
+
+    def __init__(self, host="127.0.0.1"):
+        self.host = host
+        self.up = True
+        self.udp_port = self.tcp_port = self.http_port = None
+        self._udp = self._tcp = self._http = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._udp, _ = await loop.create_datagram_endpoint(lambda: _StubUDP(self), local_addr=(self.host, 0))
+        self.udp_port = self._udp.get_extra_info("sockname")[1]
+        self._tcp = await asyncio.start_server(self._serve_tcp, self.host, 0)
+        self.tcp_port = self._tcp.sockets[0].getsockname()[1]
+        self._http = await asyncio.start_server(self._serve_http, self.host, 0)
+        self.http_port = self._http.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._udp.close()
+        for server in (self._tcp, self._http):
+            server.close()
+            await server.wait_closed()
+
+    def endpoints(self):
+        return [
+            f"udp://{self.host}:{self.udp_port}",
+            f"tcp://{self.host}:{self.tcp_port}",
+            f"http://{self.host}:{self.http_port}/dns-query",
+        ]
+
+    async def _serve_tcp(self, reader, writer):
+        try:
+            while True:
+                (length,) = struct.unpack("!H", await reader.readexactly(2))
+                query = await reader.readexactly(length)
+                if not self.up:
+                    continue
+                reply = stub_answer(query)
+                writer.write(struct.pack("!H", len(reply)) + reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_http(self, reader, writer):
+        try:
+            await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                if key.strip().lower() == "content-length":
+                    length = int(value)
+            query = await reader.readexactly(length)
+            if not self.up:
+                return
+            reply = stub_answer(query)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/dns-message\r\n"
+                + f"Content-Length: {len(reply)}\r\nConnection: close\r\n\r\n".encode("ascii")
+                + reply)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def self_test(rounds=3, timeout=0.3):
+    """Probe the stub over UDP, TCP and DoH while it answers, then during an outage."""
+    stub = await StubResolver().start()
+    try:
+        endpoints = [parse_endpoint(value) for value in stub.endpoints()]
+        healthy = await probe_endpoints(endpoints, rounds, timeout)
+        stub.up = False
+        outage = await probe_endpoints(endpoints, rounds, timeout)
+    finally:
+        await stub.stop()
+    problems = []
+    for ep in endpoints:
+        up, down = healthy[ep.value], outage[ep.value]
+        if up["failure_rate"] != 0.0 or up["p50_ms"] is None or up["samples"] != rounds:
+            problems.append(f"{ep.transport} {ep.value}: expected {rounds} answers while up, got {up}")
+        if down["failure_rate"] != 1.0 or down["p50_ms"] is not None:
+            problems.append(f"{ep.transport} {ep.value}: expected only failures during the outage, got {down}")
+    for problem in problems:
+        logging.error(f"❌ {problem}")
+    if problems:
+        raise SystemExit(1)
+    logging.info(f"✅ Stub answered over {', '.join(ep.transport for ep in endpoints)} and failed while down")
+
+# --- CLI -------------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure DNS latency for every entry in dns_list.txt")
+    parser.add_argument("--input", default=gdc.INPUT_FILE, help="provider list to probe")
+    parser.add_argument("--output", default=gdc.DEFAULT_LATENCY_FILE, help="latency table to write (JSON)")
+    parser.add_argument("--rounds", type=int, default=3, help="queries per endpoint")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-query timeout in seconds")
+    parser.add_argument("--concurrency", type=int, default=64, help="maximum queries in flight")
+    parser.add_argument("--name", default=QUERY_NAME, help="domain to query (A record)")
+    parser.add_argument("--provider", action="append", help="only probe this provider (repeatable)")
+    parser.add_argument("--self-test", action="store_true",
+                        help="probe the in-process stub resolver up and down instead of dns_list.txt")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.self_test:
+        asyncio.run(self_test())
+        return
+    providers = gdc.parse_dns_list(args.input)
+    if args.provider:
+        providers = {p: e for p, e in providers.items() if p in args.provider}
+    endpoints = collect_endpoints(providers)
+    logging.info(f"📡 Probing {len(endpoints)} endpoints from {len(providers)} providers "
+                 f"({args.rounds} rounds, concurrency {args.concurrency}, timeout {args.timeout}s)")
+
+    start = time.perf_counter()
+    results = asyncio.run(probe_endpoints(endpoints, args.rounds, args.timeout, args.concurrency, args.name))
+    dead = sum(1 for r in results.values() if r["failure_rate"] >= 1.0)
+    logging.info(f"⏱️ Probe finished in {time.perf_counter() - start:.1f}s, {dead} endpoints never answered")
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    save_latency_table(args.output, results, args.name)
+    logging.info(f"📄 Latency table written to {args.output}")
+
+if __name__ == "__main__":
+    main()
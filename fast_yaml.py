@@ -0,0 +1,259 @@
+"""Fast block-style YAML emitter for Clash config shapes.
+
+Produces exactly what ``yaml.dump(data, Dumper=NoAliasDumper, allow_unicode=True,
+sort_keys=False, default_flow_style=False)`` produces, for documents made of
+mappings, lists, strings, ints, bools and None. Scalar styles follow PyYAML's
+analysis (plain, then single-quoted) including its 80-column line folding.
+Anything outside that shape (floats, multi-line or control-character strings,
+complex keys) raises UnsupportedShape so callers can fall back to PyYAML.
+
+    python fast_yaml.py Generated/Files/*.yml   # round-trip + byte check
+"""
+import sys
+import random
+
+import yaml
+from yaml.resolver import Resolver
+
+BEST_WIDTH = 80
+STR_TAG = "tag:yaml.org,2002:str"
+BREAKS = "\n\x85\u2028\u2029"
+SPACE_OR_BREAK = "\0 \t\r\n\x85\u2028\u2029"
+
+class UnsupportedShape(TypeError):
+    pass
+
+_resolver = Resolver()
+_styles = {}
+
+def scalar_style(text):
+    """Return '' (plain) or "'" for a str value, mirroring PyYAML's emitter."""
+    style = _styles.get(text)
+    if style is None:
+        style = _styles[text] = _choose_style(text)
+    return style
+
+def _choose_style(text):
+    if not text:
+        # '' resolves to null, so it must be quoted
+        return "'"
+
+    block_indicators = text.startswith("---") or text.startswith("...")
+    leading_space = text[0] == " "
+    trailing_space = text[-1] == " "
+    preceded_by_whitespace = True
+    followed_by_whitespace = len(text) == 1 or text[1] in SPACE_OR_BREAK
+
+    for index, ch in enumerate(text):
+        if ch in BREAKS or not ("\x20" <= ch <= "\x7E" or _printable_unicode(ch)):
+            raise UnsupportedShape(f"needs double quoting: {text!r}")
+        if index == 0:
+            if ch in "#,[]{}&*!|>'\"%@`":
+                block_indicators = True
+            elif ch in "?:" and followed_by_whitespace:
+                block_indicators = True
+            elif ch == "-" and followed_by_whitespace:
+                block_indicators = True
+        elif ch == ":" and followed_by_whitespace:
+            block_indicators = True
+        elif ch == "#" and preceded_by_whitespace:
+            block_indicators = True
+        preceded_by_whitespace = ch in SPACE_OR_BREAK
+        followed_by_whitespace = index + 2 >= len(text) or text[index + 2] in SPACE_OR_BREAK
+
+    if (not leading_space and not trailing_space and not block_indicators
+            and _resolver.resolve(yaml.ScalarNode, text, (True, False)) == STR_TAG):
+        return ""
+    return "'"
+
+def _printable_unicode(ch):
+    return (("\xA0" <= ch <= "\uD7FF" or "\uE000" <= ch <= "\uFFFD"
+             or "\U00010000" <= ch < "\U0010ffff") and ch != "\uFEFF")
+
+class _Writer:
+    __slots__ = ("parts", "column")
+
+    def __init__(self):
+        self.parts = []
+        self.column = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.column += len(text)
+
+    def newline(self, indent):
+        self.parts.append("\n" + " " * indent)
+        self.column = indent
+
+    def scalar(self, value, indent):
+        """Write a scalar after a ': ' or '- ' indicator; `indent` is used for folding."""
+        if value is None:
+            self.write(" null")
+        elif value is True:
+            self.write(" true")
+        elif value is False:
+            self.write(" false")
+        elif type(value) is int:
+            self.write(" " + str(value))
+        elif type(value) is str:
+            if scalar_style(value) == "'":
+                self._single_quoted(value, indent)
+            else:
+                self._plain(value, indent)
+        else:
+            raise UnsupportedShape(f"unsupported scalar type {type(value).__name__}")
+
+    def _plain(self, text, indent):
+        self.write(" ")
+        if " " not in text:
+            self.write(text)
+            return
+        # Fold at single spaces once past the best width, like Emitter.write_plain
+        start = 0
+        end = 0
+        spaces = False
+        length = len(text)
+        while end <= length:
+            ch = text[end] if end < length else None
+            if spaces:
+                if ch != " ":
+                    if start + 1 == end and self.column > BEST_WIDTH:
+                        self.newline(indent)
+                    else:
+                        self.write(text[start:end])
+                    start = end
+            elif ch is None or ch == " ":
+                self.write(text[start:end])
+                start = end
+            if ch is not None:
+                spaces = ch == " "
+            end += 1
+
+    def _single_quoted(self, text, indent):
+        self.write(" '")
+        if " " not in text:
+            self.write(text.replace("'", "''"))
+            self.write("'")
+            return
+        start = 0
+        end = 0
+        spaces = False
+        length = len(text)
+        while end <= length:
+            ch = text[end] if end < length else None
+            if spaces:
+                if ch is None or ch != " ":
+                    if (start + 1 == end and self.column > BEST_WIDTH
+                            and start != 0 and end != length):
+                        self.newline(indent)
+                    else:
+                        self.write(text[start:end])
+                    start = end
+            elif ch is None or ch == " " or ch == "'":
+                if start < end:
+                    self.write(text[start:end])
+                    start = end
+            if ch == "'":
+                self.write("''")
+                start = end + 1
+            if ch is not None:
+                spaces = ch == " "
+            end += 1
+        self.write("'")
+
+def _mapping(w, data, indent, first_inline):
+    for i, (key, value) in enumerate(data.items()):
+        if i or not first_inline:
+            w.newline(indent)
+        if type(key) is str:
+            # PyYAML counts the "!!str" tag towards its 128-character simple key limit
+            if not key or len(key) + 5 >= 128:
+                raise UnsupportedShape(f"not a simple key: {key!r}")
+            style = scalar_style(key)
+            w.write(key if style == "" else "'" + key.replace("'", "''") + "'")
+        elif key is None or type(key) in (bool, int):
+            w.write("null" if key is None else str(key).lower() if type(key) is bool else str(key))
+        else:
+            raise UnsupportedShape(f"unsupported key type {type(key).__name__}")
+        w.write(":")
+        _value(w, value, indent, in_mapping=True)
+
+def _sequence(w, data, indent, first_inline):
+    for i, item in enumerate(data):
+        if i or not first_inline:
+            w.newline(indent)
+        w.write("-")
+        _value(w, item, indent, in_mapping=False)
+
+def _value(w, value, indent, in_mapping):
+    if type(value) is dict:
+        if not value:
+            w.write(" {}")
+        elif in_mapping:
+            _mapping(w, value, indent + 2, first_inline=False)
+        else:
+            w.write(" ")
+            _mapping(w, value, indent + 2, first_inline=True)
+    elif type(value) is list:
+        if not value:
+            w.write(" []")
+        elif in_mapping:
+            # PyYAML writes sequences inside mappings indentless
+            _sequence(w, value, indent, first_inline=False)
+        else:
+            w.write(" ")
+            _sequence(w, value, indent + 2, first_inline=True)
+    else:
+        w.scalar(value, indent + 2)
+
+def dump(data):
+    """Serialize `data` to a YAML string; raises UnsupportedShape if it can't."""
+    if type(data) is not dict or not data:
+        raise UnsupportedShape("document root must be a non-empty mapping")
+    w = _Writer()
+    _mapping(w, data, 0, first_inline=True)
+    w.parts.append("\n")
+    return "".join(w.parts)
+
+# --- verification ------------------------------------------------------------
+
+def pyyaml_dump(data):
+    import generate_dns_configs as gdc
+    return gdc.dump_yaml(data, "pyyaml")
+
+def random_shape(rng, depth=0):
+    """Random document in the supported shape, biased towards tricky scalars."""
+    pool = ["*.lan", "+.google.com", "2606:4700:4700::1111", "tls://1.1.1.1", "🚀 Proxy",
+            "DIRECT", "true", "no", "0x1F", "1.5", "~", "", "a: b", "- x", "#x", "x #y",
+            "it's", "geosite:category-ir", "[]", "long " * rng.randint(1, 40), "   ", "@home"]
+    if depth > 3 or rng.random() < 0.4:
+        return rng.choice([rng.choice(pool), rng.randint(-5, 70000), rng.random() < 0.5, None])
+    if rng.random() < 0.5:
+        return [random_shape(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {rng.choice(pool) or "k": random_shape(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+def verify(paths, fuzz=2000, seed=0):
+    """Check dump() against yaml.dump and yaml.safe_load; return the number of failures."""
+    failures = skipped = 0
+    docs = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            docs.append((path, yaml.safe_load(f)))
+    rng = random.Random(seed)
+    docs += [(f"fuzz#{i}", {"root": random_shape(rng)}) for i in range(fuzz)]
+
+    for name, data in docs:
+        try:
+            text = dump(data)
+        except UnsupportedShape:
+            skipped += 1
+            continue
+        if yaml.safe_load(text) != data or text != pyyaml_dump(data):
+            failures += 1
+            print(f"❌ {name}: output differs from yaml.dump")
+    print(f"{'✅' if not failures else '❌'} {len(docs)} documents checked, "
+          f"{skipped} outside the supported shape, {failures} failures")
+    return failures
+
+if __name__ == "__main__":
+    sys.exit(1 if verify(sys.argv[1:]) else 0)
@@ -1,8 +1,23 @@
 import os
+import re
 import yaml
 import logging
 import urllib.parse
 import copy
+import argparse
+import time
+import json
+import hashlib
+import functools
+import csv
+import shutil
+import sqlite3
+import gzip
+from concurrent.futures import ProcessPoolExecutor
+
+import fast_yaml
+import nameservers
+import profiling
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
 
@@ -10,10 +25,52 @@ class NoAliasDumper(yaml.Dumper):
     def ignore_aliases(self, data):
         return True
 
+# libyaml bindings are optional; without them PyYAML's pure-Python classes are used
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+if hasattr(yaml, "CDumper"):
+    class NoAliasCDumper(yaml.CDumper):
+        def ignore_aliases(self, data):
+            return True
+else:
+    NoAliasCDumper = None
+
+# Brotli is optional too; without it the .br copies of unchanged configs are kept as published
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 INPUT_FILE = "dns_list.txt"
 TEMPLATE_FILE = "DNS_for_Clash.meta_Template.yml"
 OUTPUT_DIR = "Generated/Files"
 README_DIR = "Generated"
+MANIFEST_FILE = os.path.join(README_DIR, "manifest.json")
+# Machine-readable index of every config, and the per-country README pages built from it
+CATALOG_FILE = os.path.join(README_DIR, "catalog.json")
+COUNTRY_DIR = os.path.join(README_DIR, "Countries")
+# Rendered files land here first and are renamed into OUTPUT_DIR (same filesystem)
+STAGING_DIR = os.path.join(README_DIR, ".staging")
+# `dns:`-only fragments, to be merged onto the shared base file
+FRAGMENT_DIR = os.path.join(README_DIR, "Fragments")
+BASE_FRAGMENT = "base.yml"
+COMPRESSIONS = ("gz", "br")
+
+DEFAULT_LATENCY_FILE = "latency.json"
+MIX_PROFILES_FILE = "mix_profiles.yml"
+MIX_PREFIX = "Mix_"
+FANOUT_FILE = "fanout.yml"
+GEOIP_FILE = "geoip.json"
+# Split-DNS variant: domestic domains go to the fastest resolvers from this country
+SPLIT_COUNTRY = "Iran"
+SPLIT_DOMAINS = ("geosite:category-ir", "+.ir")
+SPLIT_PROVIDERS = 4
+
+# Bump whenever rendering changes so the manifest forces a full rebuild
+GENERATOR_VERSION = "5"
+CATALOG_VERSION = 1
+# Catalog hashes are SHA-256 prefixes: plenty to tell versions apart, a third of the size
+CATALOG_HASH_CHARS = 16
 
 DEFAULT_FALLBACK = [
     "8.8.8.8", "1.1.1.1", "9.9.9.9", "94.140.14.14",
@@ -24,61 +81,524 @@ def dictator(torn):
     return list(dict.fromkeys(torn))
     #return torn
 
-def add_fallback(dns_cfg, entries):
-    fallback = entries["fallback"] if entries["fallback"] else DEFAULT_FALLBACK
-    dns_cfg["dns"]["fallback"] = dictator(fallback)
-    return dns_cfg
+def fallback_for(entries):
+    fallback = entries.fallback if entries.fallback else DEFAULT_FALLBACK
+    return dictator(fallback)
 
-def parse_dns_list():
-    providers = {}
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        for line in f:
+DTYPES = ("ipv4", "ipv6", "doh", "dot", "hostname", "fallback")
+
+class ProviderEntries:
+    """Parsed `dns_list.txt` lines for one provider."""
+
+    __slots__ = ("name", "line") + DTYPES + ("country",)
+
+    def __init__(self, name, line=None):
+        self.name = name
+        self.line = line          # first line the provider appears on
+        self.ipv4 = []
+        self.ipv6 = []
+        self.doh = []
+        self.dot = []
+        self.hostname = []
+        self.fallback = []
+        self.country = None
+
+    def as_dict(self):
+        data = {dtype: getattr(self, dtype) for dtype in DTYPES}
+        data["country"] = self.country
+        return data
+
+class Diagnostic:
+    __slots__ = ("line", "text", "reason")
+
+    def __init__(self, line, text, reason):
+        self.line = line
+        self.text = text
+        self.reason = reason
+
+    def __str__(self):
+        return f"{INPUT_FILE}:{self.line}: {self.reason}: {self.text}"
+
+def iter_dns_list(path, diagnostics=None):
+    """Yield (line_no, provider, dtype, value) for each well-formed line."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
             line = line.strip()
             if not line or line.startswith("#"):
                 continue
-            try:
-                provider, dtype, value = [x.strip() for x in line.split("|")]
-            except ValueError:
+            fields = line.split("|")
+            if len(fields) != 3:
+                if diagnostics is not None:
+                    diagnostics.append(Diagnostic(line_no, line, f"expected 3 '|' separated fields, got {len(fields)}"))
                 continue
+            provider, dtype, value = [x.strip() for x in fields]
+            yield line_no, provider, dtype, value
 
-            if provider not in providers:
-                providers[provider] = {
-                    "ipv4": [], "ipv6": [], "doh": [], "dot": [], "hostname": [],
-                    "fallback": [], "country": None
-                }
-
-            if dtype == "country":
-                providers[provider]["country"] = value
-            elif dtype == "fallback":
-                providers[provider]["fallback"].append(value)
-            elif dtype in providers[provider]:
-                providers[provider][dtype].append(value)
+def parse_dns_text(path=INPUT_FILE, diagnostics=None):
+    providers = {}
+    for line_no, provider, dtype, value in iter_dns_list(path, diagnostics):
+        entries = providers.get(provider)
+        if entries is None:
+            entries = providers[provider] = ProviderEntries(provider, line_no)
+
+        if dtype == "country":
+            entries.country = value
+        elif dtype in DTYPES:
+            getattr(entries, dtype).append(value)
+        else:
+            if diagnostics is not None:
+                diagnostics.append(Diagnostic(line_no, value, f"unknown dtype '{dtype}'"))
             else:
-                logging.warning(f"⚠️ Unknown dtype '{dtype}' in line: {line}")
+                logging.warning(f"⚠️ Unknown dtype '{dtype}' at {path}:{line_no}: {value}")
     return providers
 
+def parse_dns_list(path=INPUT_FILE, diagnostics=None, use_index=True):
+    """Providers from `path`, read through the compiled index when possible."""
+    if use_index:
+        import dns_index   # imports this module, so load it lazily
+        try:
+            return dns_index.load(path, diagnostics)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"⚠️ Cannot use the dns_list index ({e}), parsing {path} directly")
+    return parse_dns_text(path, diagnostics)
+
 def load_template():
     with open(TEMPLATE_FILE, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
-
-def save_config(provider, data, suffix):
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    out_file = os.path.join(OUTPUT_DIR, f"{provider}_{suffix}.yml")
-    print(f"Writing {out_file} with data: {data['dns']}")
-    if not data:
-        logging.warning(f"⚠️ No data to write for {provider}_{suffix}")
-    with open(out_file, "w", encoding="utf-8") as f:
-        yaml.dump(
-            data,
-            f,
-            Dumper=NoAliasDumper,
-            allow_unicode=True,
-            sort_keys=False,
-            default_flow_style=False   # <- forces each list item on its own line
-        )
+        return yaml.load(f, Loader=SafeLoader)
+
+def apply_rules_fragment(tpl, path):
+    """Swap in `rule-providers`/`rules` from a fragment written by rule_providers.py."""
+    with open(path, "r", encoding="utf-8") as f:
+        fragment = yaml.load(f, Loader=SafeLoader) or {}
+    for key in ("rule-providers", "rules"):
+        if key in fragment:
+            tpl[key] = fragment[key]
+    logging.info(f"🧬 Using {len(tpl.get('rule-providers') or {})} rule-providers from {path}")
+    return tpl
+
+EMITTERS = ("auto", "pyyaml", "libyaml", "fast")
+
+def resolve_emitter(emitter):
+    if emitter == "auto":
+        return "libyaml" if NoAliasCDumper is not None else "pyyaml"
+    if emitter == "libyaml" and NoAliasCDumper is None:
+        logging.warning("⚠️ libyaml is not available, falling back to the pure-Python dumper")
+        return "pyyaml"
+    return emitter
+
+def libyaml_compatible(data):
+    """libyaml escapes astral characters (emoji) even with allow_unicode and has a
+    different simple-key limit, so only hand it data where both match PyYAML."""
+    if type(data) is str:
+        return data.isascii() or all(ch <= "\uffff" for ch in data)
+    if type(data) is dict:
+        return all((type(k) is not str or len(k) + 5 < 128) and libyaml_compatible(k) and libyaml_compatible(v)
+                   for k, v in data.items())
+    if type(data) is list:
+        return all(libyaml_compatible(v) for v in data)
+    return True
+
+def dump_yaml(data, emitter="pyyaml"):
+    if emitter == "fast":
+        try:
+            return fast_yaml.dump(data)
+        except fast_yaml.UnsupportedShape:
+            pass   # outside the fast emitter's shape, PyYAML handles it
+    dumper = NoAliasDumper
+    if emitter == "libyaml" and NoAliasCDumper is not None and libyaml_compatible(data):
+        dumper = NoAliasCDumper
+    return yaml.dump(
+        data,
+        Dumper=dumper,
+        allow_unicode=True,
+        sort_keys=False,
+        default_flow_style=False   # <- forces each list item on its own line
+    )
+
+class TemplateRenderer:
+    """Serialize the template once and splice in a fresh `dns:` block per file.
+
+    A block-style top-level mapping dumps as the concatenation of its
+    single-key mappings, so every static section is rendered up front and
+    only `dns` is serialized per provider.
+    """
+
+    def __init__(self, tpl, emitter="pyyaml"):
+        self.tpl = tpl
+        self.emitter = emitter
+        self.sections = []
+        for key, value in tpl.items():
+            self.sections.append(None if key == "dns" else dump_yaml({key: value}, emitter))
+        self.variant_sections = {}
+
+    def sections_for(self, variant=None):
+        # Sections a variant overrides are the same for every provider: dump them once
+        if variant is None or variant.sections is None:
+            return self.sections
+        sections = self.variant_sections.get(variant.name)
+        if sections is None:
+            overrides = variant.sections(self.tpl)
+            sections = [dump_yaml({key: overrides[key]}, self.emitter) if key in overrides else text
+                        for key, text in zip(self.tpl, self.sections)]
+            self.variant_sections[variant.name] = sections
+        return sections
+
+    def render(self, dns, variant=None):
+        return self.render_parts(dns, variant)[0]
+
+    def render_parts(self, dns, variant=None):
+        """(full config, `dns:`-only fragment)"""
+        dns_text = dump_yaml({"dns": dns}, self.emitter)
+        return "".join(dns_text if s is None else s for s in self.sections_for(variant)), dns_text
+
+    def render_base(self, variant=None):
+        """Every section except `dns`; a fragment appended to it is a full config."""
+        return "".join(s for s in self.sections_for(variant) if s is not None)
+
+def render_full(tpl, dns, emitter="pyyaml", variant=None):
+    # Reference path: deep-copy and dump the whole template
+    with profiling.stage("deepcopy"):
+        cfg = copy.deepcopy(tpl)
+    if variant is not None and variant.sections is not None:
+        cfg.update(variant.sections(cfg))
+    cfg["dns"] = dns
+    return dump_yaml(cfg, emitter)
+
+def render_full_parts(tpl, dns, variant=None, emitter="pyyaml"):
+    return render_full(tpl, dns, emitter, variant), dump_yaml({"dns": dns}, emitter)
+
+def build_normal_dns(tpl_dns, entries, all_entries):
+    dns = dict(tpl_dns)
+    dns["nameserver"] = all_entries
+    dns["direct-nameserver"] = all_entries
+    dns["proxy-server-nameserver"] = all_entries
+    dns["fallback"] = fallback_for(entries)
+    return dns
+
+def build_strict_dns(tpl_dns, entries, all_entries):
+    dns = dict(tpl_dns)
+    dns["default-nameserver"] = dictator(entries.ipv4) + dictator(entries.ipv6)
+    dns["nameserver"] = all_entries
+    dns["direct-nameserver"] = all_entries
+    dns["proxy-server-nameserver"] = all_entries
+    dns["fallback"] = fallback_for(entries)
+    return dns
+
+def build_split_dns(tpl_dns, entries, all_entries, domestic):
+    dns = build_normal_dns(tpl_dns, entries, all_entries)
+    # One key per matcher: mihomo splits "geosite:a,b" into geosites only
+    dns["nameserver-policy"] = {domain: list(domestic) for domain in SPLIT_DOMAINS}
+    return dns
+
+class Variant:
+    """One config per provider: a transform of the `dns` block, plus optional
+    overrides of other template sections that are the same for every provider.
+
+    `dns(tpl_dns, entries, servers, domestic)` returns the block; `sections(tpl)`
+    returns {key: value} to replace. `needs` names run inputs the variant cannot
+    do without (currently only "domestic").
+    """
+
+    __slots__ = ("name", "dns", "sections", "needs", "description")
+
+    def __init__(self, name, dns, sections=None, needs=(), description=""):
+        self.name = name
+        self.dns = dns
+        self.sections = sections
+        self.needs = needs
+        self.description = description
+
+# Groups whose default choice the ad-handling variants switch
+AD_GROUPS = ("🛑Advertisements", "🛡️PrivacyTrackers")
+
+def ad_policy(policy):
+    """Section override making `policy` the default choice of every AD_GROUPS group."""
+    def sections(tpl):
+        groups = []
+        for group in tpl.get("proxy-groups") or []:
+            if group.get("name") in AD_GROUPS:
+                group = dict(group, proxies=dictator([policy] + list(group.get("proxies") or [])))
+            groups.append(group)
+        return {"proxy-groups": groups}
+    return sections
+
+def normal_variant(tpl_dns, entries, servers, domestic):
+    return build_normal_dns(tpl_dns, entries, servers)
+
+def strict_variant(tpl_dns, entries, servers, domestic):
+    return build_strict_dns(tpl_dns, entries, servers)
+
+VARIANTS = {v.name: v for v in (
+    Variant("Normal", normal_variant,
+            description="Replace only `nameserver` and `proxy-server-nameserver`. Suitable for general use when you want to override the main DNS without affecting other DNS settings."),
+    Variant("Strict", strict_variant,
+            description="Replace *all* DNS fields (`default-nameserver`, `nameserver`, `direct-nameserver`, `proxy-server-nameserver`). Use this when you need full control over DNS resolution, ensuring that all queries go through the specified servers and fallbacks."),
+    Variant("Split", build_split_dns, needs=("domestic",),
+            description="Like Normal, plus a `nameserver-policy` that sends " + " and ".join(f"`{d}`" for d in SPLIT_DOMAINS)
+                        + f" to the fastest {SPLIT_COUNTRY} resolvers in `dns_list.txt`, so domestic lookups skip the international round-trip."),
+    Variant("REJECT-DROP", normal_variant, sections=ad_policy("REJECT-DROP"),
+            description="Like Normal, but " + " and ".join(AD_GROUPS) + " default to `REJECT-DROP`, silently dropping ad and tracker connections."),
+    Variant("PASS", normal_variant, sections=ad_policy("PASS"),
+            description="Like Normal, but " + " and ".join(AD_GROUPS) + " default to `PASS`, so ad and tracker rules are skipped and matching continues with the next rule."),
+)}
+
+def active_variants(names, domestic=None):
+    """The requested variants that the run's inputs can produce, in registry order."""
+    return tuple(name for name in VARIANTS if name in names
+                 and ("domestic" not in VARIANTS[name].needs or domestic))
+
+def variant_of(path):
+    return VARIANTS.get(os.path.basename(path)[:-len(".yml")].rsplit("_", 1)[-1])
+
+def base_name(variant):
+    return BASE_FRAGMENT if variant.sections is None else f"base_{variant.name}.yml"
+
+def read_text(path):
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def read_bytes(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def write_durable(path, text):
+    if isinstance(text, bytes):
+        f = open(path, "wb")
+    else:
+        f = open(path, "w", encoding="utf-8", newline="")
+    with f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+def atomic_write(path, text):
+    # Skip identical content; otherwise write a sibling temp file and rename over
+    if (read_bytes(path) if isinstance(text, bytes) else read_text(path)) == text:
+        return False
+    tmp = path + ".tmp"
+    write_durable(tmp, text)
+    os.replace(tmp, path)
+    return True
+
+def select_artifacts(fragments=True, compress=True):
+    """Extra outputs written for every config: "fragment" and compression suffixes."""
+    artifacts = ("fragment",) if fragments else ()
+    if compress:
+        artifacts += COMPRESSIONS
+    return artifacts
+
+def split_artifacts(artifacts):
+    """(artifacts this run can write, compressions whose codec is not installed)."""
+    missing = tuple(kind for kind in artifacts if kind == "br" and brotli is None)
+    return tuple(kind for kind in artifacts if kind not in missing), missing
+
+def artifacts_for(path, artifacts):
+    # A fragment plus the shared base only rebuilds configs that differ in `dns` alone
+    variant = variant_of(path)
+    if variant is not None and variant.sections is not None:
+        return tuple(kind for kind in artifacts if kind != "fragment")
+    return artifacts
+
+def artifact_path(path, kind):
+    if kind == "fragment":
+        return os.path.join(FRAGMENT_DIR, os.path.basename(path))
+    return f"{path}.{kind}"
+
+def compress(data, kind):
+    if kind == "gz":
+        # mtime=0 keeps the archive byte-identical between runs
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+def staging_dir_for(out_dir):
+    return os.path.join(STAGING_DIR, os.path.relpath(out_dir, README_DIR))
+
+def stage(out_dir, name, data):
+    staging = staging_dir_for(out_dir)
+    os.makedirs(staging, exist_ok=True)
+    write_durable(os.path.join(staging, name), data)
+
+def write_config(provider, text, suffix, fragment=None, artifacts=()):
+    """Stage a config and its artifacts for publish(); unchanged files are left alone.
+
+    Returns the final path inside OUTPUT_DIR.
+    """
+    name = f"{provider}_{suffix}.yml"
+    out_file = os.path.join(OUTPUT_DIR, name)
+    changed = read_text(out_file) != text
+    if changed:
+        stage(OUTPUT_DIR, name, text)
+    data = None
+    for kind in artifacts:
+        target = artifact_path(out_file, kind)
+        if kind == "fragment":
+            if read_text(target) != fragment:
+                stage(FRAGMENT_DIR, name, fragment)
+        elif changed or not os.path.exists(target):
+            # Compressing is the slow part, so only redo it when the config changed
+            data = data or text.encode("utf-8")
+            stage(OUTPUT_DIR, os.path.basename(target), compress(data, kind))
     return out_file
 
-def generate_readme(files):
+def publish(files, artifacts=(), bases=(BASE_FRAGMENT,), keep=()):
+    """Move staged files into OUTPUT_DIR/FRAGMENT_DIR and delete files no longer generated.
+
+    Published copies of the `keep` kinds (see split_artifacts) survive as long
+    as their config is still generated and unchanged. Returns a dict of
+    added/changed/removed/unchanged counts.
+    """
+    wanted = {OUTPUT_DIR: set(), FRAGMENT_DIR: set(bases) if "fragment" in artifacts else set()}
+    for f in files:
+        wanted[OUTPUT_DIR].add(os.path.basename(f))
+        for kind in artifacts_for(f, artifacts):
+            path = artifact_path(f, kind)
+            wanted[os.path.dirname(path)].add(os.path.basename(path))
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+
+    for out_dir, names in wanted.items():
+        staging = staging_dir_for(out_dir)
+        staged = set(os.listdir(staging)) if os.path.isdir(staging) else set()
+        if not names and not os.path.isdir(out_dir):
+            continue
+        os.makedirs(out_dir, exist_ok=True)
+        for name in sorted(names):
+            if name in staged:
+                target = os.path.join(out_dir, name)
+                stats["changed" if os.path.exists(target) else "added"] += 1
+                os.replace(os.path.join(staging, name), target)
+            else:
+                stats["unchanged"] += 1
+
+        for name in sorted(os.listdir(out_dir)):
+            if not name.endswith((".yml",) + tuple(f".{c}" for c in COMPRESSIONS)) or name in names:
+                continue
+            config, kind = os.path.splitext(name)
+            if kind[1:] in keep and config in names and config not in staged:
+                continue
+            logging.info(f"🗑️ Removing orphaned file: {os.path.join(out_dir, name)}")
+            os.remove(os.path.join(out_dir, name))
+            stats["removed"] += 1
+        if not names and not os.listdir(out_dir):
+            os.rmdir(out_dir)
+
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+    return stats
+
+def raw_url(path):
+    repo = os.environ.get("GITHUB_REPOSITORY","OWNER/REPO")
+    encoded = urllib.parse.quote(path.replace(os.sep, "/"))
+    return f"https://raw.githubusercontent.com/{repo}/main/{encoded}"
+
+def raw_link(path, artifacts=()):
+    # The config itself, followed by its precompressed copies
+    links = [f"[Link]({raw_url(path)})"]
+    links += [f"[{kind}]({raw_url(artifact_path(path, kind))})" for kind in artifacts if kind in COMPRESSIONS]
+    return " · ".join(links)
+
+def fragment_links(configs):
+    links = [f"[{name}]({raw_url(config['fragment']['path'])})" for name, config in configs.items() if "fragment" in config]
+    return " · ".join(links) or "N/A"
+
+def posix_path(path):
+    return path.replace(os.sep, "/")
+
+def transports_of(entries):
+    """Transports a provider's servers use, in nameservers.TRANSPORTS order."""
+    found = set()
+    for dtype in DTYPES[:-1]:
+        for value in getattr(entries, dtype):
+            ep = nameservers.parse_endpoint(value, dtype)
+            if ep is not None:
+                found.add(ep.transport)
+    return [t for t in nameservers.TRANSPORTS if t in found] + sorted(found - set(nameservers.TRANSPORTS))
+
+def build_catalog(manifest, providers, mixes=None, located=()):
+    """Index of every generated config, built from the run's manifest and parsed providers.
+
+    Paths are relative to the repository root (prefix them with `base_url`);
+    `hash` (the start of the file's SHA-256) and `size` describe the file as
+    published, so a client can skip downloads it already has.
+    """
+    mixes = mixes or {}
+    artifacts = manifest["artifacts"]
+    variants = manifest["variants"]
+    catalog = {
+        "version": CATALOG_VERSION,
+        "base_url": raw_url(""),
+        "variants": {name: VARIANTS[name].description for name in variants},
+        "compressed": [kind for kind in artifacts if kind in COMPRESSIONS],
+        "bases": ({name: posix_path(os.path.join(FRAGMENT_DIR, base_name(VARIANTS[name]))) for name in variants}
+                  if "fragment" in artifacts else {}),
+        "providers": {},
+        "mixes": {},
+    }
+    for provider, item in manifest["providers"].items():
+        entries = mixes[provider][1] if provider in mixes else providers.get(provider)
+        if entries is None:
+            continue
+        digests = item["digests"]
+        configs = {}
+        for path in item["files"]:
+            sha256, size = digests[path]
+            config = {"path": posix_path(path), "hash": sha256[:CATALOG_HASH_CHARS], "size": size}
+            fragment = artifact_path(path, "fragment")
+            if fragment in digests:
+                sha256, size = digests[fragment]
+                config["fragment"] = {"path": posix_path(fragment), "hash": sha256[:CATALOG_HASH_CHARS], "size": size}
+            configs[variant_of(path).name] = config
+        record = {"country": entries.country, "transports": transports_of(entries),
+                  "fallback": fallback_for(entries), "configs": configs}
+        if provider in located:
+            record["country_source"] = "geoip"
+        if provider in mixes:
+            record["servers"] = provider_entries(entries)
+            record["selection"] = describe_mix(mixes[provider][0])
+            catalog["mixes"][provider] = record
+        else:
+            catalog["providers"][provider] = record
+    return catalog
+
+def write_catalog(catalog):
+    # Compact on purpose: clients poll this instead of the README
+    text = json.dumps(catalog, ensure_ascii=False, sort_keys=True, separators=(",", ":")) + "\n"
+    atomic_write(CATALOG_FILE, text)
+    if "gz" in catalog["compressed"]:
+        atomic_write(f"{CATALOG_FILE}.gz", compress(text.encode("utf-8"), "gz"))
+
+def country_page(country):
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", country).strip("_") if country else ""
+    return os.path.join(COUNTRY_DIR, f"{slug or 'Unknown'}.md")
+
+def provider_table(records, variants, fragments_col, compressed):
+    lines = [
+        "| Provider | Country | " + " | ".join(variants) + " |" + (" Fragments |" if fragments_col else "") + " Fallback DNS | Description |",
+        "|----------|---------|" + "".join("-" * (len(name) + 2) + "|" for name in variants) + ("-----------|" if fragments_col else "") + "--------------|-------------|",
+    ]
+    desc = "Basic DNS replacement / Full strict DNS replacement"
+    for provider, record in records:
+        country = record["country"] or "N/A"
+        if record.get("country_source") == "geoip":
+            country += " *(GeoIP)*"
+        configs = record["configs"]
+        links = " | ".join(raw_link(configs[name]["path"], compressed) if name in configs else "N/A" for name in variants)
+        fragments = f" {fragment_links(configs)} |" if fragments_col else ""
+        lines.append(f"| {provider} | {country} | {links} |{fragments} `{', '.join(record['fallback'])}` | {desc} |")
+    return lines
+
+def generate_readme(catalog):
+    """Write README.md with a country index, and one page per country under COUNTRY_DIR.
+
+    Everything comes from the catalog; returns the number of country pages.
+    """
+    variants = list(catalog["variants"])
+    compressed = catalog["compressed"]
+    fragments_col = bool(catalog["bases"])
     lines = [
         "# 📂 Generated DNS Configs",
         "",
@@ -117,106 +637,680 @@ def generate_readme(files):
         "- Apply normal or strict rules to control how DNS queries are resolved in different scenarios.",
         "- Ensure that sensitive DNS queries do not leak outside of the intended path.",
         "",
-        "Each provider has two versions of configuration for different use cases:",
+        "Besides the DNS variants below, each provider has two versions that change how ad and tracker groups act by default:",
         "",
         "* **`-REJECT-DROP`** → This action blocks the DNS query or network request entirely. It rejects the request and drops it silently, preventing it from reaching the destination. This is useful for filtering unwanted domains, ads, or malicious traffic.",
         "* **`-PASS`** → This action allows the DNS query or network request to continue normally. It essentially means “let this traffic pass through without interference,” using the defined DNS or proxy rules.",
         "",
         "## ℹ️ How it works",
-        "- **Normal configs** → Replace only `nameserver` and `proxy-server-nameserver`. Suitable for general use when you want to override the main DNS without affecting other DNS settings.",
-        "- **Strict configs** → Replace *all* DNS fields (`default-nameserver`, `nameserver`, `direct-nameserver`, `proxy-server-nameserver`). Use this when you need full control over DNS resolution, ensuring that all queries go through the specified servers and fallbacks.",
+    ]
+    lines += [f"- **{name} configs** → {description}" for name, description in catalog["variants"].items()]
+    lines += [
         "- **Why the difference?** Normal configs are lighter and safer for casual usage, while Strict configs enforce complete DNS replacement to avoid leaks or fallback to undesired DNS servers.",
         "- **Fallback** → If a provider defines `fallback` entries in `dns_list.txt`, those are prioritized. Otherwise, a global default fallback list is used.",
-        "- **Country** → Each provider can define its host country using a `country` entry. If none is defined, it's marked as `N/A`.",
+        f"- **Country** → Each provider can define its host country using a `country` entry. If none is defined, it's looked up offline in `{GEOIP_FILE}` (see `geoip.py`) and marked *(GeoIP)*, or marked as `N/A`.",
         "",
+    ]
+
+    if fragments_col or compressed:
+        lines += ["## 📦 Smaller downloads",
+                  "Everything except `dns:` is the same in every config, so there are lighter ways to fetch them:"]
+    if fragments_col:
+        base = os.path.join(FRAGMENT_DIR, BASE_FRAGMENT)
+        lines += [
+            f"- **Fragments** → `{FRAGMENT_DIR}/` holds only the `dns:` block of each config. Fetch the shared [{BASE_FRAGMENT}]({raw_url(base)}) once, "
+            f"then switching providers is a download of a few hundred bytes. Appending a fragment to the base gives the full config: "
+            f"`cat {BASE_FRAGMENT} Cloudflare_Normal.yml > config.yaml` (or use your client's merge/override profile).",
+        ]
+        own_base = {name: path for name, path in catalog["bases"].items() if os.path.basename(path) != BASE_FRAGMENT}
+        if own_base:
+            links = ", ".join(f"[{os.path.basename(path)}]({raw_url(path)})" for path in own_base.values())
+            lines.append(f"  {', '.join(own_base)} change more than `dns:`, so they have their own bases instead of fragments ({links}); "
+                         "any fragment can be appended to them.")
+    if compressed:
+        suffixes = " and ".join(f"`.{kind}`" for kind in compressed)
+        lines += [
+            f"- **Compressed** → Every config in `{OUTPUT_DIR}/` has precompressed {suffixes} copies next to it, linked beside each config below. "
+            "They are served as plain files, so decompress them after download (e.g. `curl -sL <url>.gz | gunzip > config.yaml`).",
+        ]
+    catalog_link = f"[{os.path.basename(CATALOG_FILE)}]({raw_url(CATALOG_FILE)})"
+    if "gz" in compressed:
+        catalog_link += f" ([gz]({raw_url(CATALOG_FILE + '.gz')}))"
+    lines += [
+        f"- **Catalog** → {catalog_link} lists every provider with its country, transports, fallback servers and configs, "
+        f"each with its path, size and the first {CATALOG_HASH_CHARS} hex digits of its SHA-256. Tools can fetch this small index instead of this page, and skip configs whose hash they already have.",
+        "",
+    ]
+
+    by_country = {}
+    for provider, record in catalog["providers"].items():
+        by_country.setdefault(record["country"] or "", []).append((provider, record))
+    lines += [
         "## 📜 Available Configs",
-        "Below is a list of all providers with their generated configs:",
+        "Providers are listed on one page per country:",
         "",
-        "| Provider | Country | Normal | Strict | Fallback DNS | Description |",
-        "|----------|---------|--------|--------|--------------|-------------|",
+        "| Country | Providers |",
+        "|---------|-----------|",
     ]
+    pages = {}
+    for country in sorted(by_country, key=lambda c: (not c, c.lower())):
+        records = by_country[country]
+        path = country_page(country)
+        lines.append(f"| [{country or 'N/A'}]({posix_path(os.path.relpath(path, README_DIR))}) | {len(records)} |")
+        page = [
+            f"# 🌐 {country or 'Unknown country'} DNS Configs",
+            "",
+            "[← All countries](../README.md)",
+            "",
+        ] + provider_table(records, variants, fragments_col, compressed)
+        page.append("\n---\n✅ Generated automatically. Do not edit manually.")
+        pages[path] = "\n".join(page)
 
-    # build a map of provider -> fallback list from dns_list.txt
-    providers = parse_dns_list()
+    if catalog["mixes"]:
+        lines += [
+            "",
+            "## ⚡ Fastest-mix Profiles",
+            f"Synthesized from the fastest servers across several providers, as configured in `{MIX_PROFILES_FILE}`:",
+            "",
+            "| Profile | Country | " + " | ".join(variants) + " |" + (" Fragments |" if fragments_col else "") + " Servers | Selection |",
+            "|---------|---------|" + "".join("-" * (len(v) + 2) + "|" for v in variants) + ("-----------|" if fragments_col else "") + "---------|-----------|",
+        ]
+        for name, record in catalog["mixes"].items():
+            configs = record["configs"]
+            links = " | ".join(raw_link(configs[v]["path"], compressed) if v in configs else "N/A" for v in variants)
+            fragments = f" {fragment_links(configs)} |" if fragments_col else ""
+            lines.append(f"| {name} | {record['country']} | {links} |{fragments} `{', '.join(record['servers'])}` | {record['selection']} |")
 
-    # group files by provider
-    grouped = {}
-    for f in files:
-        name = os.path.basename(f)
-        provider, t = name.replace(".yml","").rsplit("_",1)
-        grouped.setdefault(provider, {})[t] = f
+    lines.append("\n---\n✅ Generated automatically. Do not edit manually.")
+    atomic_write(os.path.join(README_DIR,"README.md"), "\n".join(lines))
 
-    for provider, types in grouped.items():
-        country = providers.get(provider, {}).get("country", "N/A")
-        fallback_list = providers.get(provider, {}).get("fallback", [])
-        if not fallback_list:
-            fallback_list = DEFAULT_FALLBACK
-        # Deduplicate while preserving order
-        fallback_list = dictator(fallback_list)
-        fallback_str = ", ".join(fallback_list)
+    os.makedirs(COUNTRY_DIR, exist_ok=True)
+    for path, text in pages.items():
+        atomic_write(path, text)
+    for name in sorted(os.listdir(COUNTRY_DIR)):
+        path = os.path.join(COUNTRY_DIR, name)
+        if name.endswith(".md") and path not in pages:
+            logging.info(f"🗑️ Removing orphaned page: {path}")
+            os.remove(path)
+    return len(pages)
 
-        normal_url = strict_url = "N/A"
-        desc = "Basic DNS replacement / Full strict DNS replacement"
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
 
-        repo = os.environ.get("GITHUB_REPOSITORY","OWNER/REPO")
+def text_digest(text):
+    data = text.encode("utf-8")
+    return [hash_bytes(data), len(data)]
 
-        if "Normal" in types:
-            normal_name = os.path.basename(types["Normal"])
-            normal_encoded = urllib.parse.quote(normal_name)
-            normal_url = f"[Link](https://raw.githubusercontent.com/{repo}/main/{OUTPUT_DIR}/{normal_encoded})"
+def hash_entries(entries, *extra):
+    data = [entries.as_dict(), *extra] if extra else entries.as_dict()
+    return hash_bytes(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8"))
 
-        if "Strict" in types:
-            strict_name = os.path.basename(types["Strict"])
-            strict_encoded = urllib.parse.quote(strict_name)
-            strict_url = f"[Link](https://raw.githubusercontent.com/{repo}/main/{OUTPUT_DIR}/{strict_encoded})"
+def hash_template(*extra):
+    # The template plus any files overlaid onto it
+    data = b""
+    for path in (TEMPLATE_FILE,) + extra:
+        with open(path, "rb") as f:
+            data += f.read()
+    return hash_bytes(data)
 
-        lines.append(f"| {provider} | {country} | {normal_url} | {strict_url} | `{fallback_str}` | {desc} |")
+def load_manifest():
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    lines.append("\n---\n✅ Generated automatically. Do not edit manually.")
-    with open(os.path.join(README_DIR,"README.md"), "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+def save_manifest(manifest):
+    os.makedirs(README_DIR, exist_ok=True)
+    atomic_write(MANIFEST_FILE, json.dumps(manifest, indent=2, ensure_ascii=False, sort_keys=True) + "\n")
 
-def main():
-    logging.info("🚀 Starting DNS config generation...")
-    providers = parse_dns_list()
-    logging.info(f"📑 Found {len(providers)} providers in dns_list.txt")
+def is_up_to_date(previous, entry_hash, artifacts=()):
+    # A provider is skipped only if its inputs match and its outputs still exist
+    if not previous or previous.get("hash") != entry_hash or "digests" not in previous:
+        return False
+    return all(os.path.exists(path) for f in previous.get("files", [])
+               for path in [f] + [artifact_path(f, kind) for kind in artifacts_for(f, artifacts)])
+
+def load_latency_table(path):
+    """Return {entry: stats} from a JSON table written by dns_probe.py, or a CSV
+    with `entry,p50_ms,failure_rate` columns."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if not path.lower().endswith(".csv"):
+            return json.load(f)["endpoints"]
+        table = {}
+        for row in csv.DictReader(f):
+            p50 = row.get("p50_ms")
+            table[row["entry"]] = {
+                "p50_ms": float(p50) if p50 not in (None, "") else None,
+                "failure_rate": float(row.get("failure_rate") or 0.0),
+            }
+        return table
+
+def latency_key(table, value):
+    stats = table.get(value)
+    if stats is None:
+        return (1, 0.0)
+    if stats.get("p50_ms") is None or stats.get("failure_rate", 1.0) >= 1.0:
+        return (2, 0.0)
+    return (0, stats["p50_ms"])
+
+def rank_by_latency(values, table):
+    # Stable sort, fastest first; unmeasured and then dead entries go last
+    return sorted(values, key=lambda v: latency_key(table, v))
+
+def load_mix_profiles(path=MIX_PROFILES_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        profiles = yaml.load(f, Loader=SafeLoader) or []
+    for profile in profiles:
+        unknown = set(profile.get("pick", {})) - set(DTYPES[:-1])
+        if unknown:
+            raise ValueError(f"{path}: profile {profile.get('name')!r} picks unknown types {sorted(unknown)}")
+    return profiles
+
+def is_dead(table, value):
+    stats = table.get(value)
+    return stats is not None and (stats.get("p50_ms") is None or stats.get("failure_rate", 1.0) >= 1.0)
+
+def build_mix(profile, providers, latency=None):
+    """Synthesize a ProviderEntries from the fastest servers across matching providers."""
+    country = profile.get("country")
+    mix = ProviderEntries(MIX_PREFIX + profile["name"])
+    mix.country = country or "Global"
+    for dtype, count in profile.get("pick", {}).items():
+        candidates = []
+        for entries in providers.values():
+            if country and (entries.country or "").lower() != country.lower():
+                continue
+            candidates.extend(getattr(entries, dtype))
+        candidates = dictator(candidates)
+        if latency:
+            candidates = [v for v in rank_by_latency(candidates, latency) if not is_dead(latency, v)]
+        getattr(mix, dtype).extend(candidates[:count])
+    return mix
+
+def describe_mix(profile):
+    picks = " + ".join(f"{count} {dtype}" for dtype, count in profile.get("pick", {}).items())
+    return f"Fastest {picks} from {profile.get('country') or 'all countries'}"
+
+def build_domestic(providers, latency=None):
+    """Best server of each of the SPLIT_PROVIDERS fastest SPLIT_COUNTRY providers."""
+    heads = []
+    for entries in providers.values():
+        if (entries.country or "").lower() != SPLIT_COUNTRY.lower():
+            continue
+        candidates = dictator(entries.ipv4 + entries.doh)
+        if latency:
+            candidates = [v for v in rank_by_latency(candidates, latency) if not is_dead(latency, v)]
+        if candidates:
+            heads.append(candidates[0])
+    heads = dictator(heads)
+    if latency:
+        heads = rank_by_latency(heads, latency)
+    return heads[:SPLIT_PROVIDERS]
+
+def provider_entries(entries):
+    return dictator(entries.ipv4) + dictator(entries.ipv6) + dictator(entries.doh) + dictator(entries.dot) + dictator(entries.hostname)
+
+def load_fanout(path=FANOUT_FILE):
+    """Per-provider nameserver caps: {"default": {...}, "providers": {name: {...}}}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        fanout = yaml.load(f, Loader=SafeLoader) or {}
+    for name, opts in [("default", fanout.get("default") or {})] + list((fanout.get("providers") or {}).items()):
+        unknown = set(opts.get("order") or ()) - set(nameservers.TRANSPORTS)
+        if unknown:
+            raise ValueError(f"{path}: {name} orders unknown transports {sorted(unknown)}")
+    return fanout
+
+def load_geoip(path=GEOIP_FILE):
+    """Per-provider country/ASN summary written by geoip.py, or {} without one."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("providers") or {}
+
+def apply_geoip(providers, geoip):
+    """Give providers without a `country` line the one geoip.py found; returns their names."""
+    filled = set()
+    for name, entries in providers.items():
+        country = (geoip.get(name) or {}).get("country")
+        if not entries.country and country:
+            entries.country = country
+            filled.add(name)
+    return filled
+
+def load_health(path):
+    """Endpoints a health file from health_monitor.py currently marks down."""
+    return {value for value, stats in load_latency_table(path).items() if stats.get("state") == "down"}
+
+def drop_dead(values, dead):
+    # A list with nothing left alive keeps its servers; an empty one is worse
+    kept = [v for v in values if v not in dead]
+    return kept or values
+
+def apply_health(providers, dead):
+    """Remove down endpoints from every provider that has live ones left; returns their names."""
+    changed = set()
+    for name, entries in providers.items():
+        servers = [v for dtype in DTYPES for v in getattr(entries, dtype)]
+        if not any(v in dead for v in servers) or all(v in dead for v in servers):
+            continue
+        for dtype in DTYPES:
+            setattr(entries, dtype, [v for v in getattr(entries, dtype) if v not in dead])
+        changed.add(name)
+    return changed
+
+def fanout_options(fanout, provider):
+    opts = dict((fanout or {}).get("default") or {})
+    opts.update(((fanout or {}).get("providers") or {}).get(provider) or {})
+    return opts.get("max"), tuple(opts.get("order") or nameservers.TRANSPORTS), opts.get("per_host")
+
+def nameserver_list(provider, entries, latency=None, fanout=None):
+    """(values, bootstrap hosts) for a provider, deduplicated across types and capped."""
+    pairs = [(dtype, value) for dtype in DTYPES[:-1] for value in getattr(entries, dtype)]
+    if latency:
+        pairs.sort(key=lambda pair: latency_key(latency, pair[1]))
+    limit, order, per_host = fanout_options(fanout, provider)
+    return nameservers.normalize(pairs, limit, order, per_host)
+
+def write_bases(tpl, variants, emitter="pyyaml"):
+    """Stage the base file every fragment is appended to, one per set of section overrides."""
+    renderer = TemplateRenderer(tpl, emitter)
+    written = set()
+    for name in variants:
+        variant = VARIANTS[name]
+        base = base_name(variant)
+        if base in written:
+            continue
+        written.add(base)
+        text = (f"# Shared base for the `dns:` fragments in {FRAGMENT_DIR}; append one to get a full config:\n"
+                f"#   cat {base} <provider>_<variant>.yml > config.yaml\n"
+                + renderer.render_base(variant))
+        if read_text(os.path.join(FRAGMENT_DIR, base)) != text:
+            stage(FRAGMENT_DIR, base, text)
+
+def make_render(tpl, full_render=False, emitter="pyyaml"):
+    """A callable mapping a `dns` block to (full config, fragment)."""
+    if full_render:
+        return functools.partial(render_full_parts, tpl, emitter=emitter)
+    return TemplateRenderer(tpl, emitter).render_parts
+
+def log_dns(provider, suffix, dns):
+    # Formatting the whole block is costly, so only do it when it will be shown
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"📝 Writing {provider}_{suffix}.yml with data: {dns}")
+
+def emit_config(render, provider, variant, dns, artifacts=()):
+    log_dns(provider, variant.name, dns)
+    with profiling.stage("render", provider):
+        text, fragment = render(dns, variant)
+    if variant.sections is not None:
+        artifacts = tuple(kind for kind in artifacts if kind != "fragment")
+    with profiling.stage("write", provider):
+        path = write_config(provider, text, variant.name, fragment, artifacts)
+        # Hashed while the text is at hand, so the catalog never re-reads a config
+        digests = {path: text_digest(text)}
+        if "fragment" in artifacts:
+            digests[artifact_path(path, "fragment")] = text_digest(fragment)
+    logging.info(f"✅ {variant.name} config saved: {path}")
+    return path, digests
+
+def generate_provider(render, tpl_dns, provider, entries, latency=None, domestic=None, fanout=None, artifacts=(),
+                      variants=("Normal", "Strict")):
+    with profiling.stage("nameservers", provider):
+        all_entries, _ = nameserver_list(provider, entries, latency, fanout)
+
+    # Variants that build the same block share it; only the render differs
+    built = {}
+    with profiling.stage("build", provider):
+        for name in variants:
+            build = VARIANTS[name].dns
+            if build not in built:
+                built[build] = build(tpl_dns, entries, all_entries, domestic)
 
     files = []
+    digests = {}
+    for name in variants:
+        path, digest = emit_config(render, provider, VARIANTS[name], built[VARIANTS[name].dns], artifacts)
+        files.append(path)
+        digests.update(digest)
+    return files, digests
+
+# Per-process state for --jobs; the template is shipped once via the pool initializer
+_worker = {}
+
+def init_worker(tpl, full_render, emitter, latency, domestic, fanout, artifacts, variants, profile):
+    if profile:
+        profiling.enable()
+    with profiling.stage("prerender"):
+        _worker["render"] = make_render(tpl, full_render, emitter)
+    _worker["tpl_dns"] = tpl["dns"]
+    _worker["latency"] = latency
+    _worker["domestic"] = domestic
+    _worker["fanout"] = fanout
+    _worker["artifacts"] = artifacts
+    _worker["variants"] = variants
+
+def generate_in_worker(job):
+    provider, entries = job
+    result = generate_provider(_worker["render"], _worker["tpl_dns"], provider, entries,
+                              _worker["latency"], _worker["domestic"], _worker["fanout"], _worker["artifacts"],
+                              _worker["variants"])
+    # Timings recorded in this process since the last job travel back with the result
+    return result, profiling.take()
+
+def generate_all(jobs, tpl, full_render=False, workers=1, latency=None, emitter="pyyaml", domestic=None, fanout=None,
+                 artifacts=(), variants=("Normal", "Strict")):
+    """Render (provider, entries) jobs; returns their (files, digests) in job order."""
+    if workers <= 1 or len(jobs) < 2:
+        with profiling.stage("prerender"):
+            render = make_render(tpl, full_render, emitter)
+        return [generate_provider(render, tpl["dns"], provider, entries, latency, domestic, fanout, artifacts, variants)
+                for provider, entries in jobs]
+
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    chunksize = max(1, len(jobs) // (workers * 4))
+    profiler = profiling.active()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(tpl, full_render, emitter, latency, domestic, fanout, artifacts, variants,
+                                       profiler is not None)) as pool:
+        for result, timings in pool.map(generate_in_worker, jobs, chunksize=chunksize):
+            if timings is not None:
+                profiler.merge(timings)
+            results.append(result)
+    return results
+
+def compare_render(providers, tpl):
+    # Render every provider and variant through each path, check the bytes match and time them
+    jobs = []
+    domestic = build_domestic(providers)
     for provider, entries in providers.items():
-        logging.info(f"⚙️ Generating configs for provider: {provider}")
+        all_entries, _ = nameserver_list(provider, entries)
+        if all_entries:
+            for name in active_variants(VARIANTS, domestic):
+                variant = VARIANTS[name]
+                jobs.append((variant.dns(tpl["dns"], entries, all_entries, domestic), variant))
+
+    paths = [("Full render", lambda dns, variant: render_full(tpl, dns, variant=variant))]
+    for emitter in ("pyyaml", "libyaml", "fast"):
+        if emitter == "libyaml" and NoAliasCDumper is None:
+            logging.warning("⚠️ libyaml is not available, skipping the CDumper path")
+            continue
+        paths.append((f"Splice + {emitter}", TemplateRenderer(tpl, emitter).render))
+
+    reference = None
+    reference_time = None
+    mismatches = 0
+    for label, render in paths:
+        start = time.perf_counter()
+        output = [render(dns, variant) for dns, variant in jobs]
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference, reference_time = output, elapsed
+        else:
+            mismatches += sum(1 for a, b in zip(reference, output) if a != b)
+        logging.info(f"⏱️ {label:<18} {elapsed:.3f}s for {len(jobs)} files ({reference_time / max(elapsed, 1e-9):.1f}x)")
+
+    if mismatches:
+        logging.error(f"❌ {mismatches} files differ between render paths!")
+        return False
+    logging.info("✅ All render paths produce byte-identical output")
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Clash.Meta DNS configs from dns_list.txt")
+    parser.add_argument("--full-render", action="store_true",
+                        help="deep-copy and dump the whole template per file (slow reference path)")
+    parser.add_argument("--emitter", choices=EMITTERS, default="auto",
+                        help="YAML serializer: pure PyYAML, libyaml's CDumper, or the specialized fast_yaml "
+                             "emitter; auto picks libyaml when installed (default: %(default)s)")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="render providers in N worker processes (0 = one per CPU)")
+    parser.add_argument("--latency", metavar="FILE",
+                        help=f"order each provider's nameservers by a latency table from dns_probe.py (e.g. {DEFAULT_LATENCY_FILE})")
+    parser.add_argument("--mix-profiles", default=MIX_PROFILES_FILE, metavar="FILE",
+                        help="cross-provider fastest-mix profiles to synthesize (default: %(default)s)")
+    parser.add_argument("--fanout", default=FANOUT_FILE, metavar="FILE",
+                        help="per-provider nameserver caps and transport preference (default: %(default)s)")
+    parser.add_argument("--geoip", default=GEOIP_FILE, metavar="FILE",
+                        help="countries for providers without a `country` line, from geoip.py (default: %(default)s)")
+    parser.add_argument("--health", metavar="FILE",
+                        help="leave out endpoints a health_monitor.py file marks down, in provider and root configs")
+    parser.add_argument("--max-nameservers", type=int, metavar="N",
+                        help="cap every config at N nameservers unless the fanout file sets a provider's own cap")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS), metavar="NAME",
+                        help=f"variants to write for every provider: {', '.join(VARIANTS)} (default: all)")
+    parser.add_argument("--no-split", action="store_true",
+                        help=f"skip the split-DNS variant that resolves {SPLIT_COUNTRY} domains domestically")
+    parser.add_argument("--no-fragments", action="store_true",
+                        help=f"skip the `dns:`-only fragments and shared base file in {FRAGMENT_DIR}")
+    parser.add_argument("--no-compress", action="store_true",
+                        help="skip the precompressed .gz/.br copies of each config")
+    parser.add_argument("--rules", metavar="FILE",
+                        help="replace the template's rule-providers/rules with a consolidated fragment from rule_providers.py")
+    parser.add_argument("--no-rule-check", action="store_true",
+                        help="skip the rule shadowing check (see rule_lint.py)")
+    parser.add_argument("--no-overlays", action="store_true",
+                        help="skip regenerating the root DNS_*.yml configs from overlays/ (see overlays.py)")
+    parser.add_argument("--check-overlays", action="store_true",
+                        help="exit 1 if a root config no longer matches its overlay, without writing anything")
+    parser.add_argument("--no-index", action="store_true",
+                        help="parse dns_list.txt directly instead of through its compiled SQLite index")
+    parser.add_argument("--force", action="store_true",
+                        help="ignore the manifest and rebuild every provider")
+    parser.add_argument("--profile", nargs="?", const="profile.json", metavar="FILE",
+                        help="record per-stage and per-provider timings to a JSON report (default: %(const)s)")
+    parser.add_argument("--pstats", metavar="FILE",
+                        help="also run under cProfile and dump pstats to FILE (main process only)")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="log every config's dns block as it is written")
+    parser.add_argument("--watch", action="store_true",
+                        help="stay running and rebuild on every input change, re-rendering only edited providers "
+                             "(full rebuilds use every CPU unless --jobs is set; see watch.py)")
+    parser.add_argument("--debounce", type=int, default=50, metavar="MS",
+                        help="with --watch, wait for MS quiet milliseconds before rebuilding (default: %(default)s)")
+    parser.add_argument("--poll", action="store_true",
+                        help="with --watch, poll file stamps instead of using inotify")
+    parser.add_argument("--compare-render", action="store_true",
+                        help="time the full and splice render paths and check they match, then exit")
+    return parser.parse_args(argv)
+
+def generate(args):
+    logging.info("🚀 Starting DNS config generation...")
+    args.emitter = resolve_emitter(args.emitter)
+    logging.info(f"🧩 YAML backend: loader={SafeLoader.__name__}, emitter={args.emitter}")
+    diagnostics = []
+    with profiling.stage("parse"):
+        providers = parse_dns_list(INPUT_FILE, diagnostics, use_index=not args.no_index)
+    logging.info(f"📑 Found {len(providers)} providers in dns_list.txt")
+    for diag in diagnostics:
+        logging.warning(f"⚠️ Skipped {diag}")
+    located = apply_geoip(providers, load_geoip(args.geoip))
+    if located:
+        logging.info(f"🌍 {len(located)} providers without a country line located through {args.geoip}")
+    dead = load_health(args.health) if args.health else set()
+    if dead:
+        trimmed = apply_health(providers, dead)
+        logging.info(f"🩺 {len(dead)} endpoints are down per {args.health}; left out of {len(trimmed)} providers")
+
+    import rule_base   # imports this module, so load it lazily
+    with profiling.stage("template"):
+        rule_base.ensure_compiled()
         tpl = load_template()
-        if not tpl:
-            logging.error("❌ Template file is empty or invalid YAML!")
-            return
+    if not tpl:
+        logging.error("❌ Template file is empty or invalid YAML!")
+        return
+
+    # Root configs follow the checked-in template, not a --rules fragment; check modes write nothing
+    if args.check_overlays or not (args.no_overlays or args.compare_render):
+        import overlays   # imports this module, so load it lazily
+        with profiling.stage("overlays"):
+            if args.check_overlays:
+                if overlays.check(tpl, args.emitter):
+                    raise SystemExit(1)
+                logging.info("✅ Root configs match their overlays")
+                return
+            outputs, changed = overlays.write_all(tpl, args.emitter, dead=dead)
+        logging.info(f"🧩 {len(outputs)} root configs from {overlays.OVERLAY_DIR}/, {len(changed)} changed")
+
+    if args.rules:
+        tpl = apply_rules_fragment(tpl, args.rules)
 
-        all_entries = dictator(entries["ipv4"]) + dictator(entries["ipv6"]) + dictator(entries["doh"]) + dictator(entries["dot"]) + dictator(entries["hostname"])
-        if not all_entries:
+    if not args.no_rule_check:
+        import rule_lint   # imports this module, so load it lazily
+        with profiling.stage("rule-check"):
+            fresh = rule_lint.check(tpl)
+        if fresh:
+            logging.error(f"❌ Newly shadowed rules in {args.rules or TEMPLATE_FILE}; fix them or "
+                          f"accept them with `python rule_lint.py --update-baseline`")
+            raise SystemExit(1)
+
+    if args.compare_render:
+        if not compare_render(providers, tpl):
+            raise SystemExit(1)
+        return
+
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    latency = None
+    latency_hash = None
+    if args.latency:
+        latency = load_latency_table(args.latency)
+        latency_hash = hash_bytes(json.dumps(latency, sort_keys=True).encode("utf-8"))
+        logging.info(f"⏱️ Ranking nameservers by {len(latency)} latency measurements from {args.latency}")
+
+    mixes = {}
+    for profile in load_mix_profiles(args.mix_profiles):
+        mix = build_mix(profile, providers, latency)
+        mixes[mix.name] = (profile, mix)
+    if mixes and latency is None:
+        logging.warning("⚠️ No --latency table given; fastest-mix profiles use dns_list.txt order")
+
+    domestic = [] if args.no_split or "Split" not in args.variants else build_domestic(providers, latency)
+    if domestic:
+        logging.info(f"🔀 Split-DNS variant sends {', '.join(SPLIT_DOMAINS)} to {len(domestic)} {SPLIT_COUNTRY} resolvers")
+    elif not args.no_split:
+        logging.warning(f"⚠️ No {SPLIT_COUNTRY} providers with usable servers; skipping the split-DNS variant")
+
+    fanout = load_fanout(args.fanout)
+    if args.max_nameservers:
+        fanout.setdefault("default", {})["max"] = args.max_nameservers
+
+    variants = active_variants(args.variants, domestic)
+    logging.info(f"🧮 Variants: {', '.join(variants)}")
+
+    # The manifest records the full artifact set, so a run without a codec reuses it as-is
+    artifacts = select_artifacts(not args.no_fragments, not args.no_compress)
+    writable, missing = split_artifacts(artifacts)
+    if missing:
+        logging.warning("⚠️ brotli is not installed: keeping the published .br copies of unchanged configs, "
+                        "changed configs get none until a run with brotli")
+
+    template_hash = hash_template(*([args.rules] if args.rules else []))
+    old_manifest = load_manifest()
+    reuse = (not args.force
+             and old_manifest.get("generator") == GENERATOR_VERSION
+             and old_manifest.get("template") == template_hash
+             and old_manifest.get("latency") == latency_hash
+             and old_manifest.get("domestic") == domestic
+             and old_manifest.get("artifacts") == list(artifacts)
+             and old_manifest.get("variants") == list(variants))
+    old_providers = old_manifest.get("providers", {}) if reuse else {}
+    manifest = {"generator": GENERATOR_VERSION, "template": template_hash, "latency": latency_hash,
+                "domestic": domestic, "artifacts": list(artifacts), "variants": list(variants), "providers": {}}
+
+    plan = []
+    stale = []
+    bootstrapped = 0
+    targets = list(providers.items()) + [(name, mix) for name, (_, mix) in mixes.items()]
+    for provider, entries in targets:
+        if not provider_entries(entries):
             logging.warning(f"⚠️ Provider {provider} has no DNS entries. Skipping...")
             continue
 
-        # Normal config
-        normal_cfg = copy.deepcopy(tpl) or {}
-        normal_cfg["dns"]["nameserver"] = all_entries
-        normal_cfg["dns"]["direct-nameserver"] = all_entries
-        normal_cfg["dns"]["proxy-server-nameserver"] = all_entries
-        normal_cfg = add_fallback(normal_cfg, entries)
-        f1 = save_config(provider, normal_cfg, "Normal")
-        files.append(f1)
-        logging.info(f"✅ Normal config saved: {f1}")
-
-        # Strict config
-        strict_cfg = copy.deepcopy(tpl) or {}
-        strict_cfg["dns"]["default-nameserver"] = dictator(entries["ipv4"]) + dictator(entries["ipv6"])
-        strict_cfg["dns"]["nameserver"] = all_entries
-        strict_cfg["dns"]["direct-nameserver"] = all_entries
-        strict_cfg["dns"]["proxy-server-nameserver"] = all_entries
-        strict_cfg = add_fallback(strict_cfg, entries)
-        f2 = save_config(provider, strict_cfg, "Strict")
-        files.append(f2)
-        logging.info(f"✅ Strict config saved: {f2}")
-
-    generate_readme(files)
-    logging.info("📄 README.md generated inside Generated/")
+        with profiling.stage("plan", provider):
+            _, bootstrap = nameserver_list(provider, entries, latency, fanout)
+            entry_hash = hash_entries(entries, fanout_options(fanout, provider))
+            previous = old_providers.get(provider)
+            up_to_date = is_up_to_date(previous, entry_hash, writable)
+        if bootstrap:
+            bootstrapped += 1
+            if not (entries.ipv4 or entries.ipv6):
+                logging.warning(f"⚠️ Provider {provider} needs a bootstrap resolver for {', '.join(bootstrap)} "
+                                f"but lists no IP servers; its Strict config has an empty default-nameserver")
+
+        if up_to_date:
+            plan.append((provider, entry_hash, previous))
+        else:
+            logging.info(f"⚙️ Generating configs for provider: {provider}")
+            plan.append((provider, entry_hash, None))
+            stale.append((provider, entries))
+
+    # Leftovers from a crashed run must not be published
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+    generated = iter(generate_all(stale, tpl, args.full_render, workers, latency, args.emitter,
+                                  domestic, fanout, writable, variants))
+    bases = dictator(base_name(VARIANTS[name]) for name in variants)
+    if "fragment" in artifacts:
+        with profiling.stage("write"):
+            write_bases(tpl, variants, args.emitter)
+
+    files = []
+    for provider, entry_hash, item in plan:
+        if item is None:
+            provider_files, digests = next(generated)
+            item = {"hash": entry_hash, "files": provider_files, "digests": digests}
+        files.extend(item["files"])
+        manifest["providers"][provider] = item
+
+    logging.info(f"🧭 {bootstrapped} providers use hostname nameservers resolved through default-nameserver")
+
+    rebuilt = len(stale)
+    skipped = len(plan) - rebuilt
+    logging.info(f"📦 Providers rebuilt: {rebuilt}, unchanged and skipped: {skipped}")
+
+    with profiling.stage("publish"):
+        stats = publish(files, writable, bases, keep=missing)
+        save_manifest(manifest)
+    logging.info("🗂️ Files added: {added}, changed: {changed}, removed: {removed}, unchanged: {unchanged}".format(**stats))
+
+    with profiling.stage("readme"):
+        catalog = build_catalog(manifest, providers, mixes, located)
+        write_catalog(catalog)
+        pages = generate_readme(catalog)
+    logging.info(f"📄 README.md, {pages} country pages and {os.path.basename(CATALOG_FILE)} generated inside {README_DIR}/")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    if args.watch:
+        import watch   # imports this module, so load it lazily
+        watch.run(args)
+        return
+    profiler = profiling.enable() if args.profile else None
+    cprofile = None
+    if args.pstats:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        generate(args)
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.pstats)
+            logging.info(f"🔬 cProfile stats written to {args.pstats} (python -m pstats {args.pstats})")
+        if profiler is not None:
+            data = profiling.save(args.profile, profiler, {"generator": GENERATOR_VERSION, "emitter": args.emitter,
+                                                            "jobs": args.jobs, "full_render": args.full_render})
+            for line in profiling.summary(data):
+                logging.info(f"⏱️ {line}")
+            logging.info(f"📊 Profile written to {args.profile} ({data['wall_seconds']:.2f}s wall)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,457 @@
+"""Offline country/ASN lookup for providers without a `country` line.
+
+Every IP literal in dns_list.txt (plain servers as well as DoH/DoT URLs with
+an IP host) is looked up in local MaxMind-format databases. The reader
+memory-maps the .mmdb file, so nothing is loaded up front and nothing goes
+over the network. Results are cached per database hash in GEOIP_CACHE, and a
+summary per provider is written to gdc.GEOIP_FILE, which generate_dns_configs.py
+merges into providers that have no `country` of their own:
+
+    python geoip.py --country-db GeoLite2-Country.mmdb --asn-db GeoLite2-ASN.mmdb
+    python geoip.py --country-db GeoLite2-Country.mmdb --lookup 1.1.1.1 2a00:1450::1
+    python geoip.py --self-test   # check the reader against databases built in memory
+
+A provider's country is the most common country among its addresses.
+"""
+import os
+import mmap
+import json
+import time
+import struct
+import hashlib
+import logging
+import argparse
+import tempfile
+import ipaddress
+from collections import Counter
+
+import generate_dns_configs as gdc
+from nameservers import is_ip, parse_endpoint
+
+GEOIP_CACHE = ".geoip_cache.json"
+
+METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+METADATA_MAX = 128 * 1024
+POINTER_BASES = (0, 2048, 526336, 0)
+
+# --- MaxMind DB format -----------------------------------------------------
+
+class Decoder:
+    """Decodes the MaxMind DB data section; pointers are relative to `base`."""
+
+    def __init__(self, buf, base):
+        self.buf = buf
+        self.base = base
+
+    def decode(self, offset):
+        """Return (value, offset just past it)."""
+        buf = self.buf
+        ctrl = buf[offset]
+        offset += 1
+        kind = ctrl >> 5
+        if kind == 1:
+            size = (ctrl >> 3) & 3
+            ptr = int.from_bytes(buf[offset:offset + size + 1], "big")
+            if size < 3:
+                ptr |= (ctrl & 7) << (8 * (size + 1))
+            value, _ = self.decode(self.base + ptr + POINTER_BASES[size])
+            return value, offset + size + 1
+        if kind == 0:
+            kind = 7 + buf[offset]
+            offset += 1
+        size = ctrl & 0x1f
+        if size >= 29:
+            n = size - 28
+            size = (29, 285, 65821)[n - 1] + int.from_bytes(buf[offset:offset + n], "big")
+            offset += n
+
+        if kind == 7:
+            value = {}
+            for _ in range(size):
+                key, offset = self.decode(offset)
+                value[key], offset = self.decode(offset)
+            return value, offset
+        if kind == 11:
+            value = []
+            for _ in range(size):
+                item, offset = self.decode(offset)
+                value.append(item)
+            return value, offset
+        if kind == 14:
+            return size != 0, offset
+        end = offset + size
+        if kind == 2:
+            return buf[offset:end].decode("utf-8"), end
+        if kind in (5, 6, 9, 10):
+            return int.from_bytes(buf[offset:end], "big"), end
+        if kind == 8:
+            value = int.from_bytes(buf[offset:end], "big")
+            return (value - (1 << 32) if size == 4 and value >= 1 << 31 else value), end
+        if kind == 3:
+            return struct.unpack(">d", buf[offset:end])[0], end
+        if kind == 15:
+            return struct.unpack(">f", buf[offset:end])[0], end
+        if kind == 4:
+            return bytes(buf[offset:end]), end
+        raise ValueError(f"unsupported MaxMind DB data type {kind} at offset {offset - 1}")
+
+class Reader:
+    """A MaxMind DB file, memory-mapped; lookup() returns the record for an IP or None."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = self.buf.rfind(METADATA_MARKER, max(0, len(self.buf) - METADATA_MAX))
+        if start < 0:
+            self.buf.close()
+            raise ValueError(f"{path} is not a MaxMind DB file")
+        start += len(METADATA_MARKER)
+        self.metadata, _ = Decoder(self.buf, start).decode(start)
+        self.node_count = self.metadata["node_count"]
+        self.record_size = self.metadata["record_size"]
+        if self.record_size not in (24, 28, 32):
+            raise ValueError(f"{path}: unsupported record size {self.record_size}")
+        self.node_bytes = self.record_size // 4
+        self.tree_size = self.node_count * self.node_bytes
+        self.decoder = Decoder(self.buf, self.tree_size + 16)
+        self.records = {}
+        self._hash = None
+        # IPv4 addresses live under ::/96 in IPv6 databases; walk there once
+        node = 0
+        if self.metadata["ip_version"] == 6:
+            for _ in range(96):
+                if node >= self.node_count:
+                    break
+                node = self.child(node, 0)
+        self.ipv4_start = node
+
+    @property
+    def database_type(self):
+        return self.metadata.get("database_type", "")
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.buf).hexdigest()
+        return self._hash
+
+    def close(self):
+        self.buf.close()
+
+    def child(self, node, bit):
+        buf = self.buf
+        offset = node * self.node_bytes
+        if self.record_size == 24:
+            offset += bit * 3
+            return int.from_bytes(buf[offset:offset + 3], "big")
+        if self.record_size == 28:
+            if bit:
+                return ((buf[offset + 3] & 0x0f) << 24) | int.from_bytes(buf[offset + 4:offset + 7], "big")
+            return ((buf[offset + 3] & 0xf0) << 20) | int.from_bytes(buf[offset:offset + 3], "big")
+        offset += bit * 4
+        return int.from_bytes(buf[offset:offset + 4], "big")
+
+    def lookup(self, ip):
+        addr = ipaddress.ip_address(ip)
+        if addr.version == 6 and self.metadata["ip_version"] == 4:
+            return None
+        node = self.ipv4_start if addr.version == 4 else 0
+        bits = addr.max_prefixlen
+        value = int(addr)
+        node_count = self.node_count
+        for i in range(bits - 1, -1, -1):
+            if node >= node_count:
+                break
+            node = self.child(node, (value >> i) & 1)
+        if node == node_count:
+            return None
+        if node < node_count:
+            raise ValueError(f"{self.path}: search tree too deep for {ip}")
+        # Many addresses share a record, so decode each one only once
+        offset = self.tree_size + node - node_count
+        record = self.records.get(offset)
+        if record is None:
+            record, _ = self.decoder.decode(offset)
+            self.records[offset] = record
+        return record
+
+# --- enrichment ------------------------------------------------------------
+
+def provider_addresses(entries):
+    """IP literals among a provider's servers, in list order, without duplicates."""
+    addresses = []
+    for dtype in gdc.DTYPES:
+        for value in getattr(entries, dtype):
+            ep = parse_endpoint(value, dtype)
+            if ep is not None and is_ip(ep.host):
+                addresses.append(str(ipaddress.ip_address(ep.host)))
+    return list(dict.fromkeys(addresses))
+
+def summarize(record, asn_record=None):
+    """[country name, ISO code, ASN, AS organisation] from country and ASN records."""
+    record = record or {}
+    asn_record = asn_record or record
+    country = record.get("country") or record.get("registered_country") or {}
+    return [country.get("names", {}).get("en"), country.get("iso_code"),
+            asn_record.get("autonomous_system_number"), asn_record.get("autonomous_system_organization")]
+
+def load_cache(path=GEOIP_CACHE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def lookup_all(addresses, country_db, asn_db=None, cache=None):
+    """{ip: summary} for every address, reusing and filling `cache`."""
+    key = country_db.hash + (f"+{asn_db.hash}" if asn_db is not None else "")
+    if cache is not None:
+        # Only results from the databases in use are worth keeping
+        for old in [k for k in cache if k != key]:
+            del cache[old]
+        known = cache.setdefault(key, {})
+    else:
+        known = {}
+    results = {}
+    for ip in addresses:
+        found = known.get(ip)
+        if found is None:
+            asn_record = asn_db.lookup(ip) if asn_db is not None else None
+            found = known[ip] = summarize(country_db.lookup(ip), asn_record)
+        results[ip] = found
+    return results
+
+def enrich(providers, country_db, asn_db=None, cache=None):
+    """Per-provider country and ASN summary for every provider with IP literals."""
+    addresses = {name: provider_addresses(entries) for name, entries in providers.items()}
+    results = lookup_all(sorted({ip for ips in addresses.values() for ip in ips}), country_db, asn_db, cache)
+    summary = {}
+    for name, ips in addresses.items():
+        found = [results[ip] for ip in ips]
+        countries = Counter((r[0], r[1]) for r in found if r[0])
+        asns = Counter((r[2], r[3]) for r in found if r[2] is not None)
+        if not countries and not asns:
+            continue
+        item = {"addresses": len(ips)}
+        if countries:
+            (item["country"], item["iso_code"]), _ = countries.most_common(1)[0]
+        if asns:
+            item["asn"] = [{"number": number, "organization": org} for (number, org), _ in asns.most_common()]
+        summary[name] = item
+    return summary
+
+def database_info(reader):
+    return {"path": os.path.basename(reader.path), "type": reader.database_type,
+            "build_epoch": reader.metadata.get("build_epoch"), "hash": reader.hash}
+
+# --- self-test -------------------------------------------------------------
+
+class Pointer:
+    """A data-section pointer of a given size (0-3), for building test databases."""
+    __slots__ = ("offset", "size")
+
+    def __init__(self, offset, size):
+        self.offset = offset
+        self.size = size
+
+class Float32(float):
+    pass
+
+def control(kind, size):
+    """Control byte(s) for a value of `kind` and payload `size`."""
+    if size < 29:
+        head, extra = size, b""
+    elif size < 285:
+        head, extra = 29, (size - 29).to_bytes(1, "big")
+    elif size < 65821:
+        head, extra = 30, (size - 285).to_bytes(2, "big")
+    else:
+        head, extra = 31, (size - 65821).to_bytes(3, "big")
+    if kind < 8:
+        return bytes([kind << 5 | head]) + extra
+    return bytes([head, kind - 7]) + extra
+
+def encode_value(value):
+    """The MaxMind DB encoding of `value`; the inverse of Decoder.decode()."""
+    if isinstance(value, Pointer):
+        # Spelled out rather than POINTER_BASES, so a wrong constant in the reader shows up
+        target = value.offset - (0, 2048, 526336, 0)[value.size]
+        if value.size == 3:
+            return bytes([1 << 5 | 3 << 3]) + target.to_bytes(4, "big")
+        n = value.size + 1
+        return bytes([1 << 5 | value.size << 3 | target >> (8 * n)]) + (target & ((1 << 8 * n) - 1)).to_bytes(n, "big")
+    if isinstance(value, dict):
+        return control(7, len(value)) + b"".join(encode_value(k) + encode_value(v) for k, v in value.items())
+    if isinstance(value, list):
+        return control(11, len(value)) + b"".join(encode_value(item) for item in value)
+    if isinstance(value, bool):
+        return control(14, int(value))
+    if isinstance(value, str):
+        data = value.encode("utf-8")
+        return control(2, len(data)) + data
+    if isinstance(value, bytes):
+        return control(4, len(value)) + value
+    if isinstance(value, Float32):
+        return control(15, 4) + struct.pack(">f", value)
+    if isinstance(value, float):
+        return control(3, 8) + struct.pack(">d", value)
+    if value < 0:
+        return control(8, 4) + struct.pack(">i", value)
+    kind = 5 if value < 1 << 16 else 6 if value < 1 << 32 else 9 if value < 1 << 64 else 10
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return control(kind, len(data)) + data
+
+def build_database(networks, data, record_size, ip_version=6):
+    """A MaxMind DB file's bytes: `networks` maps CIDRs to offsets into the `data` section."""
+    nodes = [[None, None]]
+    for cidr, offset in networks.items():
+        net = ipaddress.ip_network(cidr)
+        bits, value = net.prefixlen, int(net.network_address)
+        if ip_version == 6 and net.version == 4:
+            bits += 96   # IPv4 lives under ::/96
+        width = 128 if ip_version == 6 else 32
+        node = 0
+        for i in range(bits - 1):
+            bit = value >> (width - 1 - i) & 1
+            if nodes[node][bit] is None:
+                nodes.append([None, None])
+                nodes[node][bit] = len(nodes) - 1
+            node = nodes[node][bit]
+        nodes[node][value >> (width - bits) & 1] = ("data", offset)
+    count = len(nodes)
+
+    def record(child):
+        if child is None:
+            return count
+        if isinstance(child, tuple):
+            return count + 16 + child[1]
+        return child
+
+    tree = bytearray()
+    for left, right in nodes:
+        left, right = record(left), record(right)
+        if record_size == 28:
+            tree += left.to_bytes(4, "big")[1:] + bytes([(left >> 24) << 4 | right >> 24]) + right.to_bytes(4, "big")[1:]
+        else:
+            tree += left.to_bytes(record_size // 8, "big") + right.to_bytes(record_size // 8, "big")
+    metadata = {"node_count": count, "record_size": record_size, "ip_version": ip_version,
+                "database_type": "Self-Test", "languages": ["en"], "binary_format_major_version": 2,
+                "binary_format_minor_version": 0, "build_epoch": 1 << 40, "description": {"en": "geoip.py self-test"}}
+    return bytes(tree) + b"\0" * 16 + data + METADATA_MARKER + encode_value(metadata)
+
+def self_test_database(record_size, ip_version):
+    """(database bytes, {ip: expected record or None}) exercising every pointer size and extended type."""
+    section = bytearray()
+
+    def add(value):
+        offset = len(section)
+        section.extend(encode_value(value))
+        return offset
+
+    germany = add("Germany")
+    add(b"\0" * 3000)
+    france = add("France")
+    # Big enough for 27-bit pointers, and for record values that need a 28-bit record's top nibble
+    add(b"\0" * (600000 if record_size == 24 else 1 << 24))
+    japan = add("Japan")
+    records = [
+        ({"country": {"iso_code": "DE", "names": {"en": Pointer(germany, 0)}}, "autonomous_system_number": 3320},
+         {"country": {"iso_code": "DE", "names": {"en": "Germany"}}, "autonomous_system_number": 3320}),
+        ({"country": {"iso_code": "FR", "names": {"en": Pointer(france, 1)}}, "autonomous_system_number": 4200000000,
+          "signed": -5, "flags": [True, False], "big": 1 << 40, "huge": 1 << 100, "double": 2.5, "single": Float32(1.5)},
+         {"country": {"iso_code": "FR", "names": {"en": "France"}}, "autonomous_system_number": 4200000000,
+          "signed": -5, "flags": [True, False], "big": 1 << 40, "huge": 1 << 100, "double": 2.5, "single": 1.5}),
+        ({"country": {"iso_code": "JP", "names": {"en": Pointer(japan, 2), "de": Pointer(germany, 3)}},
+          "long": "x" * 300},
+         {"country": {"iso_code": "JP", "names": {"en": "Japan", "de": "Germany"}}, "long": "x" * 300}),
+    ]
+    offsets = [add(encoded) for encoded, _ in records]
+    networks = {"1.1.1.0/24": offsets[0], "8.8.0.0/16": offsets[1], "203.0.113.128/25": offsets[2]}
+    expected = {"1.1.1.1": records[0][1], "8.8.4.4": records[1][1], "203.0.113.200": records[2][1],
+                "203.0.113.1": None, "9.9.9.9": None}
+    if ip_version == 6:
+        networks["2606:4700::/32"] = offsets[2]
+        expected.update({"2606:4700::1111": records[2][1], "2a00:1450::1": None})
+    else:
+        expected["2606:4700::1111"] = None
+    return build_database(networks, bytes(section), record_size, ip_version), expected
+
+def self_test():
+    problems = []
+    cases = [(24, 6), (28, 6), (32, 6), (24, 4)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for record_size, ip_version in cases:
+            data, expected = self_test_database(record_size, ip_version)
+            path = os.path.join(tmp, f"test-{record_size}-v{ip_version}.mmdb")
+            with open(path, "wb") as f:
+                f.write(data)
+            reader = Reader(path)
+            try:
+                for ip, record in expected.items():
+                    try:
+                        found = reader.lookup(ip)
+                    except (ValueError, IndexError, UnicodeDecodeError, struct.error) as e:
+                        found = f"error: {e}"
+                    if found != record:
+                        problems.append(f"{record_size}-bit IPv{ip_version} database: {ip} -> {found}, expected {record}")
+                if reader.database_type != "Self-Test" or reader.metadata["build_epoch"] != 1 << 40:
+                    problems.append(f"{record_size}-bit IPv{ip_version} database: metadata {reader.metadata}")
+            finally:
+                reader.close()
+    for problem in problems:
+        logging.error(f"❌ {problem}")
+    if problems:
+        raise SystemExit(1)
+    logging.info(f"✅ Reader matches {len(cases)} built databases (24/28/32-bit records, IPv4 and IPv6)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Look up provider countries and ASNs in local MaxMind databases")
+    parser.add_argument("--self-test", action="store_true",
+                        help="build small databases for each record size and check lookups against them")
+    parser.add_argument("--country-db", metavar="FILE",
+                        help="GeoLite2/GeoIP2 Country or City .mmdb (or any DB with a `country` field)")
+    parser.add_argument("--asn-db", metavar="FILE", help="GeoLite2 ASN .mmdb")
+    parser.add_argument("--input", default=gdc.INPUT_FILE, help="provider list to enrich")
+    parser.add_argument("--output", default=gdc.GEOIP_FILE, help="sidecar for generate_dns_configs.py (default: %(default)s)")
+    parser.add_argument("--cache", default=GEOIP_CACHE, help="lookup cache (default: %(default)s)")
+    parser.add_argument("--lookup", nargs="+", metavar="IP", help="print the records for these addresses and exit")
+    args = parser.parse_args(argv)
+    if not args.self_test and not args.country_db:
+        parser.error("--country-db is required")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.self_test:
+        self_test()
+        return
+    country_db = Reader(args.country_db)
+    asn_db = Reader(args.asn_db) if args.asn_db else None
+    try:
+        if args.lookup:
+            for ip in args.lookup:
+                print(json.dumps({"ip": ip, "country": country_db.lookup(ip),
+                                  "asn": asn_db.lookup(ip) if asn_db else None}, ensure_ascii=False))
+            return
+        providers = gdc.parse_dns_list(args.input)
+        cache = load_cache(args.cache)
+        start = time.perf_counter()
+        summary = enrich(providers, country_db, asn_db, cache)
+        elapsed = time.perf_counter() - start
+        data = {"databases": {"country": database_info(country_db)}, "providers": summary}
+        if asn_db is not None:
+            data["databases"]["asn"] = database_info(asn_db)
+        gdc.atomic_write(args.output, json.dumps(data, indent=2, ensure_ascii=False, sort_keys=True) + "\n")
+        gdc.atomic_write(args.cache, json.dumps(cache, separators=(",", ":"), sort_keys=True))
+        missing = [name for name, entries in providers.items() if not entries.country]
+        filled = sum(1 for name in missing if summary.get(name, {}).get("country"))
+        logging.info(f"🌍 {len(summary)} providers located in {elapsed:.2f}s; "
+                     f"{filled} of {len(missing)} without a country line can be filled from {args.output}")
+    finally:
+        country_db.close()
+        if asn_db is not None:
+            asn_db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Keep probing every resolver and regenerate configs around outages.
+
+Each round queries every endpoint in dns_list.txt once (at most
+--concurrency in flight, the same queries as dns_probe.py) and records the
+result in a fixed-size ring per endpoint. An endpoint goes down when its
+success rate over the window drops below --down-below, or its median
+latency exceeds --max-p50, and comes back up once the rate reaches
+--up-above. Whenever the set of down endpoints changes, the health file is
+rewritten and generate_dns_configs.py --health runs, leaving dead servers
+out of the per-provider configs and the root Emergency_DNS_*.yml ones:
+
+    python health_monitor.py --interval 30 --window 20
+    python health_monitor.py --stub --interval 0.5 --window 10 --stub-flap 10   # local stub resolver with outages
+    python health_monitor.py --self-test   # check down, regenerate, recover against the stub
+
+The health file uses the latency table format, so it also works with
+--latency. Every round is appended to HISTORY_FILE as one JSON line of
+[unix time, [latency ms or null per endpoint]], after a header line naming
+the endpoints whenever they change.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shlex
+import asyncio
+import logging
+import argparse
+import tempfile
+from array import array
+
+import generate_dns_configs as gdc
+import dns_probe
+from config_server import file_stamps
+from nameservers import parse_endpoint
+
+HEALTH_FILE = "health.json"
+HISTORY_FILE = "health_history.jsonl"
+
+# --- rolling windows -------------------------------------------------------
+
+class Ring:
+    """The last `size` results of one endpoint; failures are stored as NaN."""
+
+    __slots__ = ("values", "count", "pos")
+
+    def __init__(self, size):
+        self.values = array("d", bytes(8 * size))
+        self.count = 0
+        self.pos = 0
+
+    def add(self, seconds):
+        self.values[self.pos] = math.nan if seconds is None else seconds
+        self.pos = (self.pos + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+    def window(self):
+        """Results oldest first."""
+        if self.count < len(self.values):
+            return self.values[:self.count]
+        return self.values[self.pos:] + self.values[:self.pos]
+
+    def latencies(self):
+        return [v for v in self.window() if not math.isnan(v)]
+
+    def success_rate(self):
+        return len(self.latencies()) / self.count if self.count else 0.0
+
+class Tracked:
+    __slots__ = ("ep", "ring", "state")
+
+    def __init__(self, ep, size):
+        self.ep = ep
+        self.ring = Ring(size)
+        self.state = "unknown"
+
+    def stats(self):
+        samples = self.ring.latencies()
+        stats = dns_probe.summarize(self.ep, samples, self.ring.count - len(samples))
+        stats["state"] = self.state
+        return stats
+
+# --- monitor ---------------------------------------------------------------
+
+def load_endpoints(path):
+    providers = gdc.parse_dns_list(path)
+    return dns_probe.collect_endpoints(providers)
+
+class Monitor:
+    def __init__(self, args, endpoints):
+        self.args = args
+        self.endpoints = {}
+        self.history_header = None
+        self.set_endpoints(endpoints)
+
+    def set_endpoints(self, endpoints):
+        # Endpoints that stay listed keep their window and state
+        self.endpoints = {ep.value: self.endpoints.get(ep.value) or Tracked(ep, self.args.window) for ep in endpoints}
+
+    def down(self):
+        return {value for value, e in self.endpoints.items() if e.state == "down"}
+
+    async def probe_round(self):
+        args = self.args
+        semaphore = asyncio.Semaphore(args.concurrency)
+        results = {}
+
+        async def one(e):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    rcode = await asyncio.wait_for(dns_probe.query_endpoint(e.ep, args.name), args.timeout)
+                except (OSError, ValueError, EOFError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    rcode = None
+                results[e.ep.value] = time.perf_counter() - start if rcode in (0, 3) else None
+
+        await asyncio.gather(*(one(e) for e in self.endpoints.values()))
+        now = time.time()
+        for value, e in self.endpoints.items():
+            e.ring.add(results.get(value))
+        return now, results
+
+    def judge(self, e):
+        args = self.args
+        if e.ring.count < args.min_samples:
+            return e.state
+        rate = e.ring.success_rate()
+        p50 = dns_probe.percentile(e.ring.latencies(), 50)
+        slow = args.max_p50 is not None and p50 is not None and p50 * 1000 > args.max_p50
+        if e.state != "down" and (rate < args.down_below or slow):
+            return "down"
+        if e.state != "up" and rate >= args.up_above and not slow:
+            return "up"
+        return e.state
+
+    def update_states(self):
+        """Apply the thresholds; returns [(value, old, new)] for every endpoint that changed."""
+        flips = []
+        for value, e in self.endpoints.items():
+            state = self.judge(e)
+            if state != e.state:
+                flips.append((value, e.state, state))
+                e.state = state
+        return flips
+
+    def table(self):
+        return {value: e.stats() for value, e in self.endpoints.items()}
+
+    def append_history(self, when, results):
+        values = list(self.endpoints)
+        with open(self.args.history, "a", encoding="utf-8") as f:
+            if values != self.history_header:
+                f.write(json.dumps({"endpoints": values, "query": self.args.name}, separators=(",", ":")) + "\n")
+                self.history_header = values
+            row = [round(when, 3), [round(results[v] * 1000, 2) if results.get(v) is not None else None for v in values]]
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+async def regenerate(args):
+    """Run the generator with the fresh health file; returns its exit status."""
+    argv = [sys.executable, "generate_dns_configs.py", "--health", args.output] + shlex.split(args.generate_args)
+    proc = await asyncio.create_subprocess_exec(*argv)
+    return await proc.wait()
+
+async def run(args, regenerate=regenerate):
+    stub = None
+    if args.stub:
+        stub = await dns_probe.StubResolver().start()
+        endpoints = [parse_endpoint(value) for value in stub.endpoints()]
+    else:
+        endpoints = load_endpoints(args.input)
+    monitor = Monitor(args, endpoints)
+    stamps = file_stamps([args.input])
+    logging.info(f"🩺 Monitoring {len(monitor.endpoints)} endpoints every {args.interval}s "
+                 f"(window {args.window}, down below {args.down_below:.0%}, up at {args.up_above:.0%})")
+    rounds = 0
+    try:
+        while args.rounds is None or rounds < args.rounds:
+            start = time.perf_counter()
+            if stub is not None and args.stub_flap and rounds and rounds % args.stub_flap == 0:
+                stub.up = not stub.up
+                logging.info(f"🧪 Stub resolver {'back up' if stub.up else 'down'}")
+            elif stub is None and file_stamps([args.input]) != stamps:
+                stamps = file_stamps([args.input])
+                monitor.set_endpoints(load_endpoints(args.input))
+                logging.info(f"🔄 {args.input} changed, monitoring {len(monitor.endpoints)} endpoints")
+
+            down_before = monitor.down()
+            when, results = await monitor.probe_round()
+            rounds += 1
+            if args.history:
+                monitor.append_history(when, results)
+            for value, old, new in monitor.update_states():
+                logging.info(f"{'🔴' if new == 'down' else '🟢'} {value}: {old} -> {new}")
+
+            down = monitor.down()
+            if down != down_before:
+                gdc.atomic_write(args.output, json.dumps({"generated": int(when), "query": args.name,
+                                                          "endpoints": monitor.table()}, indent=2, ensure_ascii=False) + "\n")
+                logging.info(f"📄 {len(down)} endpoints down, health written to {args.output}")
+                if not args.no_generate:
+                    status = await regenerate(args)
+                    if status:
+                        logging.error(f"❌ generate_dns_configs.py exited with {status}; keeping the previous configs")
+            await asyncio.sleep(max(0.0, args.interval - (time.perf_counter() - start)))
+    finally:
+        if stub is not None:
+            await stub.stop()
+    return monitor
+
+async def self_test():
+    """Flap the stub resolver and check the monitor marks it down, regenerates, and recovers."""
+    with tempfile.TemporaryDirectory() as tmp:
+        args = parse_args(["--stub", "--interval", "0.05", "--timeout", "0.2", "--window", "4", "--min-samples", "2",
+                           "--stub-flap", "6", "--rounds", "18", "--output", os.path.join(tmp, HEALTH_FILE),
+                           "--history", os.path.join(tmp, HISTORY_FILE)])
+        args.no_generate = False
+        runs = []
+
+        async def record(args):
+            # What generate_dns_configs.py --health would leave out
+            runs.append(gdc.load_health(args.output))
+            return 0
+
+        monitor = await run(args, regenerate=record)
+        with open(args.history, "r", encoding="utf-8") as f:
+            rows = len(f.readlines())
+    endpoints = set(monitor.endpoints)
+    problems = []
+    if runs[:1] != [endpoints]:
+        problems.append(f"expected a regeneration with all {len(endpoints)} stub endpoints down, got {runs[:1]}")
+    if runs[1:] != [set()]:
+        problems.append(f"expected one regeneration after the stub recovered, got {runs[1:]}")
+    if monitor.down():
+        problems.append(f"still down after recovery: {sorted(monitor.down())}")
+    if rows != args.rounds + 1:
+        problems.append(f"history has {rows} lines, expected {args.rounds + 1}")
+    for problem in problems:
+        logging.error(f"❌ {problem}")
+    if problems:
+        raise SystemExit(1)
+    logging.info(f"✅ Stub went down and came back; {len(runs)} regenerations, {rows - 1} rounds of history")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Continuously probe resolvers and regenerate configs around outages")
+    parser.add_argument("--input", default=gdc.INPUT_FILE, help="provider list to monitor")
+    parser.add_argument("--output", default=HEALTH_FILE, help="health file to write (default: %(default)s)")
+    parser.add_argument("--history", default=HISTORY_FILE, metavar="FILE",
+                        help="append every round here, one JSON line each ('' to disable; default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=30.0, metavar="SECONDS", help="time between rounds")
+    parser.add_argument("--window", type=int, default=20, metavar="N", help="results kept per endpoint")
+    parser.add_argument("--min-samples", type=int, default=3, metavar="N", help="results needed before judging")
+    parser.add_argument("--down-below", type=float, default=0.5, metavar="RATE",
+                        help="mark an endpoint down below this success rate (default: %(default)s)")
+    parser.add_argument("--up-above", type=float, default=0.8, metavar="RATE",
+                        help="mark a down endpoint up again at this success rate (default: %(default)s)")
+    parser.add_argument("--max-p50", type=float, metavar="MS", help="also mark endpoints down whose median exceeds MS")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-query timeout in seconds")
+    parser.add_argument("--concurrency", type=int, default=64, help="maximum queries in flight")
+    parser.add_argument("--name", default=dns_probe.QUERY_NAME, help="domain to query (A record)")
+    parser.add_argument("--rounds", type=int, metavar="N", help="stop after N rounds (default: run forever)")
+    parser.add_argument("--generate-args", default="", metavar="ARGS",
+                        help="extra arguments for generate_dns_configs.py, e.g. '--jobs 4'")
+    parser.add_argument("--no-generate", action="store_true", help="only write the health file")
+    parser.add_argument("--stub", action="store_true",
+                        help="monitor an in-process stub resolver instead of dns_list.txt (implies --no-generate)")
+    parser.add_argument("--stub-flap", type=int, default=0, metavar="N",
+                        help="with --stub, toggle a simulated outage every N rounds")
+    parser.add_argument("--self-test", action="store_true",
+                        help="run a short flapping --stub session and check the down/regenerate/up cycle")
+    args = parser.parse_args(argv)
+    if args.stub:
+        args.no_generate = True
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.self_test:
+        asyncio.run(self_test())
+        return
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
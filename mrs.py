@@ -0,0 +1,416 @@
+"""Encoder and decoder for mihomo's binary rule-set format (`format: mrs`).
+
+An .mrs file is a zstd stream holding a small header (magic, behavior,
+rule count) and a pre-indexed set the client loads without parsing text:
+domains as a succinct trie over reversed names (`+.` suffixes become a
+wildcard label), CIDRs as sorted, merged address ranges. Only `domain` and
+`ipcidr` behaviors exist in this format; `classical` rule-sets stay text.
+
+With the `zstandard` package installed the stream is compressed; without it
+the same data is written as raw zstd blocks, which every zstd reader accepts,
+so output never depends on an optional package. decode() is the inverse, used
+to check files round-trip:
+
+    python mrs.py encode domain rules.txt rules.mrs
+    python mrs.py decode rules.mrs
+    python mrs.py --self-test   # round-trip rule-sets built from the template's rules
+"""
+import sys
+import struct
+import logging
+import argparse
+import ipaddress
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"MRS\x01"
+BEHAVIORS = {"domain": 0, "ipcidr": 1}
+SET_VERSION = 1
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZSTD_LEVEL = 19
+MAX_BLOCK = 128 * 1024
+
+# --- zstd framing ----------------------------------------------------------
+
+def zstd_raw(data):
+    """A single zstd frame storing `data` in uncompressed (raw) blocks."""
+    # Single segment, 8-byte content size, no checksum or dictionary
+    out = [ZSTD_MAGIC, b"\xe0", struct.pack("<Q", len(data))]
+    offset = 0
+    while True:
+        block = data[offset:offset + MAX_BLOCK]
+        offset += len(block)
+        last = offset >= len(data)
+        out.append(((len(block) << 3) | last).to_bytes(3, "little"))
+        out.append(block)
+        if last:
+            return b"".join(out)
+
+def zstd_compress(data):
+    if zstandard is None:
+        return zstd_raw(data)
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, write_content_size=True).compress(data)
+
+def zstd_decompress(data):
+    if zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if data[:4] != ZSTD_MAGIC:
+        raise ValueError("not a zstd stream")
+    descriptor = data[4]
+    if descriptor & 0x03:
+        raise ValueError("zstd dictionaries need the zstandard package")
+    single = descriptor & 0x20
+    fcs = (1 if single else 0, 2, 4, 8)[descriptor >> 6]
+    offset = 5 + (0 if single else 1) + fcs
+    out = []
+    while True:
+        header = int.from_bytes(data[offset:offset + 3], "little")
+        offset += 3
+        kind, size = (header >> 1) & 3, header >> 3
+        if kind == 0:
+            out.append(data[offset:offset + size])
+            offset += size
+        elif kind == 1:
+            out.append(data[offset:offset + 1] * size)
+            offset += 1
+        else:
+            raise ValueError("compressed zstd blocks need the zstandard package")
+        if header & 1:
+            return b"".join(out)
+
+# --- domain sets -----------------------------------------------------------
+
+def split_domain(domain):
+    """Labels of a rule-set domain the way the client validates them, or None."""
+    domain = domain.strip().lower()
+    if not domain or domain.endswith("."):
+        return None
+    parts = domain.split(".")
+    if any(part == "" for part in parts[1:]):
+        return None
+    return parts
+
+def domain_keys(payload):
+    """(set of trie keys, number of valid entries) for a domain payload.
+
+    `+.example.com` matches the name and its subdomains, so it becomes both
+    `example.com` and the wildcard key `+.example.com`; `.example.com`
+    (subdomains only) becomes just the wildcard key.
+    """
+    keys = set()
+    count = 0
+    for entry in payload:
+        parts = split_domain(entry)
+        if parts is None:
+            logging.warning(f"⚠️ Skipping invalid domain rule: {entry}")
+            continue
+        count += 1
+        if parts[0] == "+" and len(parts) > 1:
+            rest = ".".join(parts[1:])
+            keys.add(rest)
+            keys.add("+." + rest)
+        elif parts[0] == "":
+            keys.add("+" + ".".join(parts))
+        else:
+            keys.add(".".join(parts))
+    return keys, count
+
+def pack_bits(bits, length):
+    words = [0] * ((length + 63) >> 6)
+    for i in bits:
+        words[i >> 6] |= 1 << (i & 63)
+    return words
+
+def build_domain_set(keys):
+    """(leaves, label bitmap, labels) of the succinct trie over reversed `keys`."""
+    rkeys = sorted(k[::-1].encode("utf-8") for k in keys)
+    leaves = []
+    ones = []
+    labels = bytearray()
+    bit = 0
+    queue = [(0, len(rkeys), 0)] if rkeys else []
+    i = 0
+    while i < len(queue):
+        start, end, col = queue[i]
+        if col == len(rkeys[start]):
+            start += 1
+            leaves.append(i)
+        j = start
+        while j < end:
+            first = j
+            c = rkeys[j][col]
+            while j < end and rkeys[j][col] == c:
+                j += 1
+            queue.append((first, j, col + 1))
+            labels.append(c)
+            bit += 1
+        ones.append(bit)
+        bit += 1
+        i += 1
+    leaf_words = pack_bits(leaves, leaves[-1] + 1 if leaves else 0)
+    return leaf_words, pack_bits(ones, bit), bytes(labels)
+
+def encode_domain_set(keys):
+    leaves, bitmap, labels = build_domain_set(keys)
+    out = [bytes([SET_VERSION]), struct.pack(">q", len(leaves)), struct.pack(f">{len(leaves)}Q", *leaves),
+           struct.pack(">q", len(bitmap)), struct.pack(f">{len(bitmap)}Q", *bitmap),
+           struct.pack(">q", len(labels)), labels]
+    return b"".join(out)
+
+class DomainSet:
+    """A decoded domain trie; `in` matches names the way the client does."""
+
+    def __init__(self, leaves, bitmap, labels):
+        self.leaves = leaves
+        self.labels = labels
+        self.ones = [i for i in range(len(bitmap) * 64) if bitmap[i >> 6] >> (i & 63) & 1]
+        # children of node n are labels[first[n]:first[n + 1]]; label k leads to node k + 1
+        self.first = [0] + [one + 1 - n for n, one in enumerate(self.ones[:-1], 1)]
+        self.first.append(len(labels))
+
+    def is_leaf(self, node):
+        return node >> 6 < len(self.leaves) and self.leaves[node >> 6] >> (node & 63) & 1
+
+    def children(self, node):
+        for k in range(self.first[node], self.first[node + 1]):
+            yield self.labels[k], k + 1
+
+    def keys(self):
+        """Every stored key, un-reversed."""
+        out = []
+        stack = [(0, b"")]
+        while stack:
+            node, prefix = stack.pop()
+            if self.is_leaf(node):
+                out.append(prefix.decode("utf-8")[::-1])
+            stack.extend((child, prefix + bytes([label])) for label, child in self.children(node))
+        return sorted(out)
+
+    def __contains__(self, domain):
+        key = domain.lower().rstrip(".")[::-1].encode("utf-8")
+        return self._match(0, key, 0)
+
+    def _match(self, node, key, i):
+        if i == len(key):
+            return bool(self.is_leaf(node))
+        for label, child in self.children(node):
+            if label == 0x2b:   # '+': any remaining subdomain
+                return True
+            if label == 0x2a:   # '*': exactly one label
+                j = key.find(b".", i)
+                if j < 0:
+                    if self.is_leaf(child):
+                        return True
+                elif self._match(child, key, j):
+                    return True
+            elif label == key[i] and self._match(child, key, i + 1):
+                return True
+        return False
+
+def decode_domain_set(data, offset=0):
+    if data[offset] != SET_VERSION:
+        raise ValueError(f"unsupported domain set version {data[offset]}")
+    offset += 1
+    parts = []
+    for _ in range(2):   # leaves, then the label bitmap
+        (n,) = struct.unpack_from(">q", data, offset)
+        offset += 8
+        parts.append(list(struct.unpack_from(f">{n}Q", data, offset)))
+        offset += 8 * n
+    (n,) = struct.unpack_from(">q", data, offset)
+    offset += 8
+    return DomainSet(parts[0], parts[1], bytes(data[offset:offset + n])), offset + n
+
+# --- CIDR sets -------------------------------------------------------------
+
+def cidr_ranges(payload):
+    """(sorted merged (first, last) address ranges, number of valid entries)."""
+    networks = {4: [], 6: []}
+    count = 0
+    for entry in payload:
+        entry = entry.strip()
+        try:
+            if "/" not in entry:
+                raise ValueError
+            net = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            logging.warning(f"⚠️ Skipping invalid CIDR rule: {entry}")
+            continue
+        count += 1
+        networks[net.version].append(net)
+    ranges = []
+    for version in (4, 6):
+        for net in ipaddress.collapse_addresses(networks[version]):
+            first, last = net.network_address, net.broadcast_address
+            if ranges and ranges[-1][1].version == version and int(ranges[-1][1]) + 1 == int(first):
+                ranges[-1] = (ranges[-1][0], last)
+            else:
+                ranges.append((first, last))
+    return ranges, count
+
+def as16(addr):
+    # IPv4 addresses are stored IPv4-mapped
+    return addr.packed if addr.version == 6 else b"\0" * 10 + b"\xff\xff" + addr.packed
+
+def from16(data):
+    addr = ipaddress.IPv6Address(data)
+    return addr.ipv4_mapped or addr
+
+def encode_cidr_set(ranges):
+    return b"".join([bytes([SET_VERSION]), struct.pack(">q", len(ranges))]
+                    + [as16(first) + as16(last) for first, last in ranges])
+
+def decode_cidr_set(data, offset=0):
+    if data[offset] != SET_VERSION:
+        raise ValueError(f"unsupported CIDR set version {data[offset]}")
+    (n,) = struct.unpack_from(">q", data, offset + 1)
+    offset += 9
+    ranges = []
+    for _ in range(n):
+        ranges.append((from16(data[offset:offset + 16]), from16(data[offset + 16:offset + 32])))
+        offset += 32
+    return ranges, offset
+
+def range_networks(ranges):
+    return [str(net) for first, last in ranges for net in ipaddress.summarize_address_range(first, last)]
+
+# --- files -----------------------------------------------------------------
+
+def encode(behavior, payload):
+    """The .mrs bytes for a `domain` or `ipcidr` payload; ValueError for other behaviors."""
+    if behavior not in BEHAVIORS:
+        raise ValueError(f"mrs has no `{behavior}` behavior")
+    if behavior == "domain":
+        keys, count = domain_keys(payload)
+        body = encode_domain_set(keys)
+    else:
+        ranges, count = cidr_ranges(payload)
+        body = encode_cidr_set(ranges)
+    if not count:
+        raise ValueError("mrs cannot hold an empty rule-set")
+    # magic, behavior, rule count, then a length-prefixed extra block (unused)
+    header = MAGIC + bytes([BEHAVIORS[behavior]]) + struct.pack(">qq", count, 0)
+    return zstd_compress(header + body)
+
+def decode(data):
+    """(behavior, rule count, DomainSet or list of (first, last) ranges) from .mrs bytes."""
+    raw = zstd_decompress(data)
+    if raw[:4] != MAGIC:
+        raise ValueError("not an mrs rule-set")
+    behavior = {v: k for k, v in BEHAVIORS.items()}.get(raw[4])
+    if behavior is None:
+        raise ValueError(f"unknown mrs behavior {raw[4]}")
+    count, extra = struct.unpack_from(">qq", raw, 5)
+    offset = 21 + extra
+    if behavior == "domain":
+        value, _ = decode_domain_set(raw, offset)
+    else:
+        value, _ = decode_cidr_set(raw, offset)
+    return behavior, count, value
+
+def text_payload(entries):
+    """`format: text` body: one rule per line."""
+    return "".join(f"{entry}\n" for entry in entries)
+
+# --- self-test -------------------------------------------------------------
+
+# Edge cases the template's own rules may not cover
+SELF_TEST_DOMAINS = ["example.com", "+.example.org", ".sub.example.net", "*.wild.example.io", "xn--mgbh0a.ir"]
+SELF_TEST_CIDRS = ["10.0.0.0/9", "10.128.0.0/9", "192.168.1.7/32", "2606:4700::/32", "2606:4701::/32", "::ffff:0:0/96"]
+
+def template_payloads():
+    """(domain payload, ipcidr payload) from the DOMAIN* and IP-CIDR* rules of the template."""
+    import generate_dns_configs as gdc   # imports rule_providers, which imports this module
+    import rule_providers
+    tpl = gdc.load_template()
+    domains = []
+    cidrs = []
+    for rule in tpl.get("rules") or []:
+        rtype, arg, _, _ = rule_providers.parse_rule(rule)
+        if rtype == "DOMAIN":
+            domains.append(arg)
+        elif rtype == "DOMAIN-SUFFIX":
+            domains.append(f"+.{arg}")
+        elif rtype in ("IP-CIDR", "IP-CIDR6"):
+            cidrs.append(arg)
+    return domains, cidrs
+
+def round_trip(behavior, payload):
+    """Problems found encoding `payload`, decoding it (both zstd paths) and comparing."""
+    data = encode(behavior, payload)
+    problems = []
+    for label, blob in (("encoded", data), ("raw blocks", zstd_raw(zstd_decompress(data)))):
+        got_behavior, count, value = decode(blob)
+        if behavior == "domain":
+            expected, valid = domain_keys(payload)
+            got = value.keys()
+            expected = sorted(expected)
+            missing = [d for d in payload if not d.startswith((".", "*")) and d.lstrip("+.") not in value]
+            if missing:
+                problems.append(f"{label} domain set does not match {missing[:5]}")
+        else:
+            # Compared as stored: IPv4-mapped IPv6 ranges come back as IPv4
+            expected, valid = cidr_ranges(payload)
+            expected = [(as16(first), as16(last)) for first, last in expected]
+            got = [(as16(first), as16(last)) for first, last in value]
+        if (got_behavior, count) != (behavior, valid):
+            problems.append(f"{label} {behavior}: header says {got_behavior}/{count}, expected {behavior}/{valid}")
+        if got != expected:
+            problems.append(f"{label} {behavior}: {len(got)} entries decoded, expected {len(expected)}")
+    return problems
+
+def self_test():
+    domains, cidrs = template_payloads()
+    problems = (round_trip("domain", domains + SELF_TEST_DOMAINS)
+                + round_trip("ipcidr", cidrs + SELF_TEST_CIDRS))
+    for problem in problems:
+        logging.error(f"❌ {problem}")
+    if problems:
+        raise SystemExit(1)
+    logging.info(f"✅ mrs round-trip of {len(domains)} template domains and {len(cidrs)} template CIDRs "
+                 f"{'(zstandard)' if zstandard else '(raw zstd blocks)'}")
+
+# --- CLI -------------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert rule-set payloads to and from mihomo's mrs format")
+    parser.add_argument("--self-test", action="store_true",
+                        help="encode and decode rule-sets built from the template's rules and check they match")
+    sub = parser.add_subparsers(dest="command")
+    enc = sub.add_parser("encode", help="text payload (one rule per line) -> .mrs")
+    enc.add_argument("behavior", choices=BEHAVIORS)
+    enc.add_argument("source")
+    enc.add_argument("target")
+    dec = sub.add_parser("decode", help="print the rules stored in an .mrs file")
+    dec.add_argument("source")
+    args = parser.parse_args(argv)
+    if not args.self_test and args.command is None:
+        parser.error("a command (encode, decode) or --self-test is required")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.self_test:
+        self_test()
+        return
+    if args.command == "encode":
+        with open(args.source, "r", encoding="utf-8") as f:
+            payload = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        data = encode(args.behavior, payload)
+        with open(args.target, "wb") as f:
+            f.write(data)
+        logging.info(f"📦 {args.target}: {len(payload)} rules, {len(data)} bytes"
+                     f"{'' if zstandard else ' (zstandard not installed, stored uncompressed)'}")
+        return
+    with open(args.source, "rb") as f:
+        behavior, count, value = decode(f.read())
+    print(f"# behavior: {behavior}, rules: {count}", file=sys.stderr)
+    for line in value.keys() if behavior == "domain" else range_networks(value):
+        print(line)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    main()
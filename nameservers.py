@@ -0,0 +1,146 @@
+"""Transport-aware classification and deduplication of nameserver entries.
+
+Every dns_list.txt value is parsed into an Endpoint (transport, host, port,
+path) so that spellings of the same upstream collapse into one:
+`1.1.1.1`, `udp://1.1.1.1` and `udp://1.1.1.1:53` are all plain DNS to
+1.1.1.1:53, while `tcp://1.1.1.1` stays a separate transport. A bare name
+listed under `dot` is written out as `tls://name`; left bare, the client
+would query it over plain UDP.
+
+Clash queries every nameserver at once, so normalize() can also cap a
+provider's fan-out at N endpoints, or at N endpoints per host so one server
+is not queried over several transports at once. Both pick by a preferred
+transport order; the total cap favours hosts not already covered.
+"""
+import ipaddress
+import urllib.parse
+
+DEFAULT_PORTS = {"udp": 53, "tcp": 53, "dot": 853, "doh": 443}
+TRANSPORTS = ("doh", "dot", "udp", "tcp")
+
+class Endpoint:
+    __slots__ = ("value", "transport", "host", "port", "path", "tls")
+
+    def __init__(self, value, transport, host, port, path="", tls=True):
+        self.value = value
+        self.transport = transport
+        self.host = host
+        self.port = port
+        self.path = path
+        self.tls = tls
+
+    def __repr__(self):
+        return f"Endpoint({self.transport}://{self.host}:{self.port}{self.path})"
+
+    @property
+    def key(self):
+        return (self.transport, self.host_key, self.port, self.path, self.tls)
+
+    @property
+    def host_key(self):
+        try:
+            return str(ipaddress.ip_address(self.host))
+        except ValueError:
+            return self.host.lower()
+
+    @property
+    def needs_bootstrap(self):
+        """The client must resolve the host via default-nameserver before using it."""
+        return not is_ip(self.host)
+
+def is_ip(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+def parse_endpoint(value, dtype=None):
+    """Turn a dns_list.txt value into an Endpoint, or None if unsupported."""
+    if "://" not in value:
+        host = value.strip("[]")
+        if is_ip(host):
+            return Endpoint(value, "udp", host, 53)
+        # Bare names listed under `dot` are DoT servers; anything else is plain DNS
+        transport = "dot" if dtype == "dot" else "udp"
+        return Endpoint(value, transport, host, DEFAULT_PORTS[transport])
+
+    url = urllib.parse.urlsplit(value)
+    scheme = url.scheme.lower()
+    transport = {"udp": "udp", "tcp": "tcp", "tls": "dot", "https": "doh", "http": "doh"}.get(scheme)
+    if transport is None or not url.hostname:
+        return None
+    try:
+        port = url.port or (80 if scheme == "http" else DEFAULT_PORTS[transport])
+    except ValueError:
+        return None
+    path = ""
+    if transport == "doh":
+        path = url.path or "/dns-query"
+    if url.query and path:
+        path += "?" + url.query
+    return Endpoint(value, transport, url.hostname, port, path, tls=scheme != "http")
+
+def config_value(ep):
+    """The entry as it should appear in a config: as listed, unless that would change its transport."""
+    if ep.transport == "dot" and "://" not in ep.value:
+        return f"tls://{ep.value}"
+    return ep.value
+
+def by_preference(endpoints, order=TRANSPORTS):
+    rank = {t: i for i, t in enumerate(order)}
+    return sorted(endpoints, key=lambda ep: rank.get(ep.transport, len(rank)))
+
+def select(endpoints, limit, order=TRANSPORTS):
+    """Up to `limit` endpoints by transport preference, one per host first; input order kept."""
+    preferred = by_preference(endpoints, order)
+    chosen = []
+    hosts = set()
+    for distinct in (True, False):
+        for ep in preferred:
+            if len(chosen) >= limit:
+                break
+            if ep in chosen or (distinct and ep.host_key in hosts):
+                continue
+            chosen.append(ep)
+            hosts.add(ep.host_key)
+    return [ep for ep in endpoints if ep in chosen]
+
+def limit_per_host(endpoints, per_host, order=TRANSPORTS):
+    """At most `per_host` endpoints for each host, by transport preference; input order kept."""
+    counts = {}
+    chosen = []
+    for ep in by_preference(endpoints, order):
+        if counts.get(ep.host_key, 0) < per_host:
+            counts[ep.host_key] = counts.get(ep.host_key, 0) + 1
+            chosen.append(ep)
+    return [ep for ep in endpoints if ep in chosen]
+
+def normalize(pairs, limit=None, order=TRANSPORTS, per_host=None):
+    """Deduplicate (dtype, value) pairs across types.
+
+    Returns (values, bootstrap): the config values to use, and the hosts
+    among them that have to be resolved through default-nameserver first.
+    """
+    items = []
+    seen = set()
+    for dtype, value in pairs:
+        ep = parse_endpoint(value, dtype)
+        key = ep.key if ep is not None else value
+        if key in seen:
+            continue
+        seen.add(key)
+        # Unknown schemes are kept as-is; the client may know them
+        items.append(ep if ep is not None else value)
+    endpoints = [item for item in items if isinstance(item, Endpoint)]
+    if per_host:
+        kept = limit_per_host(endpoints, per_host, order)
+        items = [item for item in items if not isinstance(item, Endpoint) or item in kept]
+        endpoints = kept
+    if limit:
+        chosen = select(endpoints, max(0, limit - (len(items) - len(endpoints))), order)
+        items = [item for item in items if not isinstance(item, Endpoint) or item in chosen]
+        endpoints = chosen
+    values = [config_value(item) if isinstance(item, Endpoint) else item for item in items]
+    bootstrap = list(dict.fromkeys(ep.host for ep in endpoints if ep.needs_bootstrap))
+    return values, bootstrap
@@ -0,0 +1,230 @@
+"""Small YAML patches that generate the hand-maintained root configs.
+
+Every file in OVERLAY_DIR is a patch over DNS_for_Clash.meta_Template.yml and
+produces the root config of the same name (overlays/DNS_Shecan.yml ->
+DNS_Shecan.yml). Keys in a patch mapping work like this:
+
+    key: value        merge into a mapping, replace anything else
+    key!: value       replace, even a mapping
+    key+: [...]       append to a list
+    key-: [...]       drop list items equal to an entry, or named `entry`
+    key@: {name: p}   merge patch p into the list item named `name` (null drops it)
+    -: [key, ...]     delete keys from this mapping
+    ^: {key: after}   put key right after `after` in this mapping (null: first)
+
+The generator renders overlays on every run, re-dumping only the template
+sections a patch touches:
+
+    python overlays.py                       # write the root configs
+    python overlays.py --check               # exit 1 if a checked-in copy drifted
+    python overlays.py --extract DNS_X.yml   # turn a hand-edited config into an overlay
+"""
+import os
+import difflib
+import logging
+import argparse
+
+import yaml
+
+import generate_dns_configs as gdc
+
+OVERLAY_DIR = "overlays"
+HEADER = "# Generated from {template} + {overlay} by overlays.py; edit the overlay, not this file.\n"
+HEALTH_NOTE = "# Left out as down by the health monitor: {servers}\n"
+SERVER_KEYS = ("default-nameserver", "nameserver", "direct-nameserver", "proxy-server-nameserver", "fallback")
+
+def named(items, name):
+    for i, item in enumerate(items):
+        if isinstance(item, dict) and item.get("name") == name:
+            return i
+    return None
+
+def apply(base, patch, path=""):
+    """Return `base` with `patch` applied; untouched subtrees are shared, not copied."""
+    if not isinstance(patch, dict):
+        raise ValueError(f"{path or 'overlay'}: a patch must be a mapping")
+    out = dict(base)
+    for key, value in patch.items():
+        if key == "-":
+            for name in value:
+                out.pop(name, None)
+            continue
+        if key == "^":
+            continue
+        op = key[-1] if key[-1:] in ("!", "+", "-", "@") else ""
+        name = key[:-1] if op else key
+        where = f"{path}.{name}" if path else name
+        current = out.get(name)
+        if op == "!":
+            out[name] = value
+        elif op in ("+", "-", "@"):
+            if not isinstance(current, list):
+                raise ValueError(f"{where}: `{key}` needs a list in the template, found {type(current).__name__}")
+            if op == "+":
+                out[name] = current + list(value)
+            elif op == "-":
+                out[name] = [item for item in current
+                             if item not in value and not (isinstance(item, dict) and item.get("name") in value)]
+            else:
+                items = list(current)
+                for item_name, item_patch in value.items():
+                    i = named(items, item_name)
+                    if i is None:
+                        raise ValueError(f"{where}: no item named {item_name!r}")
+                    if item_patch is None:
+                        del items[i]
+                    else:
+                        items[i] = apply(items[i], item_patch, f"{where}[{item_name}]")
+                out[name] = items
+        elif isinstance(current, dict) and isinstance(value, dict):
+            out[name] = apply(current, value, where)
+        else:
+            out[name] = value
+    for name, after in (patch.get("^") or {}).items():
+        out = place(out, name, after, path)
+    return out
+
+def place(mapping, name, after, path=""):
+    """`mapping` with `name` moved right after the key `after`, or first if that is None."""
+    where = f"{path}.{name}" if path else name
+    if name not in mapping or (after is not None and after not in mapping):
+        raise ValueError(f"{where}: cannot place it after {after!r}, one of them is missing")
+    items = [(k, v) for k, v in mapping.items() if k != name]
+    i = 0 if after is None else [k for k, _ in items].index(after) + 1
+    items.insert(i, (name, mapping[name]))
+    return dict(items)
+
+def extract(base, target):
+    """The patch that turns `base` into `target`, key order included."""
+    patch = {}
+    for key, value in target.items():
+        if key in base and base[key] == value:
+            continue
+        current = base.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            patch[key] = extract(current, value)
+        elif (isinstance(current, list) and isinstance(value, list) and current and len(current) == len(value)
+              and all(isinstance(a, dict) and isinstance(b, dict) and "name" in a and a.get("name") == b.get("name")
+                      for a, b in zip(current, value))):
+            patch[f"{key}@"] = {b["name"]: extract(a, b) for a, b in zip(current, value) if a != b}
+        else:
+            patch[key] = value
+    removed = [key for key in base if key not in target]
+    if removed:
+        patch["-"] = removed
+    # New keys land at the end unless told otherwise
+    if list(apply(base, patch)) != list(target):
+        keys = list(target)
+        patch["^"] = {key: keys[i - 1] if i else None for i, key in enumerate(keys) if key not in base}
+    return patch
+
+def overlay_paths(overlay_dir=OVERLAY_DIR):
+    if not os.path.isdir(overlay_dir):
+        return []
+    return [os.path.join(overlay_dir, name) for name in sorted(os.listdir(overlay_dir))
+            if name.lower().endswith((".yml", ".yaml"))]
+
+def load_patch(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=gdc.SafeLoader) or {}
+
+def without_dead(merged, dead):
+    """`merged` with down servers dropped from its dns lists, and the servers dropped."""
+    dns = merged.get("dns")
+    if not dead or not isinstance(dns, dict):
+        return merged, []
+    dns = dict(dns)
+    dropped = []
+    for key in SERVER_KEYS:
+        if isinstance(dns.get(key), list):
+            kept = gdc.drop_dead(dns[key], dead)
+            dropped += [v for v in dns[key] if v not in kept]
+            dns[key] = kept
+    return dict(merged, dns=dns), gdc.dictator(dropped)
+
+def render(renderer, patch, header="", dead=()):
+    """Dump the patched template, reusing the renderer's text for untouched sections."""
+    tpl = renderer.tpl
+    merged, dropped = without_dead(apply(tpl, patch), dead)
+    if dropped:
+        header += HEALTH_NOTE.format(servers=", ".join(dropped))
+    sections = dict(zip(tpl, renderer.sections))
+    parts = [header]
+    for key, value in merged.items():
+        if key in tpl and value is tpl[key] and sections[key] is not None:
+            parts.append(sections[key])
+        else:
+            parts.append(gdc.dump_yaml({key: value}, renderer.emitter))
+    return "".join(parts)
+
+def build_all(tpl, emitter="pyyaml", overlay_dir=OVERLAY_DIR, dead=()):
+    """Return {root config path: text} for every overlay, leaving out `dead` servers."""
+    renderer = gdc.TemplateRenderer(tpl, emitter)
+    outputs = {}
+    for path in overlay_paths(overlay_dir):
+        header = HEADER.format(template=gdc.TEMPLATE_FILE, overlay=path.replace(os.sep, "/"))
+        try:
+            outputs[os.path.basename(path)] = render(renderer, load_patch(path), header, dead)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f"{path}: {e}") from e
+    return outputs
+
+def write_all(tpl, emitter="pyyaml", overlay_dir=OVERLAY_DIR, dead=()):
+    outputs = build_all(tpl, emitter, overlay_dir, dead)
+    changed = [path for path, text in outputs.items() if gdc.atomic_write(path, text)]
+    for path in changed:
+        logging.info(f"🧩 {path} regenerated from its overlay")
+    return outputs, changed
+
+def drifted(tpl, emitter="pyyaml", overlay_dir=OVERLAY_DIR):
+    """Yield (path, unified diff) for root configs that differ from their overlay's output."""
+    for path, text in build_all(tpl, emitter, overlay_dir).items():
+        current = gdc.read_text(path)
+        if current != text:
+            diff = difflib.unified_diff((current or "").splitlines(keepends=True), text.splitlines(keepends=True),
+                                        f"{path} (checked in)", f"{path} (from overlay)")
+            yield path, "".join(diff)
+
+def check(tpl, emitter="pyyaml", overlay_dir=OVERLAY_DIR):
+    """Log every drifted root config; returns their paths."""
+    paths = []
+    for path, diff in drifted(tpl, emitter, overlay_dir):
+        logging.error(f"❌ {path} does not match {overlay_dir}/{path}; run python overlays.py\n{diff}")
+        paths.append(path)
+    return paths
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the root DNS_*.yml configs from template overlays")
+    parser.add_argument("--dir", default=OVERLAY_DIR, help="overlay directory (default: %(default)s)")
+    parser.add_argument("--emitter", choices=gdc.EMITTERS, default="auto", help="YAML serializer (see generate_dns_configs.py)")
+    parser.add_argument("--check", action="store_true", help="write nothing, exit 1 if a root config drifted")
+    parser.add_argument("--extract", nargs="+", metavar="FILE", help="write an overlay capturing how FILE differs from the template")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    emitter = gdc.resolve_emitter(args.emitter)
+    tpl = gdc.load_template()
+    if args.extract:
+        os.makedirs(args.dir, exist_ok=True)
+        for path in args.extract:
+            if os.path.basename(path) == gdc.TEMPLATE_FILE:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                target = yaml.load(f, Loader=gdc.SafeLoader) or {}
+            patch = extract(tpl, target)
+            out = os.path.join(args.dir, os.path.basename(path))
+            gdc.atomic_write(out, gdc.dump_yaml(patch, emitter))
+            logging.info(f"🧩 {out}: {len(patch)} top-level changes from {path}")
+        return
+    if args.check:
+        drift = check(tpl, emitter, args.dir)
+        if drift:
+            raise SystemExit(1)
+        logging.info(f"✅ {len(overlay_paths(args.dir))} root configs match their overlays")
+        return
+    outputs, changed = write_all(tpl, emitter, args.dir)
+    logging.info(f"🧩 {len(outputs)} root configs from {args.dir}/, {len(changed)} changed")
+
+if __name__ == "__main__":
+    main()
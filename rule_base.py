@@ -0,0 +1,288 @@
+"""Compile clash_rule_base.ini into the YAML rule base.
+
+clash_rule_base.ini (subconverter `[custom]` syntax) is the single source for
+routing: its `ruleset=` lines become `rules:`, its `custom_proxy_group=` lines
+become `proxy-groups:`, and every `RULE-SET` it references must be defined
+under `rule-providers:` in clash_rule_base.yml. The compiled sections are
+spliced into clash_rule_base.yml and the template, leaving the rest of each
+file untouched:
+
+    python rule_base.py              # recompile if the .ini changed
+    python rule_base.py --refresh    # also re-download remote ruleset lists
+
+`ruleset=Group,https://...list` lines are inlined the way subconverter does.
+Downloads are cached in RULESET_CACHE, and each block of consecutive
+`ruleset=` lines is cached by content hash, so only edited blocks are
+recompiled. The generator calls ensure_compiled() before loading the
+template.
+"""
+import os
+import json
+import hashlib
+import logging
+import argparse
+
+import yaml
+
+import generate_dns_configs as gdc
+import rule_providers
+
+INI_FILE = "clash_rule_base.ini"
+BASE_FILE = "clash_rule_base.yml"
+TARGETS = (BASE_FILE, gdc.TEMPLATE_FILE)
+STAMP_PREFIX = f"# Compiled from {INI_FILE} by rule_base.py, do not edit: "
+SECTIONS = ("rule-providers", "proxy-groups", "rules")
+
+class IndentedDumper(gdc.NoAliasDumper):
+    """Indents sequences under their key, matching the hand-written files."""
+
+    def increase_indent(self, flow=False, indentless=False):
+        return super().increase_indent(flow, False)
+
+def cache_path_for(ini):
+    head, tail = os.path.split(ini)
+    return os.path.join(head, f".{tail}.cache.json")
+
+def sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def read_ini(path=INI_FILE):
+    """Return (ruleset blocks, proxy group lines) from the [custom] section.
+
+    A block is a list of `ruleset=` values with no blank or comment line
+    between them.
+    """
+    blocks = [[]]
+    groups = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("ruleset="):
+                blocks[-1].append(line[len("ruleset="):])
+                continue
+            if blocks[-1]:
+                blocks.append([])
+            if line.startswith("custom_proxy_group="):
+                groups.append(line[len("custom_proxy_group="):])
+    return [b for b in blocks if b], groups
+
+def remote_list(url, cache_dir=rule_providers.RULESET_CACHE, refresh=False, timeout=30):
+    """Lines of a remote ruleset list, downloaded once and then read from the cache."""
+    name = f"{rule_providers.slug(os.path.basename(url))}-{sha256(url)[:8]}.list"
+    cache = os.path.join(cache_dir, name)
+    if refresh or not os.path.exists(cache):
+        data = rule_providers.HttpFetcher(timeout).fetch(name, {"url": url})
+        os.makedirs(cache_dir, exist_ok=True)
+        gdc.write_durable(cache, data.decode("utf-8-sig"))
+    with open(cache, "rb") as f:
+        return rule_providers.parse_payload(f.read(), "text")
+
+def compile_ruleset(value, lines=None):
+    """Rules for one `ruleset=` value; `lines` holds a remote list's content."""
+    group, spec = [p.strip() for p in value.split(",", 1)]
+    if not spec.startswith("[]"):
+        rules = []
+        for line in lines:
+            parts = [p.strip() for p in line.split(",")]
+            if len(parts) < 2:
+                continue
+            rules.append(",".join(parts[:2] + [group] + parts[2:]))
+        return rules
+    parts = [p.strip() for p in spec[2:].split(",")]
+    if parts[0] in ("FINAL", "MATCH"):
+        return [f"MATCH,{group}"]
+    return [",".join(parts[:2] + [group] + parts[2:])]
+
+def compile_block(block, cache, refresh=False):
+    """Rules for a block, reused from `cache` when neither it nor its lists changed."""
+    remote = {}
+    for value in block:
+        spec = value.split(",", 1)[1].strip()
+        if not spec.startswith("[]"):
+            remote[spec] = remote_list(spec, refresh=refresh)
+    key = sha256("\n".join(block) + "\0" + json.dumps(remote, sort_keys=True))
+    if key not in cache:
+        rules = []
+        for value in block:
+            spec = value.split(",", 1)[1].strip()
+            rules.extend(compile_ruleset(value, remote.get(spec)))
+        cache[key] = rules
+    return key, cache[key]
+
+def compile_group(value):
+    """`Name`type`[]member`...`[url`interval[,timeout][,tolerance]]` to a proxy-group."""
+    fields = value.split("`")
+    group = {"name": fields[0], "type": fields[1]}
+    proxies = []
+    rest = []
+    for field in fields[2:]:
+        if field.startswith("[]"):
+            proxies.append(field[2:])
+        else:
+            rest.append(field)
+    group["proxies"] = proxies
+    if rest and rest[0].startswith("http"):
+        group["url"] = rest.pop(0)
+        if rest:
+            interval, _, tail = rest.pop(0).partition(",")
+            timeout, _, tolerance = tail.partition(",")
+            if interval:
+                group["interval"] = int(interval)
+            if timeout:
+                group["timeout"] = int(timeout)
+            if tolerance:
+                group["tolerance"] = int(tolerance)
+    for pattern in rest:
+        logging.warning(f"⚠️ {fields[0]}: proxy filter '{pattern}' ignored, configs carry no proxy nodes")
+    return group
+
+def load_providers(path=BASE_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return (yaml.load(f, Loader=gdc.SafeLoader) or {}).get("rule-providers") or {}
+
+def source_stamp(ini=INI_FILE, base=BASE_FILE):
+    """Hash of everything the compiled sections depend on, except remote lists."""
+    with open(ini, "r", encoding="utf-8") as f:
+        text = f.read()
+    return sha256(text + "\0" + json.dumps(load_providers(base), sort_keys=True, ensure_ascii=False))
+
+def compile_sections(ini=INI_FILE, base=BASE_FILE, refresh=False):
+    """Return {section: value} compiled from the .ini and the base's provider definitions."""
+    cache_file = cache_path_for(ini)
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    blocks, group_lines = read_ini(ini)
+    previous = set(cache)
+    rules = []
+    used = {}
+    for block in blocks:
+        key, block_rules = compile_block(block, cache, refresh)
+        used[key] = block_rules
+        rules.extend(block_rules)
+    gdc.atomic_write(cache_file, json.dumps(used, ensure_ascii=False))
+
+    providers = load_providers(base)
+    missing = gdc.dictator(rule_providers.parse_rule(r)[1] for r in rules
+                           if r.startswith("RULE-SET,") and rule_providers.parse_rule(r)[1] not in providers)
+    if missing:
+        raise ValueError(f"{INI_FILE} references rule-providers missing from {base}: {', '.join(missing)}")
+    logging.info(f"🧱 Compiled {len(rules)} rules and {len(group_lines)} proxy-groups "
+                 f"from {ini} ({len(set(used) - previous)}/{len(blocks)} ruleset blocks recompiled)")
+    return {"rule-providers": providers,
+            "proxy-groups": [compile_group(line) for line in group_lines],
+            "rules": rules}
+
+def section_spans(lines):
+    """{top-level key: (start, end)} line spans of each block in a YAML file."""
+    spans = {}
+    key = start = None
+    for i, line in enumerate(lines):
+        if line[:1] in ("", " ", "\t", "\n", "#", "-"):
+            continue
+        if key is not None:
+            spans[key] = (start, block_end(lines, start, i))
+        key, start = line.split(":", 1)[0].strip("'\""), i
+    if key is not None:
+        spans[key] = (start, block_end(lines, start, len(lines)))
+    return spans
+
+def block_end(lines, start, end):
+    # Blank lines and comments right before the next key belong to that key
+    while end > start + 1 and (not lines[end - 1].strip() or lines[end - 1].startswith("#")):
+        end -= 1
+    return end
+
+def section_text(text, keys=SECTIONS):
+    """The compiled blocks as they currently appear in `text`, without the stamp line."""
+    lines = [line for line in text.splitlines(keepends=True) if not line.startswith(STAMP_PREFIX)]
+    spans = section_spans(lines)
+    return "".join("".join(lines[spans[key][0]:spans[key][1]]) for key in keys if key in spans)
+
+def file_stamp(source, text):
+    # The sources' hash plus the hash of the blocks written, so hand edits to either show up
+    return f"{source} {sha256(section_text(text))}"
+
+def splice(text, sections, stamp):
+    """Replace the top-level `sections` blocks in `text`, keeping everything else as-is."""
+    lines = [line for line in text.splitlines(keepends=True) if not line.startswith(STAMP_PREFIX)]
+    spans = section_spans(lines)
+    for key in sorted(sections, key=lambda k: spans.get(k, (len(lines),))[0], reverse=True):
+        block = yaml.dump({key: sections[key]}, Dumper=IndentedDumper, allow_unicode=True,
+                          sort_keys=False, default_flow_style=False)
+        if key == "rules":
+            block = f"{STAMP_PREFIX}{stamp}\n" + block
+        if key in spans:
+            start, end = spans[key]
+            lines[start:end] = [block]
+        else:
+            if lines and not lines[-1].endswith("\n"):
+                lines[-1] += "\n"
+            lines.append(block)
+    return "".join(lines)
+
+def read_stamp(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(STAMP_PREFIX):
+                return line[len(STAMP_PREFIX):].strip()
+    return None
+
+def stale_targets(targets=TARGETS, ini=INI_FILE, base=BASE_FILE):
+    """Targets compiled from other sources, or whose compiled sections were edited since."""
+    source = source_stamp(ini, base)
+    return [path for path in targets if read_stamp(path) != file_stamp(source, gdc.read_text(path) or "")]
+
+def is_stale(targets=TARGETS, ini=INI_FILE, base=BASE_FILE):
+    return bool(stale_targets(targets, ini, base))
+
+def compile_into(targets=TARGETS, ini=INI_FILE, base=BASE_FILE, refresh=False):
+    sections = compile_sections(ini, base, refresh)
+    source = source_stamp(ini, base)
+    for path in targets:
+        text = gdc.read_text(path)
+        compiled = splice(text, sections, source)
+        gdc.atomic_write(path, splice(text, sections, file_stamp(source, compiled)))
+        logging.info(f"📝 Rule base sections written to {path}")
+
+def ensure_compiled(targets=TARGETS, ini=INI_FILE, base=BASE_FILE):
+    """Generator hook: recompile when the .ini or provider definitions changed."""
+    if not os.path.exists(ini) or not is_stale(targets, ini, base):
+        return
+    try:
+        compile_into(targets, ini, base)
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠️ Cannot compile {ini} ({e}), keeping the rule sections already in {', '.join(targets)}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=f"Compile {INI_FILE} into the YAML rule base")
+    parser.add_argument("--ini", default=INI_FILE, help="subconverter rule base (default: %(default)s)")
+    parser.add_argument("--refresh", action="store_true", help="re-download remote ruleset lists")
+    parser.add_argument("--force", action="store_true", help="recompile even if the targets are up to date")
+    parser.add_argument("--check", action="store_true", help="exit 1 if the targets are out of date, write nothing")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.check:
+        stale = stale_targets(ini=args.ini)
+        if stale:
+            logging.error(f"❌ Rule sections in {', '.join(stale)} do not match {args.ini} (edited by hand, "
+                          f"or the sources changed); edit {args.ini} and run python rule_base.py")
+            raise SystemExit(1)
+        logging.info(f"✅ Rule sections match {args.ini}")
+        return
+    if not (args.force or args.refresh or is_stale(ini=args.ini)):
+        logging.info(f"✅ Rule sections already match {args.ini}")
+        return
+    try:
+        compile_into(ini=args.ini, refresh=args.refresh)
+    except (OSError, ValueError) as e:
+        logging.error(f"❌ Cannot compile {args.ini}: {e}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""Shadowing and ordering analysis for a Clash `rules:` list.
+
+Rules are matched top to bottom, first match wins. This walks the list once,
+keeping everything matched so far in a suffix trie (DOMAIN / DOMAIN-SUFFIX),
+per-family CIDR interval sets (IP-CIDR) and a set of opaque matchers, and
+reports:
+
+  * shadowed rules - every connection they match was already claimed by an
+    earlier rule, so they can never fire;
+  * resolution-forcing rules (GEOIP / IP-CIDR / ipcidr RULE-SETs without
+    `no-resolve`) placed before domain-only rules, which makes the client
+    resolve every connection before the cheaper domain matches get a chance.
+
+RULE-SETs are opaque by default, so the findings only depend on the tracked
+config. `--expand` also expands the payloads snapshotted locally by
+rule_providers.py, and keeps its accepted findings in a separate baseline,
+since they depend on the snapshots present. `--reorder` writes an equivalent list with shadowed rules
+dropped and resolution-forcing rules moved below the following rules that
+share their target (swapping same-target neighbours never changes the result).
+
+    python rule_lint.py                         # analyze the template
+    python rule_lint.py --config clash_rule_base.yml
+    python rule_lint.py --reorder rules.yml
+    python rule_lint.py --update-baseline       # accept the current findings
+    python rule_lint.py --expand                # also look inside snapshotted rule-sets
+    python rule_lint.py --self-test             # check the analyzer on built-in cases
+
+The generator runs the shadowing check on every build and fails on shadowed
+rules that are not recorded in the baseline.
+"""
+import os
+import json
+import bisect
+import logging
+import argparse
+import ipaddress
+
+import yaml
+
+import generate_dns_configs as gdc
+import rule_providers
+
+BASELINE_FILE = "rule_lint_baseline.json"
+EXPANDED_BASELINE_FILE = "rule_lint_baseline.expanded.json"
+DOMAIN_TYPES = ("DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "GEOSITE")
+IP_TYPES = ("IP-CIDR", "IP-CIDR6", "IP-SUFFIX", "IP-ASN", "GEOIP")
+
+class DomainTrie:
+    """Reversed-label trie of DOMAIN-SUFFIX entries plus a set of exact DOMAINs."""
+
+    def __init__(self):
+        self.root = {}
+        self.exact = set()
+
+    def add_suffix(self, name):
+        node = self.root
+        for label in reversed(name.split(".")):
+            node = node.setdefault(label, {})
+        node[None] = True
+
+    def add_domain(self, name):
+        self.exact.add(name)
+
+    def suffix_covers(self, name):
+        """True if `name` or one of its parents was added as a suffix."""
+        node = self.root
+        for label in reversed(name.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+class IntervalSet:
+    """Sorted, disjoint [start, end] integer intervals per IP version."""
+
+    def __init__(self):
+        self.starts = {4: [], 6: []}
+        self.ends = {4: [], 6: []}
+
+    def add(self, net):
+        starts, ends = self.starts[net.version], self.ends[net.version]
+        lo, hi = int(net.network_address), int(net.broadcast_address)
+        # Absorb every interval that overlaps or touches [lo, hi]
+        i = bisect.bisect_left(ends, lo - 1)
+        j = bisect.bisect_right(starts, hi + 1)
+        if i < j:
+            lo = min(lo, starts[i])
+            hi = max(hi, ends[j - 1])
+        starts[i:j] = [lo]
+        ends[i:j] = [hi]
+
+    def covers(self, net):
+        starts, ends = self.starts[net.version], self.ends[net.version]
+        i = bisect.bisect_right(starts, int(net.network_address)) - 1
+        return i >= 0 and ends[i] >= int(net.broadcast_address)
+
+class Coverage:
+    """Everything matched by the rules seen so far.
+
+    IP matchers are tracked twice: a `no-resolve` matcher only sees
+    connections that already carry an IP, so it cannot shadow a later
+    matcher that resolves domains.
+    """
+
+    def __init__(self):
+        self.domains = DomainTrie()
+        self.cidrs = {False: IntervalSet(), True: IntervalSet()}
+        self.opaque = set()
+        self.match_all = False
+
+    def covers(self, atom):
+        kind, value, resolve = atom
+        if self.match_all:
+            return True
+        if kind == "domain":
+            return value in self.domains.exact or self.domains.suffix_covers(value)
+        if kind in ("suffix", "wildcard") and self.domains.suffix_covers(value):
+            return True
+        if kind == "cidr":
+            return self.cidrs[resolve].covers(value)
+        return (kind, value, resolve) in self.opaque
+
+    def add(self, atom):
+        kind, value, resolve = atom
+        if kind == "domain":
+            self.domains.add_domain(value)
+        elif kind == "suffix":
+            self.domains.add_suffix(value)
+        elif kind == "cidr":
+            self.cidrs[False].add(value)
+            if resolve:
+                self.cidrs[True].add(value)
+        elif kind == "match":
+            self.match_all = True
+        else:
+            self.opaque.add((kind, value, resolve))
+            if resolve:
+                self.opaque.add((kind, value, False))
+
+class Finding:
+    __slots__ = ("index", "rule", "kind", "detail")
+
+    def __init__(self, index, rule, kind, detail):
+        self.index = index
+        self.rule = rule
+        self.kind = kind
+        self.detail = detail
+
+    def __str__(self):
+        return f"rules[{self.index}] {self.rule}: {self.detail}"
+
+def rule_atoms(rtype, arg, options):
+    """Matchers for one plain rule, as (kind, value, resolves) triples."""
+    resolve = rtype in IP_TYPES and "no-resolve" not in options
+    if rtype == "MATCH":
+        return [("match", None, False)]
+    if rtype == "DOMAIN":
+        return [("domain", arg.lower().rstrip("."), False)]
+    if rtype == "DOMAIN-SUFFIX":
+        return [("suffix", arg.lower().lstrip(".").rstrip("."), False)]
+    if rtype in ("IP-CIDR", "IP-CIDR6"):
+        try:
+            return [("cidr", ipaddress.ip_network(arg, strict=False), resolve)]
+        except ValueError:
+            pass
+    return [(rtype, arg, resolve)]
+
+def payload_atoms(behavior, payload, options):
+    atoms = []
+    for item in payload:
+        if behavior == "domain":
+            name = item.lower().rstrip(".")
+            if name.startswith("+."):
+                atoms.append(("suffix", name[2:], False))
+            elif name.startswith("*.") or name.startswith("."):
+                # Subdomains only: covered by a suffix on the parent, otherwise opaque
+                atoms.append(("wildcard", name.lstrip("*."), False))
+            else:
+                atoms.append(("domain", name, False))
+        elif behavior == "ipcidr":
+            atoms.extend(rule_atoms("IP-CIDR", item, options))
+        else:
+            parts = [p.strip() for p in item.split(",")]
+            if parts[0] in rule_providers.LOGIC_TYPES:
+                atoms.append(("logic", item, False))
+            elif len(parts) > 1:
+                atoms.extend(rule_atoms(parts[0], parts[1], tuple(parts[2:]) + options))
+    return atoms
+
+def classify(rule, providers, payloads):
+    """Return (atoms, kind) for a rule; kind is resolve, domain, other or unknown."""
+    rtype, arg, target, options = rule_providers.parse_rule(rule)
+    if rtype in rule_providers.LOGIC_TYPES:
+        # Not modelled: a logic rule only covers (and is covered by) the same rule
+        return [("logic", rule, False)], "other"
+    if rtype != "RULE-SET":
+        atoms = rule_atoms(rtype, arg, options)
+    elif arg in payloads:
+        behavior = (providers.get(arg) or {}).get("behavior", "classical")
+        atoms = payload_atoms(behavior, payloads[arg], options)
+    else:
+        behavior = (providers.get(arg) or {}).get("behavior")
+        if behavior == "ipcidr":
+            return [("RULE-SET", arg, "no-resolve" not in options)], \
+                "other" if "no-resolve" in options else "resolve"
+        kind = "domain" if behavior == "domain" else "unknown"
+        return [("RULE-SET", arg, False)], kind
+
+    if any(resolve for _, _, resolve in atoms):
+        return atoms, "resolve"
+    if atoms and all(k in ("domain", "suffix", "wildcard") or k in DOMAIN_TYPES for k, _, _ in atoms):
+        return atoms, "domain"
+    return atoms, "other"
+
+def analyze(rules, providers=None, payloads=None):
+    """Walk `rules` in order; returns (findings, kinds) with one kind per rule."""
+    providers = providers or {}
+    payloads = payloads or {}
+    coverage = Coverage()
+    findings = []
+    kinds = []
+    first_rule = {}
+    for index, rule in enumerate(rules):
+        atoms, kind = classify(rule, providers, payloads)
+        kinds.append(kind)
+        if atoms and all(coverage.covers(atom) for atom in atoms):
+            earlier = first_rule.get(rule)
+            detail = (f"duplicate of rules[{earlier}]" if earlier is not None
+                      else "every match is claimed by earlier rules")
+            findings.append(Finding(index, rule, "shadowed", detail))
+        for atom in atoms:
+            coverage.add(atom)
+        first_rule.setdefault(rule, index)
+
+    # Report each resolution-forcing rule that still has domain-only rules below it
+    domain_below = 0
+    for index in range(len(rules) - 1, -1, -1):
+        if kinds[index] == "resolve" and domain_below:
+            findings.append(Finding(index, rules[index], "resolve-early",
+                                    f"forces DNS resolution before {domain_below} domain-only rules"))
+        elif kinds[index] == "domain":
+            domain_below += 1
+    findings.sort(key=lambda f: f.index)
+    return findings, kinds
+
+def reorder(rules, findings, kinds):
+    """Equivalent list: shadowed rules removed and resolution-forcing rules sunk
+    past the non-resolving rules that follow them with the same target."""
+    shadowed = {f.index for f in findings if f.kind == "shadowed"}
+    items = [(rule, kind, rule_providers.parse_rule(rule)[2])
+             for i, (rule, kind) in enumerate(zip(rules, kinds)) if i not in shadowed]
+    for i in range(len(items) - 2, -1, -1):
+        if items[i][1] != "resolve":
+            continue
+        j = i
+        while (j + 1 < len(items) and items[j + 1][1] != "resolve"
+               and items[j + 1][2] == items[j][2] and items[j][2] is not None):
+            items[j], items[j + 1] = items[j + 1], items[j]
+            j += 1
+    return [rule for rule, _, _ in items]
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("shadowed", [])
+
+def save_baseline(findings, path=BASELINE_FILE):
+    shadowed = [f.rule for f in findings if f.kind == "shadowed"]
+    gdc.atomic_write(path, json.dumps({"shadowed": shadowed}, indent=2, ensure_ascii=False) + "\n")
+
+def new_shadowed(findings, baseline):
+    """Shadowed findings not accounted for by the baseline (compared as a multiset)."""
+    allowed = {}
+    for rule in baseline:
+        allowed[rule] = allowed.get(rule, 0) + 1
+    fresh = []
+    for f in findings:
+        if f.kind != "shadowed":
+            continue
+        if allowed.get(f.rule):
+            allowed[f.rule] -= 1
+        else:
+            fresh.append(f)
+    return fresh
+
+def analyze_config(config, cache_dir=None):
+    """Analyze a config's rules, expanding the rule-sets snapshotted in `cache_dir` if given."""
+    providers = config.get("rule-providers") or {}
+    rules = config.get("rules") or []
+    payloads = rule_providers.load_snapshot(providers, cache_dir) if cache_dir else {}
+    findings, kinds = analyze(rules, providers, payloads)
+    return rules, findings, kinds, len(payloads)
+
+def check(config, baseline_path=BASELINE_FILE):
+    """Generator hook: log the findings and return the newly shadowed rules.
+
+    Rule-sets stay opaque here, so every checkout gets the same result.
+    """
+    rules, findings, _, _ = analyze_config(config)
+    early = [f for f in findings if f.kind == "resolve-early"]
+    if early:
+        logging.info(f"🐢 {len(early)} rules force DNS resolution before domain-only rules "
+                     f"(python rule_lint.py --reorder FILE writes a faster equivalent list)")
+    fresh = new_shadowed(findings, load_baseline(baseline_path))
+    for f in fresh:
+        logging.error(f"❌ Shadowed rule {f}")
+    return fresh
+
+SELF_TEST_RULES = [
+    "DOMAIN-SUFFIX,example.com,Proxy",
+    "AND,((DOMAIN,a.example.org),(NETWORK,UDP)),REJECT",
+    "AND,((DOMAIN,b.example.org),(NETWORK,TCP)),REJECT",
+    "DOMAIN,www.example.com,DIRECT",
+    "AND,((DOMAIN,a.example.org),(NETWORK,UDP)),REJECT",
+    "IP-CIDR,10.0.0.0/8,DIRECT,no-resolve",
+    "MATCH,Proxy",
+]
+# (index, detail) of every shadowed rule the analyzer must report, and nothing else
+SELF_TEST_SHADOWED = [(3, "every match is claimed by earlier rules"), (4, "duplicate of rules[1]")]
+
+def self_test():
+    findings, kinds = analyze(SELF_TEST_RULES)
+    shadowed = [(f.index, f.detail) for f in findings if f.kind == "shadowed"]
+    problems = []
+    if shadowed != SELF_TEST_SHADOWED:
+        problems.append(f"shadowed {shadowed}, expected {SELF_TEST_SHADOWED}")
+    parsed = rule_providers.parse_rule(SELF_TEST_RULES[1])
+    if parsed != ("AND", "((DOMAIN,a.example.org),(NETWORK,UDP))", "REJECT", ()):
+        problems.append(f"logic rule parsed as {parsed}")
+    for problem in problems:
+        logging.error(f"❌ {problem}")
+    if problems:
+        raise SystemExit(1)
+    logging.info(f"✅ rule_lint self-test passed ({len(SELF_TEST_RULES)} rules)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Report shadowed and resolution-forcing rules in a Clash config")
+    parser.add_argument("--config", default=gdc.TEMPLATE_FILE, help="config with rules:/rule-providers: (default: %(default)s)")
+    parser.add_argument("--expand", action="store_true",
+                        help=f"expand rule-sets snapshotted in --cache; findings are checked against "
+                             f"{EXPANDED_BASELINE_FILE} unless --baseline is given")
+    parser.add_argument("--cache", default=rule_providers.RULESET_CACHE,
+                        help="rule-set snapshot directory from rule_providers.py (default: %(default)s)")
+    parser.add_argument("--reorder", metavar="FILE", help="write an equivalent reordered `rules:` list to FILE")
+    parser.add_argument("--baseline", help=f"accepted shadowed rules (default: {BASELINE_FILE})")
+    parser.add_argument("--update-baseline", action="store_true", help="record the current shadowed rules as accepted")
+    parser.add_argument("--self-test", action="store_true", help="check the analyzer on built-in rules, including logic rules")
+    args = parser.parse_args(argv)
+    if args.baseline is None:
+        args.baseline = EXPANDED_BASELINE_FILE if args.expand else BASELINE_FILE
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.self_test:
+        self_test()
+        return
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=gdc.SafeLoader) or {}
+    rules, findings, kinds, snapshots = analyze_config(config, args.cache if args.expand else None)
+    if args.expand:
+        logging.info(f"🔎 {len(rules)} rules in {args.config}, {snapshots} rule-sets expanded from {args.cache}/")
+    else:
+        logging.info(f"🔎 {len(rules)} rules in {args.config}, rule-sets not expanded (see --expand)")
+    for f in findings:
+        print(f"{'🚫' if f.kind == 'shadowed' else '🐢'} {f}")
+
+    if args.reorder:
+        reordered = reorder(rules, findings, kinds)
+        gdc.atomic_write(args.reorder, gdc.dump_yaml({"rules": reordered}))
+        logging.info(f"📝 Reordered list ({len(rules)} -> {len(reordered)} rules) written to {args.reorder}")
+
+    if args.update_baseline:
+        save_baseline(findings, args.baseline)
+        logging.info(f"📌 Baseline updated: {args.baseline}")
+        return
+    fresh = new_shadowed(findings, load_baseline(args.baseline))
+    if fresh:
+        logging.error(f"❌ {len(fresh)} shadowed rules not in {args.baseline}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""Offline snapshot and consolidation of the template's rule-providers.
+
+Fetches every `type: http` rule-provider through a pluggable fetcher, caches
+the payloads under RULESET_CACHE, and merges consecutive `RULE-SET` rules
+that send traffic to the same policy group into one deduplicated provider
+per behavior. The merged payloads are written to Generated/Rules and a
+`rule-providers` + `rules` fragment is written for the generator:
+
+    python rule_providers.py                      # fetch over HTTP
+    python rule_providers.py --source ./mirror    # read <name>.yaml from a directory
+    python rule_providers.py --format text        # plain-text rule-sets instead of mrs
+    python generate_dns_configs.py --rules Generated/Rules/rules.yml
+
+Only consecutive rules are merged, so first-match order between different
+groups is unchanged. Providers that fail to fetch are kept as they were.
+
+`domain` and `ipcidr` payloads, merged or snapshotted, are written in the
+binary mrs format (see mrs.py) by default; `classical` ones, which mrs cannot
+hold, fall back to one rule per line with `format: text`.
+"""
+import os
+import re
+import logging
+import argparse
+import ipaddress
+import urllib.parse
+import urllib.request
+
+import yaml
+
+import mrs
+import generate_dns_configs as gdc
+
+RULESET_CACHE = "ruleset_cache"
+RULES_DIR = os.path.join(gdc.README_DIR, "Rules")
+RULES_FRAGMENT = os.path.join(RULES_DIR, "rules.yml")
+MERGE_BEHAVIORS = ("domain", "ipcidr", "classical")
+# Their argument is a parenthesized list of rules, commas included
+LOGIC_TYPES = ("AND", "OR", "NOT", "SUB-RULE")
+DEFAULT_INTERVAL = 86400
+OUTPUT_FORMATS = ("mrs", "text", "yaml")
+EXTENSIONS = {"yaml": "yaml", "text": "txt", "mrs": "mrs"}
+
+def payload_ext(fmt):
+    return EXTENSIONS.get(fmt, "yaml")
+
+class DirectoryFetcher:
+    """Read `<root>/<provider name>.yaml` (or `.txt`/`.mrs` for text/mrs providers)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, name, cfg):
+        ext = payload_ext(cfg.get("format"))
+        with open(os.path.join(self.root, f"{name}.{ext}"), "rb") as f:
+            return f.read()
+
+class HttpFetcher:
+    """Download each provider's `url`, optionally from a mirror serving `<name>.yaml`."""
+
+    def __init__(self, timeout=30, mirror=None):
+        self.timeout = timeout
+        self.mirror = mirror
+
+    def fetch(self, name, cfg):
+        url = cfg["url"]
+        if self.mirror:
+            ext = payload_ext(cfg.get("format"))
+            url = urllib.parse.urljoin(self.mirror.rstrip("/") + "/", urllib.parse.quote(f"{name}.{ext}"))
+        request = urllib.request.Request(url, headers={"User-Agent": "clash.meta"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+            return resp.read()
+
+def parse_payload(data, fmt="yaml"):
+    """Rule lines from a provider file, in YAML (`payload:` list), text or mrs format."""
+    if fmt == "mrs":
+        behavior, _, value = mrs.decode(data)
+        return value.keys() if behavior == "domain" else mrs.range_networks(value)
+    text = data.decode("utf-8-sig")
+    if fmt == "text":
+        return [line.strip() for line in text.splitlines()
+                if line.strip() and not line.lstrip().startswith("#")]
+    doc = yaml.load(text, Loader=gdc.SafeLoader) or {}
+    payload = doc.get("payload") if isinstance(doc, dict) else None
+    return [str(item).strip() for item in payload or [] if str(item).strip()]
+
+def snapshot(providers, fetcher, cache_dir=RULESET_CACHE):
+    """Fetch each http provider; returns {name: payload} for the ones that succeeded.
+
+    Successful downloads are cached; on failure the previous cache is reused.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    payloads = {}
+    for name, cfg in providers.items():
+        if cfg.get("type") != "http":
+            continue
+        fmt = cfg.get("format", "yaml")
+        cache = os.path.join(cache_dir, f"{name}.{payload_ext(fmt)}")
+        try:
+            data = fetcher.fetch(name, cfg)
+            payloads[name] = parse_payload(data, fmt)
+            with open(cache, "wb") as f:
+                f.write(data)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            if os.path.exists(cache):
+                logging.warning(f"⚠️ Fetching rule-provider {name} failed ({e}), using cached snapshot")
+                with open(cache, "rb") as f:
+                    payloads[name] = parse_payload(f.read(), fmt)
+            else:
+                logging.warning(f"⚠️ Fetching rule-provider {name} failed ({e}), leaving it unmerged")
+    return payloads
+
+def load_snapshot(providers, cache_dir=RULESET_CACHE):
+    """Payloads for providers already present in the local cache."""
+    payloads = {}
+    for name, cfg in providers.items():
+        fmt = cfg.get("format", "yaml")
+        cache = os.path.join(cache_dir, f"{name}.{payload_ext(fmt)}")
+        if os.path.exists(cache):
+            with open(cache, "rb") as f:
+                payloads[name] = parse_payload(f.read(), fmt)
+    return payloads
+
+# --- merging ---------------------------------------------------------------
+
+def merge_domains(lists):
+    """Union of domain payloads, dropping entries already covered by a `+.` suffix."""
+    entries = gdc.dictator(item for payload in lists for item in payload)
+    suffixes = {e[2:] for e in entries if e.startswith("+.")}
+    merged = []
+    for entry in entries:
+        name = entry[2:] if entry.startswith("+.") else entry.lstrip("*.") if entry.startswith("*.") else entry
+        labels = name.split(".")
+        # A +.suffix covers the name itself and every subdomain
+        start = 1 if entry.startswith("+.") else 0
+        if any(".".join(labels[i:]) in suffixes for i in range(start, len(labels))):
+            continue
+        merged.append(entry)
+    return merged
+
+def merge_cidrs(lists):
+    networks = {4: [], 6: []}
+    passthrough = []
+    for payload in lists:
+        for item in payload:
+            try:
+                net = ipaddress.ip_network(item, strict=False)
+            except ValueError:
+                passthrough.append(item)
+                continue
+            networks[net.version].append(net)
+    merged = [str(n) for version in (4, 6) for n in ipaddress.collapse_addresses(networks[version])]
+    return merged + gdc.dictator(passthrough)
+
+def merge_payloads(behavior, lists):
+    if behavior == "domain":
+        return merge_domains(lists)
+    if behavior == "ipcidr":
+        return merge_cidrs(lists)
+    return gdc.dictator(item for payload in lists for item in payload)
+
+def parse_rule(rule):
+    """Split a rule into (type, argument, target, options)."""
+    parts = [p.strip() for p in rule.split(",")]
+    if parts[0] == "MATCH":
+        return "MATCH", None, parts[1] if len(parts) > 1 else None, ()
+    if parts[0] in LOGIC_TYPES:
+        rest = rule.split(",", 1)[1].strip() if len(parts) > 1 else ""
+        depth = 0
+        end = len(rest)
+        for i, c in enumerate(rest):
+            if c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+                if depth == 0:
+                    end = i + 1
+                    break
+        tail = [p.strip() for p in rest[end:].split(",")[1:]]
+        return parts[0], rest[:end], tail[0] if tail else None, tuple(tail[1:])
+    if len(parts) < 3:
+        return parts[0], parts[1] if len(parts) > 1 else None, None, ()
+    return parts[0], parts[1], parts[2], tuple(parts[3:])
+
+def slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_") or "group"
+
+def consolidate(providers, rules, payloads):
+    """Merge runs of consecutive RULE-SET rules per (target, options, behavior).
+
+    Returns (new_providers, new_rules, merged) where `merged` maps each new
+    provider name to its (behavior, payload).
+    """
+    new_providers = {}
+    new_rules = []
+    merged = {}
+    used = set()
+
+    def flush(run):
+        target, options = run[0][1], run[0][2]
+        by_behavior = {}
+        for name, _, _ in run:
+            by_behavior.setdefault(providers[name]["behavior"], []).append(name)
+        for behavior, names in by_behavior.items():
+            if len(names) == 1:
+                keep(names[0], target, options)
+                continue
+            base = f"merged_{slug(target)}_{behavior}"
+            new_name = base
+            n = 2
+            while new_name in used:
+                new_name = f"{base}_{n}"
+                n += 1
+            used.add(new_name)
+            payload = merge_payloads(behavior, [payloads[name] for name in names])
+            merged[new_name] = (behavior, payload)
+            logging.info(f"🧬 {new_name}: {len(names)} providers, "
+                         f"{sum(len(payloads[n]) for n in names)} -> {len(payload)} entries")
+            new_rules.append(",".join(("RULE-SET", new_name, target) + options))
+
+    def keep(name, target, options):
+        new_providers.setdefault(name, providers[name])
+        used.add(name)
+        new_rules.append(",".join(("RULE-SET", name, target) + options))
+
+    run = []
+    for rule in rules:
+        rtype, arg, target, options = parse_rule(rule)
+        mergeable = (rtype == "RULE-SET" and arg in payloads
+                     and providers.get(arg, {}).get("behavior") in MERGE_BEHAVIORS)
+        if run and not (mergeable and (target, options) == run[0][1:]):
+            flush(run)
+            run = []
+        if mergeable:
+            run.append((arg, target, options))
+            continue
+        if rtype == "RULE-SET" and arg in providers:
+            new_providers.setdefault(arg, providers[arg])
+            used.add(arg)
+        new_rules.append(rule)
+    if run:
+        flush(run)
+    return new_providers, new_rules, merged
+
+def merged_provider_config(name, behavior, repo, fmt="yaml"):
+    ext = payload_ext(fmt)
+    encoded = urllib.parse.quote(f"{name}.{ext}")
+    cfg = {
+        "type": "http",
+        "behavior": behavior,
+        "url": f"https://raw.githubusercontent.com/{repo}/main/{RULES_DIR}/{encoded}",
+        "interval": DEFAULT_INTERVAL,
+        "path": f"./ruleset/{name}.{ext}",
+    }
+    if fmt != "yaml":
+        cfg["format"] = fmt
+    return cfg
+
+def write_payload(path, behavior, payload, fmt):
+    """Write `payload` as `<path>.<ext>`; returns the format used.
+
+    mrs only holds domain and ipcidr rule-sets; anything else (or a payload
+    with no valid entry) is written as text instead.
+    """
+    if fmt == "mrs":
+        try:
+            data = mrs.encode(behavior, payload)
+        except ValueError as e:
+            logging.info(f"📝 {os.path.basename(path)}: {e}, writing text instead")
+            fmt = "text"
+        else:
+            gdc.atomic_write(f"{path}.mrs", data)
+            return fmt
+    if fmt == "text":
+        gdc.atomic_write(f"{path}.txt", mrs.text_payload(payload))
+    else:
+        gdc.atomic_write(f"{path}.yaml", gdc.dump_yaml({"payload": payload}, "fast"))
+    return fmt
+
+def write_outputs(new_providers, new_rules, merged, out_dir=RULES_DIR, fmt="yaml", payloads=None):
+    """Write merged payload files and the rule-providers/rules fragment.
+
+    With a `fmt` other than yaml, kept providers whose payload is in
+    `payloads` are converted too and served from `out_dir` instead of their
+    upstream url.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    repo = os.environ.get("GITHUB_REPOSITORY", "OWNER/REPO")
+    payloads = payloads or {}
+    fragment_providers = {}
+    for rule in new_rules:
+        rtype, arg, _, _ = parse_rule(rule)
+        if rtype != "RULE-SET" or arg in fragment_providers:
+            continue
+        if arg in merged:
+            behavior, payload = merged[arg]
+            used = write_payload(os.path.join(out_dir, arg), behavior, payload, fmt)
+            fragment_providers[arg] = merged_provider_config(arg, behavior, repo, used)
+        elif arg in new_providers:
+            cfg = new_providers[arg]
+            behavior = cfg.get("behavior")
+            if fmt != "yaml" and arg in payloads and behavior in mrs.BEHAVIORS and cfg.get("format") != fmt:
+                used = write_payload(os.path.join(out_dir, arg), behavior, payloads[arg], fmt)
+                cfg = dict(merged_provider_config(arg, behavior, repo, used), interval=cfg.get("interval", DEFAULT_INTERVAL))
+            fragment_providers[arg] = cfg
+
+    fragment = {"rule-providers": fragment_providers, "rules": new_rules}
+    path = os.path.join(out_dir, os.path.basename(RULES_FRAGMENT))
+    gdc.atomic_write(path, gdc.dump_yaml(fragment))
+    return path
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot and consolidate the template's rule-providers")
+    parser.add_argument("--source", help="read <name>.yaml payloads from this directory instead of HTTP")
+    parser.add_argument("--mirror", help="fetch <name>.yaml from this base URL instead of each provider's url")
+    parser.add_argument("--offline", action="store_true", help=f"only use payloads already in {RULESET_CACHE}/")
+    parser.add_argument("--cache", default=RULESET_CACHE, help="snapshot cache directory (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=30, help="HTTP timeout in seconds")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="mrs",
+                        help="rule-set files to write; classical rule-sets fall back to text (default: %(default)s)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    tpl = gdc.load_template()
+    providers = tpl.get("rule-providers") or {}
+    rules = tpl.get("rules") or []
+
+    if args.offline:
+        payloads = load_snapshot(providers, args.cache)
+    else:
+        fetcher = DirectoryFetcher(args.source) if args.source else HttpFetcher(args.timeout, args.mirror)
+        payloads = snapshot(providers, fetcher, args.cache)
+    logging.info(f"📥 {len(payloads)}/{len(providers)} rule-providers available locally")
+
+    new_providers, new_rules, merged = consolidate(providers, rules, payloads)
+    path = write_outputs(new_providers, new_rules, merged, fmt=args.format, payloads=payloads)
+    logging.info(f"📦 {len(providers)} rule-providers -> {len(new_providers) + len(merged)} "
+                 f"({len(merged)} merged); fragment written to {path}")
+
+if __name__ == "__main__":
+    main()
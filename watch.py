@@ -0,0 +1,264 @@
+"""Watch mode for generate_dns_configs.py: rebuild on every saved edit.
+
+    python generate_dns_configs.py --watch [--debounce 50] [--poll]
+
+The first build is a normal run. After that the parsed template, its
+prerendered sections and the manifest stay in memory. An edit to
+dns_list.txt is re-parsed and diffed against the manifest's per-provider
+hashes, and only providers whose lines changed are re-rendered, published
+and recorded. Edits to the template or any other input (rules, latency,
+fanout, mix profiles, geoip, health, overlays) run a full rebuild over all CPUs
+unless --jobs asks for a specific number. Bursts of events are coalesced
+until --debounce ms pass quietly. Changes are picked up through inotify on
+Linux, or by polling file stamps elsewhere or with --poll.
+"""
+import os
+import time
+import select
+import shutil
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+import yaml
+
+import overlays
+import rule_base
+import generate_dns_configs as gdc
+from config_server import file_stamps
+
+POLL_INTERVAL = 0.25
+
+# inotify(7) event bits; directories are watched so renames onto a file count too
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT = struct.Struct("iIII")
+
+def watched_inputs(args):
+    """(files, directories whose every .yml counts) that feed a build."""
+    paths = [gdc.INPUT_FILE, gdc.TEMPLATE_FILE, rule_base.INI_FILE, rule_base.BASE_FILE, args.mix_profiles,
+             args.fanout, args.geoip, args.latency, args.health, args.rules]
+    return [os.path.normpath(p) for p in paths if p], [overlays.OVERLAY_DIR]
+
+def in_tree(path, trees):
+    return path.endswith((".yml", ".yaml")) and os.path.dirname(path) in trees
+
+class InotifyWatcher:
+    def __init__(self, paths, trees):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = set(paths)
+        self.trees = set(trees)
+        self.dirs = {}
+        for directory in {os.path.dirname(p) for p in paths} | self.trees:
+            if not os.path.isdir(directory or "."):
+                continue
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory or "."), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"cannot watch {directory or '.'}")
+            self.dirs[wd] = directory
+
+    def wait(self, timeout=None):
+        """Watched paths changed since the last call; empty once `timeout` seconds pass quietly."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            path = os.path.normpath(os.path.join(self.dirs.get(wd, ""), name))
+            if path in self.paths or in_tree(path, self.trees):
+                changed.add(path)
+        return changed
+
+    def drain(self):
+        while self.wait(0):
+            pass
+
+class PollingWatcher:
+    def __init__(self, paths, trees, interval=POLL_INTERVAL):
+        self.paths = list(paths)
+        self.trees = list(trees)
+        self.interval = interval
+        self.stamps = self.snapshot()
+
+    def snapshot(self):
+        paths = list(self.paths)
+        for tree in self.trees:
+            if os.path.isdir(tree):
+                paths += [os.path.join(tree, name) for name in os.listdir(tree) if in_tree(os.path.join(tree, name), [tree])]
+        return file_stamps(paths)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.snapshot()
+            changed = {p for p in current.keys() | self.stamps.keys() if current.get(p) != self.stamps.get(p)}
+            self.stamps = current
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            pause = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(pause)
+
+    def drain(self):
+        self.stamps = self.snapshot()
+
+def make_watcher(paths, trees, poll=False):
+    if not poll:
+        try:
+            return InotifyWatcher(paths, trees)
+        except (OSError, AttributeError) as e:
+            # AttributeError: no inotify_init1 in this libc (macOS, Windows)
+            logging.info(f"👀 inotify unavailable ({e}), polling every {POLL_INTERVAL}s instead")
+    return PollingWatcher(paths, trees)
+
+def next_batch(watcher, debounce):
+    """Block for the next change, then collect more until `debounce` seconds pass quietly."""
+    changed = set()
+    while not changed:
+        # Writes to files nobody watches (temp files, the list index) wake the watcher too
+        changed = watcher.wait()
+    first = time.perf_counter()
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            return changed, first
+        changed |= more
+
+class Session:
+    """The parsed template, renderer and manifest of the last build."""
+
+    def __init__(self, args):
+        self.args = args
+
+    def rebuild(self):
+        """Full run of the generator, then reload what the next incremental update needs."""
+        gdc.generate(self.args)
+        args = self.args
+        tpl = gdc.load_template()
+        if args.rules:
+            tpl = gdc.apply_rules_fragment(tpl, args.rules)
+        self.tpl = tpl
+        self.render = gdc.make_render(tpl, args.full_render, args.emitter)
+        renderer = getattr(self.render, "__self__", None)
+        if renderer is not None:
+            # Dump the variants' own sections now rather than on the first edit
+            for name in args.variants:
+                renderer.sections_for(gdc.VARIANTS[name])
+        self.latency = gdc.load_latency_table(args.latency) if args.latency else None
+        self.fanout = gdc.load_fanout(args.fanout)
+        if args.max_nameservers:
+            self.fanout.setdefault("default", {})["max"] = args.max_nameservers
+        self.profiles = gdc.load_mix_profiles(args.mix_profiles)
+        self.geoip = gdc.load_geoip(args.geoip)
+        self.dead = gdc.load_health(args.health) if args.health else set()
+        self.manifest = gdc.load_manifest()
+
+    def update(self):
+        """Re-render providers whose dns_list.txt lines changed.
+
+        Returns (re-rendered, removed) provider counts, or None if the change
+        affects every config and needs a full rebuild instead.
+        """
+        args = self.args
+        manifest = self.manifest
+        providers = gdc.parse_dns_list(gdc.INPUT_FILE, use_index=not args.no_index)
+        located = gdc.apply_geoip(providers, self.geoip)
+        # Trimmed before hashing, as in generate(), so the hashes match a full run's
+        if self.dead:
+            gdc.apply_health(providers, self.dead)
+        mixes = {}
+        for profile in self.profiles:
+            mix = gdc.build_mix(profile, providers, self.latency)
+            mixes[mix.name] = (profile, mix)
+        domestic = [] if args.no_split or "Split" not in args.variants else gdc.build_domestic(providers, self.latency)
+        variants = gdc.active_variants(args.variants, domestic)
+        # The split resolvers are baked into every Split config
+        if domestic != manifest.get("domestic") or list(variants) != manifest.get("variants"):
+            return None
+        artifacts, missing = gdc.split_artifacts(manifest["artifacts"])
+
+        old = manifest["providers"]
+        new = {}
+        stale = []
+        targets = list(providers.items()) + [(name, mix) for name, (_, mix) in mixes.items()]
+        for provider, entries in targets:
+            if not gdc.provider_entries(entries):
+                continue
+            entry_hash = gdc.hash_entries(entries, gdc.fanout_options(self.fanout, provider))
+            previous = old.get(provider)
+            if gdc.is_up_to_date(previous, entry_hash, artifacts):
+                new[provider] = previous
+            else:
+                new[provider] = {"hash": entry_hash}
+                stale.append((provider, entries))
+        removed = old.keys() - new.keys()
+        if not stale and not removed:
+            return 0, 0
+
+        shutil.rmtree(gdc.STAGING_DIR, ignore_errors=True)
+        for provider, entries in stale:
+            new[provider]["files"], new[provider]["digests"] = gdc.generate_provider(
+                self.render, self.tpl["dns"], provider, entries, self.latency, domestic, self.fanout, artifacts, variants)
+        files = [f for item in new.values() for f in item["files"]]
+        bases = gdc.dictator(gdc.base_name(gdc.VARIANTS[name]) for name in variants)
+        gdc.publish(files, artifacts, bases, keep=missing)
+        manifest["providers"] = new
+        gdc.save_manifest(manifest)
+        catalog = gdc.build_catalog(manifest, providers, mixes, located)
+        gdc.write_catalog(catalog)
+        gdc.generate_readme(catalog)
+        return len(stale), len(removed)
+
+def run(args):
+    if args.jobs == 1:
+        args.jobs = 0   # full rebuilds are the slow path; spread them over every CPU
+    paths, trees = watched_inputs(args)
+    session = Session(args)
+    session.rebuild()
+    watcher = make_watcher(paths, trees, args.poll)
+    logging.info(f"👀 Watching {len(paths)} inputs and {', '.join(t + '/' for t in trees)} "
+                 f"({type(watcher).__name__}, {args.debounce} ms debounce); Ctrl-C to stop")
+    try:
+        while True:
+            changed, first = next_batch(watcher, args.debounce / 1000)
+            start = time.perf_counter()
+            try:
+                result = session.update() if changed == {os.path.normpath(gdc.INPUT_FILE)} else None
+                if result is None:
+                    logging.info(f"🔁 {', '.join(sorted(changed))} changed, rebuilding everything")
+                    session.rebuild()
+                    # rule_base.py recompiles the template in place; that write is not a new edit
+                    watcher.drain()
+                    what = "full rebuild"
+                else:
+                    what = f"{result[0]} providers re-rendered, {result[1]} removed"
+            except (OSError, ValueError, KeyError, yaml.YAMLError) as e:
+                logging.error(f"❌ Rebuild failed ({e}); fix the input and save again")
+                continue
+            except SystemExit:
+                logging.error("❌ Rebuild stopped by a failed check; fix the input and save again")
+                continue
+            now = time.perf_counter()
+            logging.info(f"⚡ {what} in {(now - start) * 1000:.1f} ms "
+                         f"({(now - first) * 1000:.1f} ms after the first change, debounce included)")
+    except KeyboardInterrupt:
+        pass